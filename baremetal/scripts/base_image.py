@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""Cache what every build derives from the Ubuntu ISO alone.
+
+Entries live under ``.cache/base-images/<sha256 of the Ubuntu ISO>/``:
+
+* ``base.json``: the boot catalog as El Torito and system area reports
+  (``-report_el_torito`` / ``-report_system_area as_mkisofs``) and the
+  kernel/initrd paths read from the ISO's own ``grub.cfg``;
+* ``grub.cfg``: the single-host GRUB skeleton (``autoinstall/grub/default.cfg``
+  with the autoinstall arguments and the detected kernel/initrd paths);
+* ``base.iso``: with ``AUTOINSTALL_REFLINK=1`` on reflink-capable filesystems
+  only, a clone of the Ubuntu ISO with the skeleton already committed, so a
+  full ISO only needs ``/nocloud``.
+
+The SHA256 of the Ubuntu ISO is itself memoised in ``index.json`` by path,
+size and mtime, so an unchanged ISO is hashed once. The reports are read
+when the entry is created and never again for the same ISO; ``--report``
+prints the cached ones.
+
+The module also holds the primitives shared by every builder (errors,
+reflink cloning, the boot check of appended sessions), so that the builders
+can all import it.
+
+Appending a session to a clone of the Ubuntu ISO is opt-in
+(``AUTOINSTALL_REFLINK=1``) until it has been checked against a real 24.04
+image, whose EFI partition is appended after the ISO filesystem and listed in
+a GPT with a backup header at the end of the image. A new session written at
+the next free block can overwrite them or leave them pointing at the wrong
+place without xorriso failing, so every appended image goes through
+``boot_mismatch`` and builders fall back to the full write when it reports a
+difference.
+"""
+from __future__ import annotations
+
+import argparse
+import errno
+import fcntl
+import hashlib
+import json
+import zlib
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator, Sequence
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_TMPDIR = REPO_ROOT / ".cache" / "tmp"
+BASE_CACHE_ROOT = REPO_ROOT / ".cache" / "base-images"
+GRUB_TEMPLATE = REPO_ROOT / "baremetal" / "autoinstall" / "grub" / "default.cfg"
+AUTOINSTALL_PATCH = "autoinstall ds=nocloud;s=/cdrom/nocloud/"
+DEFAULT_KERNEL = "/casper/vmlinuz"
+DEFAULT_INITRD = "/casper/initrd"
+CACHE_FORMAT = 2
+HASH_CHUNK = 1024 * 1024
+# ioctl(dest_fd, FICLONE, src_fd) shares every extent of src (btrfs, XFS, ...).
+FICLONE = 0x40049409
+REFLINK_ENV = "AUTOINSTALL_REFLINK"
+
+SECTOR = 512
+GPT_SIGNATURE = b"EFI PART"
+# xorriso interval units ("0s-15s": 2 KiB blocks 0 to 15)
+INTERVAL_UNITS = {"": 1, "d": 512, "s": 2048, "k": 1024, "m": 1024**2, "g": 1024**3}
+# report options that legitimately change with every session
+VOLATILE_REPORT_OPTIONS = ("-V", "--modification-date", "-volume_date")
+
+_LOCAL_INTERVAL = re.compile(r"--interval:local_fs:(\d+)([dskmg]?)-(\d+)([dskmg]?):([^:']*):'[^']*'")
+_PARTITION_START = re.compile(r"(appended_partition_\d+)_start_\d+[dskmg]?_")
+_APPENDED_PARTITION = re.compile(r"^-append_partition (\d+) \S+ --interval:local_fs:(\d+)([dskmg]?)-(\d+)([dskmg]?):")
+_KERNEL_LINE = re.compile(r"^\s*linux\s+(\S+)", re.MULTILINE)
+_INITRD_LINE = re.compile(r"^\s*initrd\s+(\S+)", re.MULTILINE)
+
+
+class IsoBuildError(RuntimeError):
+    """Exception raised when the ISO build cannot proceed."""
+
+
+def require_binary(name: str) -> None:
+    if shutil.which(name) is None:
+        raise IsoBuildError(f"Missing required binary: {name}")
+
+
+@dataclass(frozen=True)
+class BaseImage:
+    """A cache entry for one Ubuntu ISO."""
+
+    sha256: str
+    directory: Path
+    kernel: str
+    initrd: str
+    el_torito: tuple[str, ...]
+    system_area: tuple[str, ...]
+
+    @property
+    def grub_cfg(self) -> Path:
+        return self.directory / "grub.cfg"
+
+    @property
+    def iso(self) -> Path | None:
+        """The pre-patched clone, or None when reflinks are unavailable."""
+
+        path = self.directory / "base.iso"
+        return path if path.is_file() else None
+
+
+def source_fingerprint(ubuntu_iso: Path) -> dict[str, object]:
+    stat = ubuntu_iso.stat()
+    return {"path": str(ubuntu_iso.resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def reflink_enabled() -> bool:
+    """Whether builders may append sessions to a clone of the Ubuntu ISO (``AUTOINSTALL_REFLINK=1``)."""
+
+    return os.environ.get(REFLINK_ENV, "0").strip().lower() in {"1", "yes", "true", "on"}
+
+
+def clone_file(source: Path, destination: Path) -> bool:
+    """Create ``destination`` as a reflink of ``source``; False when unsupported.
+
+    Nothing is copied on failure: filesystems without shared extents (ext4,
+    tmpfs, another mount point) keep the regular full write, which is smaller
+    than a copy plus an appended session.
+    """
+
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError as exc:
+        destination.unlink(missing_ok=True)
+        if exc.errno in {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL}:
+            return False
+        raise
+    return True
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_sha256(ubuntu_iso: Path) -> str:
+    """SHA256 of ``ubuntu_iso``, recomputed only when its size or mtime change."""
+
+    index_path = BASE_CACHE_ROOT / "index.json"
+    fingerprint = source_fingerprint(ubuntu_iso)
+    path = str(fingerprint.pop("path"))
+    # parallel builders wait for the first one instead of all hashing the ISO
+    with _locked(BASE_CACHE_ROOT / "index.lock"):
+        try:
+            index = json.loads(index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            index = {}
+        entry = index.get(path)
+        if isinstance(entry, dict) and {key: entry.get(key) for key in fingerprint} == fingerprint:
+            return str(entry["sha256"])
+        sha256 = _sha256(ubuntu_iso)
+        index[path] = {**fingerprint, "sha256": sha256}
+        partial = index_path.with_name(index_path.name + ".partial")
+        partial.write_text(json.dumps(index, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        os.replace(partial, index_path)
+    return sha256
+
+
+@contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    """Serialise concurrent builders preparing the same entry."""
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _xorriso(*args: str) -> str:
+    proc = subprocess.run(["xorriso", *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise IsoBuildError(f"xorriso {' '.join(args)} failed: {proc.stderr.strip()}")
+    return proc.stdout
+
+
+def _report(ubuntu_iso: Path, kind: str) -> tuple[str, ...]:
+    output = _xorriso("-indev", str(ubuntu_iso), f"-report_{kind}", "as_mkisofs")
+    return tuple(line for line in output.splitlines() if line.startswith("-"))
+
+
+def _interval_bytes(start: str, start_unit: str, end: str, end_unit: str) -> tuple[int, int]:
+    """Byte offset and length of an inclusive xorriso interval."""
+
+    first = int(start) * INTERVAL_UNITS[start_unit]
+    return first, (int(end) + 1) * INTERVAL_UNITS[end_unit] - first
+
+
+def _masked_report(lines: Sequence[str]) -> tuple[str, ...]:
+    """Report lines without what an appended session moves: addresses, image paths, dates."""
+
+    def interval(match: re.Match[str]) -> str:
+        _, length = _interval_bytes(*match.group(1, 2, 3, 4))
+        return f"--interval:local_fs:{length}b:{match.group(5)}"
+
+    masked = []
+    for line in lines:
+        if line.split(" ", 1)[0].split("=", 1)[0] in VOLATILE_REPORT_OPTIONS:
+            continue
+        masked.append(_PARTITION_START.sub(r"\1_", _LOCAL_INTERVAL.sub(interval, line)))
+    return tuple(masked)
+
+
+def _appended_partitions(path: Path, system_area: Sequence[str]) -> dict[str, str]:
+    """SHA256 of each appended partition (the EFI image of the 24.04 ISOs) of ``path``."""
+
+    digests = {}
+    for line in system_area:
+        match = _APPENDED_PARTITION.match(line)
+        if match is None:
+            continue
+        offset, length = _interval_bytes(*match.group(2, 3, 4, 5))
+        digest = hashlib.sha256()
+        with open(path, "rb") as handle:
+            handle.seek(offset)
+            while length > 0:
+                chunk = handle.read(min(HASH_CHUNK, length))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                length -= len(chunk)
+        digests[match.group(1)] = digest.hexdigest() if length == 0 else "truncated"
+    return digests
+
+
+def _gpt_header(handle: BinaryIO, lba: int) -> bytes | None:
+    handle.seek(lba * SECTOR)
+    header = handle.read(SECTOR)
+    if len(header) < 92 or header[:8] != GPT_SIGNATURE:
+        return None
+    size = int.from_bytes(header[12:16], "little")
+    if not 92 <= size <= SECTOR:
+        return None
+    unsigned = header[:16] + bytes(4) + header[20:size]
+    if zlib.crc32(unsigned) != int.from_bytes(header[16:20], "little"):
+        return None
+    return header
+
+
+def has_gpt(path: Path) -> bool:
+    with open(path, "rb") as handle:
+        handle.seek(SECTOR)
+        return handle.read(len(GPT_SIGNATURE)) == GPT_SIGNATURE
+
+
+def gpt_problem(path: Path) -> str | None:
+    """Why the GPT of ``path`` is unusable, or None when both headers and the table check out."""
+
+    with open(path, "rb") as handle:
+        sectors = os.fstat(handle.fileno()).st_size // SECTOR
+        primary = _gpt_header(handle, 1)
+        if primary is None:
+            return "primary GPT header missing or corrupt"
+        backup_lba = int.from_bytes(primary[32:40], "little")
+        if backup_lba >= sectors:
+            return "backup GPT header points past the end of the image"
+        backup = _gpt_header(handle, backup_lba)
+        if backup is None or int.from_bytes(backup[32:40], "little") != 1:
+            return "backup GPT header missing or corrupt"
+        table_lba = int.from_bytes(primary[72:80], "little")
+        count = int.from_bytes(primary[80:84], "little")
+        entry_size = int.from_bytes(primary[84:88], "little")
+        handle.seek(table_lba * SECTOR)
+        table = handle.read(count * entry_size)
+    if len(table) != count * entry_size or zlib.crc32(table) != int.from_bytes(primary[88:92], "little"):
+        return "GPT partition table corrupt"
+    for index in range(count):
+        entry = table[index * entry_size : (index + 1) * entry_size]
+        if entry[:16] != bytes(16) and int.from_bytes(entry[40:48], "little") >= backup_lba:
+            return f"GPT partition {index + 1} overlaps the backup header"
+    return None
+
+
+def boot_reports(iso: Path) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """El Torito and system area reports of ``iso``."""
+
+    return _report(iso, "el_torito"), _report(iso, "system_area")
+
+
+def boot_mismatch(
+    result: Path, source: Path, reports: tuple[Sequence[str], Sequence[str]] | None = None
+) -> str | None:
+    """Why the boot equipment of ``result`` no longer matches ``source``, or None.
+
+    ``reports`` are the El Torito and system area reports of ``source`` when
+    already known (the base image cache keeps them). The reports of both
+    images must agree once addresses, image paths and dates are masked, every
+    appended partition must hold the same bytes, and when ``source`` has a GPT
+    both headers and the partition table of ``result`` must be valid. A false
+    alarm only costs a full write.
+    """
+
+    el_torito, system_area = reports if reports is not None else boot_reports(source)
+    try:
+        result_el_torito, result_system_area = boot_reports(result)
+    except IsoBuildError as exc:
+        return str(exc)
+    if _masked_report(result_el_torito) != _masked_report(el_torito):
+        return "El Torito boot entries differ from the source ISO"
+    if _masked_report(result_system_area) != _masked_report(system_area):
+        return "system area (MBR/GPT) differs from the source ISO"
+    if _appended_partitions(result, result_system_area) != _appended_partitions(source, system_area):
+        return "appended partitions (EFI image) differ from the source ISO"
+    if has_gpt(source):
+        return gpt_problem(result)
+    return None
+
+
+def _boot_files(ubuntu_iso: Path, workdir: Path) -> tuple[str, str]:
+    """Kernel and initrd of the first menu entry of the ISO's own GRUB config."""
+
+    extracted = workdir / "source-grub.cfg"
+    try:
+        _xorriso("-osirrox", "on", "-indev", str(ubuntu_iso), "-extract", "/boot/grub/grub.cfg", str(extracted))
+        content = extracted.read_text(encoding="utf-8", errors="replace")
+    except (IsoBuildError, OSError):
+        return DEFAULT_KERNEL, DEFAULT_INITRD
+    kernel = _KERNEL_LINE.search(content)
+    initrd = _INITRD_LINE.search(content)
+    return (kernel.group(1) if kernel else DEFAULT_KERNEL, initrd.group(1) if initrd else DEFAULT_INITRD)
+
+
+def grub_skeleton(template: str, kernel: str, initrd: str) -> str:
+    """Single-host GRUB config pointing at ``kernel``/``initrd`` with autoinstall enabled."""
+
+    content = template.replace("@AUTOINSTALL_PATCH@", AUTOINSTALL_PATCH)
+    return content.replace(DEFAULT_KERNEL, kernel).replace(DEFAULT_INITRD, initrd)
+
+
+def _build_base_iso(ubuntu_iso: Path, image: BaseImage) -> None:
+    """Clone the Ubuntu ISO and commit the GRUB skeleton on top; skipped without reflinks."""
+
+    directory = image.directory
+    base_iso = directory / "base.iso"
+    partial = base_iso.with_name(base_iso.name + ".partial")
+    base_iso.unlink(missing_ok=True)
+    partial.unlink(missing_ok=True)
+    if not reflink_enabled() or not clone_file(ubuntu_iso, partial):
+        return
+    grub_cfg = str(directory / "grub.cfg")
+    try:
+        _xorriso(
+            "-dev",
+            str(partial),
+            "-map",
+            grub_cfg,
+            "/boot/grub/grub.cfg",
+            "-map",
+            grub_cfg,
+            "/boot/grub/loopback.cfg",
+            "-boot_image",
+            "any",
+            "replay",
+            "-commit",
+        )
+    except IsoBuildError as exc:
+        partial.unlink(missing_ok=True)
+        print(f"[!] Pre-patched base image not created: {exc}", file=sys.stderr)
+        return
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    problem = boot_mismatch(partial, ubuntu_iso, (image.el_torito, image.system_area))
+    if problem is not None:
+        partial.unlink(missing_ok=True)
+        print(f"[!] Pre-patched base image not created: {problem}", file=sys.stderr)
+        return
+    os.replace(partial, base_iso)
+
+
+def _load(directory: Path, template_sha: str) -> BaseImage | None:
+    try:
+        data = json.loads((directory / "base.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if data.get("format") != CACHE_FORMAT or data.get("grub_template_sha256") != template_sha:
+        return None
+    if not (directory / "grub.cfg").is_file():
+        return None
+    return BaseImage(
+        sha256=data["sha256"],
+        directory=directory,
+        kernel=data["kernel"],
+        initrd=data["initrd"],
+        el_torito=tuple(data["el_torito"]),
+        system_area=tuple(data["system_area"]),
+    )
+
+
+def prepare(ubuntu_iso: Path) -> BaseImage:
+    """Return the cache entry of ``ubuntu_iso``, creating it on first use."""
+
+    require_binary("xorriso")
+    if not GRUB_TEMPLATE.is_file():
+        raise IsoBuildError(f"Missing GRUB template: {GRUB_TEMPLATE}")
+    template = GRUB_TEMPLATE.read_text(encoding="utf-8")
+    template_sha = hashlib.sha256(template.encode("utf-8")).hexdigest()
+    sha256 = source_sha256(ubuntu_iso)
+    directory = BASE_CACHE_ROOT / sha256
+    with _locked(BASE_CACHE_ROOT / f"{sha256}.lock"):
+        cached = _load(directory, template_sha)
+        if cached is not None:
+            return cached
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp_base = Path(os.environ.get("TMPDIR", DEFAULT_TMPDIR))
+        tmp_base.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=tmp_base, prefix="base-image.") as tmp:
+            kernel, initrd = _boot_files(ubuntu_iso, Path(tmp))
+        image = BaseImage(
+            sha256=sha256,
+            directory=directory,
+            kernel=kernel,
+            initrd=initrd,
+            el_torito=_report(ubuntu_iso, "el_torito"),
+            system_area=_report(ubuntu_iso, "system_area"),
+        )
+        image.grub_cfg.write_text(grub_skeleton(template, kernel, initrd), encoding="utf-8")
+        _build_base_iso(ubuntu_iso, image)
+        metadata = asdict(image)
+        metadata.pop("directory")
+        metadata.update(format=CACHE_FORMAT, grub_template_sha256=template_sha, source=source_fingerprint(ubuntu_iso))
+        (directory / "base.json").write_text(json.dumps(metadata, indent=2) + "\n", encoding="utf-8")
+        return image
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Prepare the cached base image of an Ubuntu ISO")
+    parser.add_argument("--ubuntu-iso", required=True, help="Path to the official Ubuntu live-server ISO")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--shell", action="store_true", help="Print BASE_* shell assignments for make_full_iso.sh")
+    output.add_argument(
+        "--report",
+        action="store_true",
+        help="Also print the cached El Torito and system area reports of the Ubuntu ISO",
+    )
+    output.add_argument(
+        "--check",
+        type=Path,
+        metavar="ISO",
+        help="Exit with 1 when the boot equipment of ISO (a session appended to a clone) differs from the Ubuntu ISO",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str]) -> int:
+    args = parse_args(argv)
+    ubuntu_iso = Path(args.ubuntu_iso).expanduser().resolve()
+    if not ubuntu_iso.is_file():
+        raise SystemExit(f"Ubuntu ISO not found: {ubuntu_iso}")
+    try:
+        image = prepare(ubuntu_iso)
+    except IsoBuildError as exc:
+        print(f"[!] {exc}", file=sys.stderr)
+        return 2
+    if args.check:
+        problem = boot_mismatch(args.check, ubuntu_iso, (image.el_torito, image.system_area))
+        if problem is not None:
+            print(f"[!] {args.check.name}: {problem}", file=sys.stderr)
+            return 1
+        return 0
+    if args.shell:
+        values = {
+            "BASE_SHA256": image.sha256,
+            "BASE_GRUB": str(image.grub_cfg),
+            "BASE_ISO": str(image.iso or ""),
+        }
+        for key, value in values.items():
+            print(f"{key}={shlex.quote(value)}")
+    else:
+        print(f"{image.sha256}  {os.path.relpath(image.directory, REPO_ROOT)}")
+        print(f"kernel: {image.kernel}  initrd: {image.initrd}")
+        print(f"pre-patched clone: {'yes' if image.iso else 'no (filesystem without reflinks)'}")
+    if args.report:
+        for kind, lines in (("el_torito", image.el_torito), ("system_area", image.system_area)):
+            print(f"{kind}:")
+            for line in lines:
+                print(f"  {line}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
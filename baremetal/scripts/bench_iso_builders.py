@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""Time the ISO builders against a tiny synthetic Ubuntu-like ISO.
+
+The builders are copied into a throwaway tree (``baremetal/scripts``,
+``baremetal/autoinstall/grub`` and a link to ``scripts/``) whose
+``autoinstall/generated`` holds N synthetic hosts, so nothing under the real
+``generated/`` or ``.cache/`` is touched. The fixture ISO keeps the layout the
+builders rely on (El Torito image, ``/boot/grub/grub.cfg``,
+``/casper/vmlinuz`` and ``/casper/initrd``) at a few MiB, and the hybrid
+layout of the 24.04 images: an EFI system partition appended after the ISO
+filesystem, listed in a GPT whose backup header ends the image, and used as
+the El Torito EFI boot image.
+
+Results are written as JSON keyed by the current commit so build times can be
+compared from one commit to the next.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Sequence
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+BAREMETAL_ROOT = REPO_ROOT / "baremetal"
+SCRIPTS_ROOT = REPO_ROOT / "scripts"
+RESULTS_ROOT = REPO_ROOT / ".cache" / "bench"
+RESULTS_VERSION = 1
+DEFAULT_HOST_COUNTS = (1, 10, 100, 1000)
+DEFAULT_REPEAT = 3
+
+FIXTURE_GRUB = """set timeout=30
+loadfont unicode
+set menu_color_normal=white/black
+set menu_color_highlight=black/light-gray
+menuentry "Try or Install Ubuntu Server" {
+\tset gfxpayload=keep
+\tlinux\t/casper/vmlinuz  ---
+\tinitrd\t/casper/initrd
+}
+"""
+FIXTURE_FILES = {
+    "boot/grub/grub.cfg": FIXTURE_GRUB.encode("ascii"),
+    "boot/grub/loopback.cfg": FIXTURE_GRUB.encode("ascii"),
+    "boot/grub/i386-pc/eltorito.img": bytes(4 * 2048),
+    "casper/vmlinuz": bytes(256 * 1024),
+    "casper/initrd": bytes(1024 * 1024),
+    ".disk/info": b"Ubuntu-Server 24.04 LTS \"Noble Numbat\" - Release amd64 (bench fixture)\n",
+}
+FIXTURE_EFI_SIZE = 1024 * 1024
+USER_DATA = """#cloud-config
+autoinstall:
+  version: 1
+  locale: fr_FR.UTF-8
+  keyboard:
+    layout: fr
+  identity:
+    hostname: {host}
+    username: ops
+    password: "$6$bench$Q9b0pF9c8mZb8bC6m1y2vJ3r4u5t6s7q8p9o0n1m2l3k4j5i6h7g8f9e0d1c2b3a4"
+  ssh:
+    install-server: true
+    allow-pw: false
+    authorized-keys:
+      - ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIBenchBenchBenchBenchBenchBenchBenchBench ops@{host}
+  network:
+    version: 2
+    ethernets:
+      eno1:
+        dhcp4: true
+  storage:
+    layout:
+      name: lvm
+      match:
+        path: /dev/nvme0n1
+  packages:
+    - openssh-server
+    - qemu-guest-agent
+  late-commands:
+    - curtin in-target --target=/target -- systemctl enable ssh
+{padding}"""
+META_DATA = "instance-id: {host}\nlocal-hostname: {host}\n"
+
+
+@dataclass
+class BenchResult:
+    benchmark: str
+    hosts: int
+    status: str
+    runs: list[float] = field(default_factory=list)
+    reason: str = ""
+
+    def as_dict(self) -> dict[str, object]:
+        data = asdict(self)
+        if self.runs:
+            median = statistics.median(self.runs)
+            data.update(
+                min=min(self.runs),
+                median=median,
+                mean=statistics.fmean(self.runs),
+                per_host=median / self.hosts,
+            )
+        return data
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    name: str
+    needs_xorriso: bool
+    run: Callable[["Sandbox", int], float]
+
+
+@dataclass
+class Sandbox:
+    root: Path
+    fixture: Path
+
+    @property
+    def scripts(self) -> Path:
+        return self.root / "baremetal" / "scripts"
+
+    @property
+    def generated(self) -> Path:
+        return self.root / "baremetal" / "autoinstall" / "generated"
+
+    def hosts(self, count: int) -> list[str]:
+        return [f"bench-{index:04d}" for index in range(count)]
+
+    def env(self) -> dict[str, str]:
+        return {**os.environ, "TMPDIR": str(self.root / ".cache" / "tmp")}
+
+
+def git_revision() -> tuple[str | None, bool]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, bool(status.strip())
+
+
+def xorriso_version() -> str | None:
+    if shutil.which("xorriso") is None:
+        return None
+    completed = subprocess.run(["xorriso", "-version"], capture_output=True, text=True, check=False)
+    return completed.stdout.splitlines()[0] if completed.stdout else "unknown"
+
+
+def build_fixture(directory: Path) -> Path:
+    """Write the synthetic Ubuntu-like ISO with xorriso."""
+
+    tree = directory / "fixture"
+    for relative, content in FIXTURE_FILES.items():
+        path = tree / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    efi = directory / "efi.img"
+    efi.write_bytes(bytes(FIXTURE_EFI_SIZE))
+    iso = directory / "ubuntu-bench.iso"
+    subprocess.run(
+        [
+            "xorriso", "-as", "mkisofs", "-o", str(iso), "-V", "Ubuntu-Server bench", "-J", "-l", "-r",
+            "-partition_offset", "16", "-append_partition", "2", "0xef", str(efi), "-appended_part_as_gpt",
+            "-c", "boot.catalog", "-b", "boot/grub/i386-pc/eltorito.img",
+            "-no-emul-boot", "-boot-load-size", "4", "-boot-info-table",
+            "-eltorito-alt-boot", "-e", "--interval:appended_partition_2:all::", "-no-emul-boot", str(tree),
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return iso
+
+
+def create_sandbox(directory: Path, host_count: int, *, fixture: bool) -> Sandbox:
+    root = directory / "tree"
+    scripts = root / "baremetal" / "scripts"
+    scripts.mkdir(parents=True)
+    for path in (BAREMETAL_ROOT / "scripts").iterdir():
+        if path.suffix in {".py", ".sh"}:
+            shutil.copy2(path, scripts / path.name)
+    shutil.copytree(BAREMETAL_ROOT / "autoinstall" / "grub", root / "baremetal" / "autoinstall" / "grub")
+    (root / "scripts").symlink_to(SCRIPTS_ROOT, target_is_directory=True)
+    (root / ".cache" / "tmp").mkdir(parents=True)
+    sandbox = Sandbox(root=root, fixture=build_fixture(directory) if fixture else directory / "missing.iso")
+    padding = "".join(f"  # {'x' * 70}\n" for _ in range(24))
+    for host in sandbox.hosts(host_count):
+        host_dir = sandbox.generated / host
+        host_dir.mkdir(parents=True)
+        (host_dir / "user-data").write_text(USER_DATA.format(host=host, padding=padding), encoding="utf-8")
+        (host_dir / "meta-data").write_text(META_DATA.format(host=host), encoding="utf-8")
+    return sandbox
+
+
+def sandbox_module(sandbox: Sandbox, name: str):
+    """Import ``name`` from the sandbox copy so its REPO_ROOT points there."""
+
+    if sys.path[0] != str(sandbox.scripts):
+        sys.path.insert(0, str(sandbox.scripts))
+    module = importlib.import_module(name)
+    if Path(module.__file__).parent != sandbox.scripts:
+        raise RuntimeError(f"{name} was not imported from the benchmark tree")
+    return module
+
+
+def _timed(action: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    action()
+    return time.perf_counter() - started
+
+
+def run_render_grub_config(sandbox: Sandbox, count: int) -> float:
+    make_multi_iso = sandbox_module(sandbox, "make_multi_iso")
+    hosts = sandbox.hosts(count)
+    with tempfile.TemporaryDirectory(dir=sandbox.root / ".cache" / "tmp") as tmp:
+        return _timed(lambda: make_multi_iso.render_grub_config(hosts, 10, hosts[-1], Path(tmp)))
+
+
+def run_build_iso(sandbox: Sandbox, count: int) -> float:
+    make_multi_iso = sandbox_module(sandbox, "make_multi_iso")
+    hosts = sandbox.hosts(count)
+    name = f"bench-{count}"
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed = _timed(
+            lambda: make_multi_iso.build_iso(
+                ubuntu_iso=sandbox.fixture, name=name, hosts=hosts, timeout=10, default_host=None
+            )
+        )
+    shutil.rmtree(make_multi_iso.MULTI_ROOT / name)
+    return elapsed
+
+
+def _run_script(sandbox: Sandbox, script: str, count: int, *args: str) -> float:
+    """Run ``script`` once per host, the way ``make baremetal/...`` would."""
+
+    elapsed = 0.0
+    env = sandbox.env()
+    for host in sandbox.hosts(count):
+        command = ["bash", str(sandbox.scripts / script), host, *args]
+        elapsed += _timed(
+            lambda: subprocess.run(
+                command, cwd=sandbox.root, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+        )
+        for path in (sandbox.generated / host).iterdir():
+            if path.name not in {"user-data", "meta-data"}:
+                path.unlink()
+    return elapsed
+
+
+def run_make_full_iso(sandbox: Sandbox, count: int) -> float:
+    return _run_script(sandbox, "make_full_iso.sh", count, str(sandbox.fixture))
+
+
+def run_build_full_isos(sandbox: Sandbox, count: int) -> float:
+    make_full_isos = sandbox_module(sandbox, "make_full_isos")
+    hosts = sandbox.hosts(count)
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed = _timed(lambda: make_full_isos.build_full_isos(ubuntu_iso=sandbox.fixture, hosts=hosts))
+    for host in hosts:
+        for path in (sandbox.generated / host).iterdir():
+            if path.name not in {"user-data", "meta-data"}:
+                path.unlink()
+    return elapsed
+
+
+def run_make_seed_iso(sandbox: Sandbox, count: int) -> float:
+    return _run_script(sandbox, "make_seed_iso.sh", count)
+
+
+def run_write_seed_isos(sandbox: Sandbox, count: int) -> float:
+    sandbox_module(sandbox, "make_multi_iso")  # puts scripts/ on sys.path
+    iso9660 = importlib.import_module("lib.iso9660")
+    hosts = sandbox.hosts(count)
+
+    def build() -> None:
+        images = [
+            iso9660.SeedImage(
+                sandbox.generated / host / f"seed-{host}.iso",
+                iso9660.seed_files(sandbox.generated / host),
+            )
+            for host in hosts
+        ]
+        iso9660.write_seed_isos(images)
+
+    elapsed = _timed(build)
+    for host in hosts:
+        for path in (sandbox.generated / host).iterdir():
+            if path.name not in {"user-data", "meta-data"}:
+                path.unlink()
+    return elapsed
+
+
+BENCHMARKS = (
+    Benchmark("make_multi_iso.render_grub_config", False, run_render_grub_config),
+    Benchmark("make_multi_iso.build_iso", True, run_build_iso),
+    Benchmark("make_full_iso.sh", True, run_make_full_iso),
+    Benchmark("make_full_isos.build_full_isos", True, run_build_full_isos),
+    Benchmark("make_seed_iso.sh", True, run_make_seed_iso),
+    Benchmark("iso9660.write_seed_isos", False, run_write_seed_isos),
+)
+
+
+def warm_up(sandbox: Sandbox) -> None:
+    """Populate the base image cache so no timed run pays for it."""
+
+    base_image = sandbox_module(sandbox, "base_image")
+    with contextlib.redirect_stdout(io.StringIO()):
+        base_image.prepare(sandbox.fixture)
+
+
+def run_benchmarks(
+    selected: Sequence[Benchmark],
+    host_counts: Sequence[int],
+    repeat: int,
+    *,
+    has_xorriso: bool,
+    report: Callable[[str], None] = print,
+) -> list[BenchResult]:
+    results: list[BenchResult] = []
+    with tempfile.TemporaryDirectory(prefix="iso-bench-") as tmp:
+        sandbox = create_sandbox(Path(tmp), max(host_counts), fixture=has_xorriso)
+        if has_xorriso:
+            warm_up(sandbox)
+        for benchmark in selected:
+            for count in host_counts:
+                if benchmark.needs_xorriso and not has_xorriso:
+                    result = BenchResult(benchmark.name, count, "skipped", reason="xorriso not found")
+                else:
+                    result = BenchResult(benchmark.name, count, "ok")
+                    try:
+                        for _ in range(repeat):
+                            result.runs.append(benchmark.run(sandbox, count))
+                    except (subprocess.CalledProcessError, OSError, RuntimeError) as exc:
+                        stderr = getattr(exc, "stderr", None)
+                        detail = stderr.decode(errors="replace").strip().splitlines()[-1:] if stderr else []
+                        result.status, result.reason = "failed", " ".join([str(exc), *detail])
+                results.append(result)
+                report(format_result(result))
+    return results
+
+
+def format_result(result: BenchResult) -> str:
+    label = f"{result.benchmark:<36} {result.hosts:>5} hosts"
+    if result.status != "ok":
+        return f"{label}  {result.status}: {result.reason}"
+    data = result.as_dict()
+    return f"{label}  median {data['median']:9.4f}s  min {data['min']:9.4f}s  {data['per_host'] * 1000:9.3f} ms/host"
+
+
+def parse_counts(value: str) -> list[int]:
+    try:
+        counts = sorted({int(item) for item in value.split(",") if item.strip()})
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid host counts: {value!r}") from None
+    if not counts or counts[0] < 1:
+        raise argparse.ArgumentTypeError("host counts must be positive integers")
+    return counts
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the ISO builders on a synthetic Ubuntu ISO")
+    parser.add_argument(
+        "--hosts",
+        type=parse_counts,
+        default=list(DEFAULT_HOST_COUNTS),
+        help="Comma separated host counts (default: 1,10,100,1000)",
+    )
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per measurement (median is reported)")
+    parser.add_argument(
+        "--benchmark",
+        dest="benchmarks",
+        action="append",
+        choices=[benchmark.name for benchmark in BENCHMARKS],
+        help="Only run this benchmark (repeatable)",
+    )
+    parser.add_argument("--output", type=Path, help="Results file (default: .cache/bench/iso-builders-<commit>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str]) -> int:
+    args = parse_args(argv)
+    if args.repeat < 1:
+        raise SystemExit("--repeat must be at least 1")
+    selected = [item for item in BENCHMARKS if not args.benchmarks or item.name in args.benchmarks]
+    commit, dirty = git_revision()
+    version = xorriso_version()
+    results = run_benchmarks(selected, args.hosts, args.repeat, has_xorriso=version is not None)
+
+    document = {
+        "version": RESULTS_VERSION,
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.now(timezone.utc).replace(microsecond=0).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "xorriso": version,
+        "repeat": args.repeat,
+        "results": [result.as_dict() for result in results],
+    }
+    output = args.output or RESULTS_ROOT / f"iso-builders-{(commit or 'unknown')[:12]}{'-dirty' if dirty else ''}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(document, indent=2) + "\n", encoding="utf-8")
+    print(f"Results written to {os.path.relpath(output, REPO_ROOT)}")
+    return 1 if any(result.status == "failed" for result in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
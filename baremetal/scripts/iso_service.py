@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""Local ISO build service shared by operators and CI jobs.
+
+``serve`` listens on a unix socket (default ``.cache/iso-service.sock``) or on
+``127.0.0.1:PORT`` and speaks a small JSON-over-HTTP API:
+
+* ``POST /jobs`` with ``{"kind": "multi"|"full"|"seed", "hosts": [...], ...}``
+  (``Content-Type: application/json`` only) returns the job; identical
+  requests (same input digest) share one job. Host and ISO names must be
+  inventory-safe (``[A-Za-z0-9._-]+``) and hosts must exist in the inventory.
+  Multi-host requests may set ``"incremental": true`` to patch the previous ISO;
+* ``GET /jobs`` and ``GET /jobs/<id>`` report status and artefacts;
+* ``GET /jobs/<id>/files/<name>`` streams a finished artefact.
+
+The job id is a digest of the request, the NoCloud files of every host, the
+Ubuntu ISO SHA256, the GRUB template and the service's ``SOURCE_DATE_EPOCH``
+and ``AUTOINSTALL_REFLINK`` settings, so a finished job is served from cache as
+long as its outputs are unchanged on disk. Multi-host and full ISOs
+go through a single writer queue (``--writers``); seeds, written in memory,
+use their own queue. Jobs writing the same artefact never overlap. ``submit`` is the matching client.
+
+Over TCP, requests whose ``Host`` header is not ``127.0.0.1:PORT`` or
+``localhost:PORT`` are refused, so a web page cannot reach the service through
+DNS rebinding. The unix socket is created with mode 0660.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import queue
+import re
+import socket
+import socketserver
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Sequence
+from urllib.parse import unquote
+
+import base_image
+import make_full_isos
+import make_multi_iso
+from base_image import IsoBuildError
+from make_multi_iso import GENERATED_ROOT, REPO_ROOT, ensure_generated_host
+
+SCRIPTS_ROOT = REPO_ROOT / "scripts"
+if str(SCRIPTS_ROOT) not in sys.path:
+    sys.path.append(str(SCRIPTS_ROOT))
+
+from lib import checksums, inventory, iso9660
+
+SERVICE_ROOT = REPO_ROOT / ".cache" / "iso-service"
+DEFAULT_SOCKET = REPO_ROOT / ".cache" / "iso-service.sock"
+KINDS = ("multi", "full", "seed")
+HEAVY_KINDS = {"multi", "full"}
+POLL_INTERVAL = 1.0
+# host and ISO names end up in paths under generated/
+NAME_PATTERN = re.compile(r"[A-Za-z0-9._-]+")
+
+
+@dataclass
+class Job:
+    """One build request and its outcome."""
+
+    id: str
+    kind: str
+    hosts: list[str]
+    ubuntu_iso: str | None = None
+    name: str | None = None
+    timeout: int = 10
+    default_host: str | None = None
+    incremental: bool = False
+    status: str = "queued"
+    submitted_at: str = ""
+    finished_at: str | None = None
+    duration: float | None = None
+    error: str | None = None
+    outputs: list[dict[str, Any]] = field(default_factory=list)
+
+    def outputs_current(self) -> bool:
+        """True when every recorded artefact is still on disk, untouched."""
+
+        for output in self.outputs:
+            try:
+                stat = Path(output["path"]).stat()
+            except OSError:
+                return False
+            if stat.st_size != output["size"] or stat.st_mtime_ns != output["mtime_ns"]:
+                return False
+        return bool(self.outputs)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+
+def _file_sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _checked_name(value: Any, what: str) -> str:
+    if not isinstance(value, str) or not NAME_PATTERN.fullmatch(value) or value in {".", ".."}:
+        raise ValueError(f"{what} must match [A-Za-z0-9._-]+, got {value!r}")
+    return value
+
+
+def parse_request(data: dict[str, Any]) -> Job:
+    """Validate a submitted request and return its (not yet identified) job."""
+
+    kind = data.get("kind")
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+    hosts = data.get("hosts")
+    if not isinstance(hosts, list) or not hosts:
+        raise ValueError("hosts must be a non-empty list of host names")
+    for host in hosts:
+        _checked_name(host, "host")
+        if inventory.find_host_vars_file(host) is None:
+            raise ValueError(f"unknown host {host!r}: no host_vars in the inventory")
+    if len(set(hosts)) != len(hosts):
+        raise ValueError("each host can only be listed once")
+    job = Job(id="", kind=kind, hosts=hosts)
+    if kind in HEAVY_KINDS:
+        if not data.get("ubuntu_iso"):
+            raise ValueError("ubuntu_iso is required")
+        ubuntu_iso = Path(str(data["ubuntu_iso"])).expanduser().resolve()
+        if not ubuntu_iso.is_file():
+            raise ValueError(f"Ubuntu ISO not found: {ubuntu_iso}")
+        job.ubuntu_iso = str(ubuntu_iso)
+    if kind == "multi":
+        if not data.get("name"):
+            raise ValueError("name is required for multi-host ISOs")
+        job.name = _checked_name(data["name"], "name")
+        try:
+            job.timeout = int(data.get("timeout", 10))
+        except (TypeError, ValueError) as exc:
+            raise ValueError("timeout must be a number of seconds") from exc
+        if job.timeout < 0:
+            raise ValueError("timeout must be positive")
+        default_host = data.get("default_host") or None
+        if default_host is not None and default_host not in hosts:
+            raise ValueError("default_host must be one of the requested hosts")
+        job.default_host = default_host
+        incremental = data.get("incremental", False)
+        if not isinstance(incremental, bool):
+            raise ValueError("incremental must be true or false")
+        job.incremental = incremental
+    return job
+
+
+def input_digest(job: Job) -> str:
+    """Digest of everything the artefacts of ``job`` are built from."""
+
+    inputs: dict[str, Any] = {
+        "kind": job.kind,
+        "hosts": job.hosts,
+        "name": job.name,
+        "timeout": job.timeout,
+        "default_host": job.default_host,
+        "incremental": job.incremental,
+        # the builders read both from the service's environment
+        "source_date_epoch": make_multi_iso.source_date_epoch(),
+        "files": {},
+    }
+    for host in job.hosts:
+        host_dir = ensure_generated_host(host)
+        inputs["files"][host] = {name: _file_sha256(host_dir / name) for name in ("user-data", "meta-data")}
+    if job.ubuntu_iso:
+        inputs["ubuntu_sha256"] = base_image.source_sha256(Path(job.ubuntu_iso))
+        inputs["grub_template_sha256"] = _file_sha256(base_image.GRUB_TEMPLATE)
+        inputs["reflink"] = base_image.reflink_enabled()
+    encoded = json.dumps(inputs, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def _describe(path: Path) -> dict[str, Any]:
+    stat = path.stat()
+    index = path.with_name(checksums.INDEX_NAME)
+    try:
+        sums = json.loads(index.read_text(encoding="utf-8")).get(path.name, {})
+    except (OSError, ValueError):
+        sums = {}
+    return {"name": path.name, "path": str(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, **sums}
+
+
+def target_keys(job: Job) -> list[str]:
+    """Artefacts ``job`` writes; jobs sharing one never run at the same time."""
+
+    if job.kind == "multi":
+        return [f"multi:{job.name}"]
+    return sorted(f"{job.kind}:{host}" for host in job.hosts)
+
+
+def run_build(job: Job) -> list[Path]:
+    """Build the artefacts of ``job`` with the regular builders."""
+
+    if job.kind == "multi":
+        output = make_multi_iso.build_iso(
+            ubuntu_iso=Path(job.ubuntu_iso or ""),
+            name=job.name or "",
+            hosts=job.hosts,
+            timeout=job.timeout,
+            default_host=job.default_host,
+            incremental=job.incremental,
+        )
+        return [output]
+    if job.kind == "full":
+        make_full_isos.build_full_isos(ubuntu_iso=Path(job.ubuntu_iso or ""), hosts=job.hosts)
+        return [make_full_isos.full_iso_path(host) for host in job.hosts]
+    images = [
+        iso9660.SeedImage(
+            output=GENERATED_ROOT / host / f"seed-{host}.iso",
+            files=iso9660.seed_files(GENERATED_ROOT / host),
+        )
+        for host in job.hosts
+    ]
+    return [path for path, _ in iso9660.write_seed_isos(images)]
+
+
+class BuildService:
+    """Job registry, persisted in ``.cache/iso-service/jobs.json``, and its workers."""
+
+    def __init__(self, root: Path = SERVICE_ROOT, writers: int = 1) -> None:
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._jobs: dict[str, Job] = {}
+        self._targets: dict[str, threading.Lock] = {}
+        self._queues = {"heavy": queue.Queue(), "light": queue.Queue()}
+        self._load()
+        for _ in range(max(1, writers)):
+            threading.Thread(target=self._work, args=("heavy",), daemon=True).start()
+        threading.Thread(target=self._work, args=("light",), daemon=True).start()
+
+    @property
+    def _state_file(self) -> Path:
+        return self.root / "jobs.json"
+
+    def _load(self) -> None:
+        try:
+            entries = json.loads(self._state_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if not isinstance(entries, list):
+            return
+        known = {item.name for item in fields(Job)}
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                job = Job(**{key: value for key, value in entry.items() if key in known})
+            except TypeError:
+                # written by another version and missing a required key
+                continue
+            if job.status in {"queued", "running"}:
+                job.status, job.error = "failed", "interrupted by a service restart"
+            self._jobs[job.id] = job
+
+    def _save(self) -> None:
+        partial = self._state_file.with_name(self._state_file.name + ".partial")
+        partial.write_text(json.dumps([asdict(job) for job in self._jobs.values()], indent=2) + "\n", encoding="utf-8")
+        os.replace(partial, self._state_file)
+
+    def submit(self, data: dict[str, Any]) -> tuple[Job, bool]:
+        """Return the job for ``data`` and whether it was newly queued."""
+
+        job = parse_request(data)
+        job.id = input_digest(job)
+        with self._lock:
+            existing = self._jobs.get(job.id)
+            if existing is not None and existing.status in {"queued", "running"}:
+                return existing, False
+            if existing is not None and existing.status == "done" and existing.outputs_current():
+                return existing, False
+            job.submitted_at = _now()
+            self._jobs[job.id] = job
+            self._save()
+        self._queues["heavy" if job.kind in HEAVY_KINDS else "light"].put(job.id)
+        return job, True
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> list[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _work(self, lane: str) -> None:
+        while True:
+            job_id = self._queues[lane].get()
+            with self._lock:
+                job = self._jobs[job_id]
+                job.status = "running"
+                self._save()
+                locks = [self._targets.setdefault(key, threading.Lock()) for key in target_keys(job)]
+            started = time.perf_counter()
+            print(f"[{job.id}] {job.kind} {', '.join(job.hosts)}: started", flush=True)
+            for lock in locks:
+                lock.acquire()
+            try:
+                outputs = [_describe(path) for path in run_build(job)]
+            except Exception as exc:  # a failing build must not stop the worker
+                status, error, outputs = "failed", f"{type(exc).__name__}: {exc}", []
+            else:
+                status, error = "done", None
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+            with self._lock:
+                job.status, job.error, job.outputs = status, error, outputs
+                job.duration = round(time.perf_counter() - started, 3)
+                job.finished_at = _now()
+                self._save()
+            print(f"[{job.id}] {status} in {job.duration:.1f}s{f': {error}' if error else ''}", flush=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "autoinstall-iso-service/1"
+    service: BuildService
+    # Host headers accepted over TCP; None on the unix socket
+    allowed_hosts: frozenset[str] | None = None
+
+    def address_string(self) -> str:
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def _send_json(self, status: HTTPStatus, payload: Any) -> None:
+        body = (json.dumps(payload, indent=2) + "\n").encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _host_allowed(self) -> bool:
+        """Refuse requests sent to another host name (DNS rebinding)."""
+
+        if self.allowed_hosts is None or (self.headers.get("Host") or "").lower() in self.allowed_hosts:
+            return True
+        self._send_json(HTTPStatus.FORBIDDEN, {"error": "unexpected Host header"})
+        return False
+
+    def do_POST(self) -> None:
+        if not self._host_allowed():
+            return
+        if self.path.rstrip("/") != "/jobs":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "unknown endpoint"})
+            return
+        # browsers can send text/plain or form POSTs to 127.0.0.1 without a CORS preflight
+        if self.headers.get_content_type() != "application/json":
+            self._send_json(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, {"error": "Content-Type must be application/json"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            data = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(data, dict):
+                raise ValueError("request body must be a JSON object")
+            job, created = self.service.submit(data)
+        except (ValueError, TypeError, IsoBuildError) as exc:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(exc)})
+            return
+        self._send_json(HTTPStatus.ACCEPTED if created else HTTPStatus.OK, asdict(job))
+
+    def do_GET(self) -> None:
+        if not self._host_allowed():
+            return
+        parts = [unquote(part) for part in self.path.strip("/").split("/") if part]
+        if parts == ["jobs"]:
+            self._send_json(HTTPStatus.OK, [asdict(job) for job in self.service.jobs()])
+            return
+        job = self.service.get(parts[1]) if len(parts) >= 2 and parts[0] == "jobs" else None
+        if job is None:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "unknown job"})
+        elif len(parts) == 2:
+            self._send_json(HTTPStatus.OK, asdict(job))
+        elif len(parts) == 4 and parts[2] == "files":
+            self._send_file(job, parts[3])
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "unknown endpoint"})
+
+    def _send_file(self, job: Job, name: str) -> None:
+        output = next((item for item in job.outputs if item["name"] == name), None)
+        if job.status != "done" or output is None or not job.outputs_current():
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "artefact not available"})
+            return
+        with open(output["path"], "rb") as handle:
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(output["size"]))
+            if output.get("sha256"):
+                self.send_header("X-Checksum-Sha256", output["sha256"])
+            self.end_headers()
+            self.wfile.flush()
+            try:
+                self.connection.sendfile(handle)
+            except (AttributeError, OSError):
+                handle.seek(0)
+                self.wfile.write(handle.read())
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(args: argparse.Namespace) -> int:
+    if args.port:
+        server: socketserver.BaseServer = ThreadingHTTPServer(("127.0.0.1", args.port), ServiceHandler)
+        ServiceHandler.allowed_hosts = frozenset({f"127.0.0.1:{args.port}", f"localhost:{args.port}"})
+        where = f"http://127.0.0.1:{args.port}"
+    else:
+        path = Path(args.socket)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.unlink(missing_ok=True)
+        # the socket gets mode 0660 from bind(): no window where others can connect
+        umask = os.umask(0o117)
+        try:
+            server = UnixHTTPServer(str(path), ServiceHandler)
+        finally:
+            os.umask(umask)
+        where = str(path)
+    ServiceHandler.service = BuildService(writers=args.writers)
+    print(f"ISO build service listening on {where}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if not args.port:
+            Path(args.socket).unlink(missing_ok=True)
+    return 0
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str) -> None:
+        super().__init__("localhost")
+        self._path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self._path)
+
+
+def _request(args: argparse.Namespace, method: str, path: str, body: Any = None) -> tuple[int, Any]:
+    connection = (
+        http.client.HTTPConnection("127.0.0.1", args.port) if args.port else UnixHTTPConnection(str(args.socket))
+    )
+    payload = json.dumps(body).encode("utf-8") if body is not None else None
+    headers = {"Content-Type": "application/json"} if payload is not None else {}
+    try:
+        connection.request(method, path, body=payload, headers=headers)
+    except OSError as exc:
+        raise SystemExit(f"[!] ISO build service unreachable ({args.port or args.socket}): {exc}") from exc
+    response = connection.getresponse()
+    data = json.loads(response.read() or b"null")
+    connection.close()
+    return response.status, data
+
+
+def submit(args: argparse.Namespace) -> int:
+    request = {"kind": args.kind, "hosts": args.hosts}
+    if args.ubuntu_iso:
+        request["ubuntu_iso"] = str(Path(args.ubuntu_iso).expanduser().resolve())
+    if args.kind == "multi":
+        request.update(
+            name=args.name, timeout=args.timeout, default_host=args.default_host, incremental=args.incremental
+        )
+    status, job = _request(args, "POST", "/jobs", request)
+    if status >= 400:
+        print(f"[!] {job.get('error', status)}", file=sys.stderr)
+        return 2
+    state = "queued" if status == HTTPStatus.ACCEPTED else f"{job['status']} (shared)"
+    print(f"Job {job['id']}: {state}")
+    while args.wait and job["status"] in {"queued", "running"}:
+        time.sleep(POLL_INTERVAL)
+        _, job = _request(args, "GET", f"/jobs/{job['id']}")
+    if job["status"] == "failed":
+        print(f"[!] Job {job['id']} failed: {job['error']}", file=sys.stderr)
+        return 1
+    for output in job["outputs"]:
+        print(f"{os.path.relpath(output['path'], REPO_ROOT)}  {output.get('sha256', '')}")
+    return 0
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local ISO build service with deduplicated jobs")
+    parser.add_argument("--socket", default=str(DEFAULT_SOCKET), help="Unix socket path (default: .cache/iso-service.sock)")
+    parser.add_argument("--port", type=int, help="Use HTTP on 127.0.0.1:PORT instead of the unix socket")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Run the service")
+    serve_parser.add_argument("--writers", type=int, default=1, help="Concurrent multi/full ISO writers (default: 1)")
+    serve_parser.set_defaults(func=serve)
+
+    submit_parser = subparsers.add_parser("submit", help="Submit a build to a running service")
+    submit_parser.add_argument("--kind", choices=KINDS, required=True, help="Artefact to build")
+    submit_parser.add_argument("--host", dest="hosts", action="append", required=True, help="Host (repeatable)")
+    submit_parser.add_argument("--ubuntu-iso", help="Official Ubuntu ISO (multi and full)")
+    submit_parser.add_argument("--name", help="Multi-host ISO name")
+    submit_parser.add_argument("--timeout", type=int, default=10, help="GRUB menu timeout in seconds")
+    submit_parser.add_argument("--default-host", help="Host selected by default in the GRUB menu")
+    submit_parser.add_argument(
+        "--incremental", action="store_true", help="Patch the previous multi-host ISO when only /nocloud or GRUB configs changed"
+    )
+    submit_parser.add_argument("--wait", action="store_true", help="Wait for the job to finish")
+    submit_parser.set_defaults(func=submit)
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str]) -> int:
+    args = parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -25,7 +25,7 @@ SCRIPTS_ROOT = REPO_ROOT / "scripts"
 if str(SCRIPTS_ROOT) not in sys.path:
     sys.path.append(str(SCRIPTS_ROOT))
 
-from lib import inventory
+from lib import inventory, model, sops
 
 OVERLAY_ROOT = inventory.get_overlay_root()
 HOST_VARS_DIR = OVERLAY_ROOT / "host_vars"
@@ -170,24 +170,14 @@ def warn_missing_binaries(binaries: Sequence[str]) -> None:
 def list_hosts() -> List[str]:
     """Return the list of host directories declared in the inventory."""
 
-    discovered: Dict[str, Path] = {}
-    for root in inventory.iter_inventory_roots():
-        host_root = root / "host_vars"
-        if not host_root.exists():
-            continue
-        for entry in host_root.iterdir():
-            if not entry.is_dir() or entry.name.startswith("."):
-                continue
-            if not any((entry / candidate).is_file() for candidate in ("main.yml", "main.yaml")):
-                continue
-            discovered.setdefault(entry.name, entry)
+    discovered = [host.name for host in model.hosts()]
     if not discovered:
         print(
             "Inventaire introuvable : aucun répertoire host_vars détecté dans l'overlay ou le dépôt.",
             file=sys.stderr,
         )
         sys.exit(1)
-    return sorted(discovered)
+    return discovered
 
 
 def list_host_files(host_dir: Path) -> List[Path]:
@@ -208,18 +198,7 @@ def list_host_files(host_dir: Path) -> List[Path]:
 def list_hardware_profiles() -> List[str]:
     """Return available hardware profiles defined in the inventory."""
 
-    files: Dict[str, Path] = {}
-    for root in inventory.hardware_profiles_roots():
-        if not root.exists():
-            continue
-        for entry in root.iterdir():
-            if (
-                entry.is_file()
-                and entry.suffix.lower() in {".yml", ".yaml"}
-                and not entry.name.startswith(".")
-            ):
-                files.setdefault(entry.stem, entry)
-    return sorted(files)
+    return [profile.name for profile in model.profiles()]
 
 
 def prompt_choice(
@@ -1102,27 +1081,28 @@ def main() -> None:
     warn_missing_binaries(RECOMMENDED_BINARIES)
 
     sops_env = prepare_sops_environment(os.environ.copy())
-    while True:
-        choice = prompt_main_action()
-        if choice == 0:
-            handle_repository_update()
-        elif choice == 1:
-            handle_environment_update(sops_env)
-        elif choice == 2:
-            sops_env = handle_age_key_management(sops_env)
-        elif choice == 3:
-            handle_host_initialization(sops_env)
-        elif choice == 4:
-            handle_host_customization(sops_env)
-        elif choice == 5:
-            handle_iso_generation(sops_env)
-        elif choice == 6:
-            handle_playbook_management(sops_env)
-        elif choice == 7:
-            handle_clean(sops_env)
-        else:
-            print("Au revoir !")
-            break
+    with sops.cache_session():
+        while True:
+            choice = prompt_main_action()
+            if choice == 0:
+                handle_repository_update()
+            elif choice == 1:
+                handle_environment_update(sops_env)
+            elif choice == 2:
+                sops_env = handle_age_key_management(sops_env)
+            elif choice == 3:
+                handle_host_initialization(sops_env)
+            elif choice == 4:
+                handle_host_customization(sops_env)
+            elif choice == 5:
+                handle_iso_generation(sops_env)
+            elif choice == 6:
+                handle_playbook_management(sops_env)
+            elif choice == 7:
+                handle_clean(sops_env)
+            else:
+                print("Au revoir !")
+                break
 
 
 if __name__ == "__main__":
@@ -10,16 +10,67 @@ OUTDIR="${BARE}/autoinstall/generated/${HOST}"
 [ -f "$ISO_IN" ] || { echo "Missing ISO: $ISO_IN" >&2; exit 1; }
 ISO_OUT="${OUTDIR}/ubuntu-autoinstall-${HOST}.iso"
 PATCH="autoinstall ds=nocloud;s=/cdrom/nocloud/"
-WORK="$(mktemp -d -p "$TMPDIR" autoinstall.XXXXXX)"; trap 'rm -rf "$WORK"' EXIT
+WORK="$(mktemp -d -p "$TMPDIR" autoinstall.XXXXXX)"; trap 'rm -rf "$WORK" "${ISO_OUT}.partial"' EXIT
 mkdir -p "$WORK/nocloud"
 cp "${OUTDIR}/user-data" "${OUTDIR}/meta-data" "$WORK/nocloud/"
 GRUB_TEMPLATE="${BARE}/autoinstall/grub/default.cfg"
 [ -f "$GRUB_TEMPLATE" ] || { echo "Missing GRUB template: $GRUB_TEMPLATE" >&2; exit 1; }
+# Cached base image of this Ubuntu ISO (patched GRUB skeleton, pre-patched clone).
+BASE_GRUB=""; BASE_ISO=""
+if BASE_ENV="$(python3 "${SCRIPT_DIR}/base_image.py" --ubuntu-iso "$ISO_IN" --shell)"; then eval "$BASE_ENV"; fi
 declare -a MAP
-GRUB="$WORK/grub.cfg"; sed "s|@AUTOINSTALL_PATCH@|${PATCH}|g" "$GRUB_TEMPLATE" > "$GRUB"; MAP+=("-map" "$GRUB" /boot/grub/grub.cfg)
-LOOP="$WORK/loopback.cfg"; sed "s|@AUTOINSTALL_PATCH@|${PATCH}|g" "$GRUB_TEMPLATE" > "$LOOP"; MAP+=("-map" "$LOOP" /boot/grub/loopback.cfg)
-MAP+=("-map" "$WORK/nocloud" /nocloud)
+GRUB="$WORK/grub.cfg"; LOOP="$WORK/loopback.cfg"
+if [ -n "$BASE_GRUB" ]; then
+  cp "$BASE_GRUB" "$GRUB"; cp "$BASE_GRUB" "$LOOP"
+else
+  sed "s|@AUTOINSTALL_PATCH@|${PATCH}|g" "$GRUB_TEMPLATE" > "$GRUB"
+  sed "s|@AUTOINSTALL_PATCH@|${PATCH}|g" "$GRUB_TEMPLATE" > "$LOOP"
+fi
+MAP+=("-map" "$GRUB" /boot/grub/grub.cfg "-map" "$LOOP" /boot/grub/loopback.cfg)
+NOCLOUD=("-map" "$WORK/nocloud" /nocloud)
+# Reproducible mode: fixed modes/mtimes for the staged files, fixed ISO dates,
+# UUID and GPT GUID, root ownership, and always a full write (see scripts/lib/reproducible.py).
+declare -a REPRO=()
+EPOCH="${SOURCE_DATE_EPOCH:-}"
+if [ -n "$EPOCH" ]; then
+  [[ "$EPOCH" =~ ^[0-9]+$ ]] || { echo "SOURCE_DATE_EPOCH must be a number of seconds since 1970" >&2; exit 1; }
+  find "$WORK" -type f -exec chmod 0644 {} +; find "$WORK" -type d -exec chmod 0755 {} +
+  find "$WORK" -depth -exec touch -h -d "@${EPOCH}" {} +
+  INJECTED=(/boot/grub/grub.cfg /boot/grub/loopback.cfg /nocloud)
+  REPRO=(-volume_date uuid "$(date -u -d "@${EPOCH}" +%Y%m%d%H%M%S00)"
+    -volume_date c "=${EPOCH}" -volume_date m "=${EPOCH}" -volume_date all_file_dates set_to_mtime
+    -iso_nowtime "=${EPOCH}" -chown_r 0 "${INJECTED[@]}" -- -chgrp_r 0 "${INJECTED[@]}" --
+    -boot_image any gpt_disk_guid=volume_date_uuid)
+fi
 rm -f "$ISO_OUT"
-xorriso -indev "$ISO_IN" -outdev "$ISO_OUT" "${MAP[@]}" -boot_image any replay >/dev/null
+# With AUTOINSTALL_REFLINK=1 on reflink-capable filesystems (btrfs, XFS), clone
+# the pre-patched base (or the Ubuntu ISO) and only append the host files as a
+# new session; otherwise write the full image.
+PARTIAL="${ISO_OUT}.partial"; rm -f "$PARTIAL"
+# xorriso diagnostics go to stderr (the build log). The appended image must keep
+# the El Torito entries, EFI partition and GPT of the Ubuntu ISO; a failed
+# append or boot check is reported before falling back.
+append() {
+  if xorriso -dev "$PARTIAL" "$@" -boot_image any replay -commit >/dev/null \
+    && python3 "${SCRIPT_DIR}/base_image.py" --ubuntu-iso "$ISO_IN" --check "$PARTIAL"; then
+    return
+  fi
+  echo "[!] Appending to the reflinked ISO failed, falling back" >&2; return 1
+}
+reflink() {
+  [ -z "$EPOCH" ] || return 1
+  case "${AUTOINSTALL_REFLINK:-0}" in 1|yes|true|on) ;; *) return 1 ;; esac
+  cp --reflink=always "$1" "$PARTIAL" 2>/dev/null
+}
+if [ -n "$BASE_ISO" ] && reflink "$BASE_ISO" && append "${NOCLOUD[@]}"; then
+  mv "$PARTIAL" "$ISO_OUT"
+elif rm -f "$PARTIAL" && reflink "$ISO_IN" && append "${MAP[@]}" "${NOCLOUD[@]}"; then
+  mv "$PARTIAL" "$ISO_OUT"
+else
+  rm -f "$PARTIAL"
+  xorriso -indev "$ISO_IN" -outdev "$PARTIAL" "${MAP[@]}" "${NOCLOUD[@]}" -boot_image any replay "${REPRO[@]}" >/dev/null
+  mv "$PARTIAL" "$ISO_OUT"
+fi
 REL="$(realpath --relative-to="${BARE}" "${ISO_OUT}" 2>/dev/null || echo "${ISO_OUT}")"
 echo "Created ${REL}"
+python3 "${BARE}/../scripts/lib/checksums.py" "$ISO_OUT"
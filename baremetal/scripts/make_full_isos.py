@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""Build several per-host full ISOs from one xorriso process.
+
+``make_full_iso.sh`` starts a fresh xorriso for every host. This builder feeds
+a single ``xorriso -dialog on`` process one host at a time: the Ubuntu ISO is
+loaded once, and each host maps its ``/nocloud`` and GRUB files over the image
+xorriso has just written and commits to its own output. Those outputs are
+boot-checked against the Ubuntu ISO like appended ones. A host is published only
+when xorriso reported no failure for it. The outputs match ``make_full_iso.sh``; with
+``AUTOINSTALL_REFLINK=1`` on reflink-capable filesystems both clone the
+pre-patched base image of ``base_image.py`` (or the Ubuntu ISO) and append the
+host files as a new session instead of rewriting the whole image. An appended
+image whose boot equipment no longer matches the Ubuntu ISO is rebuilt with a
+full write in a second pass. With ``SOURCE_DATE_EPOCH`` set
+the builds are reproducible: staged files are normalised, xorriso gets fixed
+dates and identifiers, and every host is written from the Ubuntu ISO itself,
+without cloning or chaining.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Sequence
+
+import base_image
+from make_multi_iso import (
+    DEFAULT_TMPDIR,
+    GENERATED_ROOT,
+    INJECTED_PATHS,
+    REPO_ROOT,
+    IsoBuildError,
+    clone_file,
+    ensure_generated_host,
+    require_binary,
+    source_date_epoch,
+)
+
+SCRIPTS_ROOT = REPO_ROOT / "scripts"
+if str(SCRIPTS_ROOT) not in sys.path:
+    sys.path.append(str(SCRIPTS_ROOT))
+
+from lib import checksums, reproducible
+
+DONE_MARKER = "@@autoinstall-done"
+# messages at or above the -abort_on threshold
+PROBLEM_MESSAGE = re.compile(r" : (FAILURE|FATAL|ABORT) : ")
+
+
+@dataclass(frozen=True)
+class FullIsoJob:
+    """Staged inputs and destination of one per-host full ISO."""
+
+    host: str
+    workdir: Path
+    output: Path
+    cloned: bool = False
+    # cloned from the pre-patched base image: GRUB is already in place
+    from_base: bool = False
+    # written from the previous job's output, still loaded in xorriso
+    chained: bool = False
+
+    @property
+    def partial(self) -> Path:
+        return self.output.with_name(self.output.name + ".partial")
+
+
+def full_iso_path(host: str) -> Path:
+    return GENERATED_ROOT / host / f"ubuntu-autoinstall-{host}.iso"
+
+
+def stage_host(host: str, workdir: Path, grub: str, epoch: int | None = None) -> FullIsoJob:
+    """Copy the NoCloud pair of ``host`` and the patched GRUB configs into ``workdir``."""
+
+    host_dir = ensure_generated_host(host)
+    nocloud_dir = workdir / "nocloud"
+    nocloud_dir.mkdir(parents=True)
+    shutil.copyfile(host_dir / "user-data", nocloud_dir / "user-data")
+    shutil.copyfile(host_dir / "meta-data", nocloud_dir / "meta-data")
+    (workdir / "grub.cfg").write_text(grub, encoding="utf-8")
+    (workdir / "loopback.cfg").write_text(grub, encoding="utf-8")
+    if epoch is not None:
+        reproducible.normalize_tree(workdir, epoch)
+    return FullIsoJob(host=host, workdir=workdir, output=full_iso_path(host))
+
+
+def clone_job(job: FullIsoJob, ubuntu_iso: Path, base: base_image.BaseImage) -> FullIsoJob:
+    """Reflink the pre-patched base (or the Ubuntu ISO) into the job's partial output."""
+
+    if not base_image.reflink_enabled():
+        return job
+    if base.iso is not None and clone_file(base.iso, job.partial):
+        return replace(job, cloned=True, from_base=True)
+    return replace(job, cloned=clone_file(ubuntu_iso, job.partial))
+
+
+def chain_jobs(jobs: Sequence[FullIsoJob]) -> list[FullIsoJob]:
+    """Mark the uncloned jobs that can start from the previous job's output.
+
+    After ``-commit`` xorriso loads the image it has just written, so an
+    uncloned job that follows another one only redirects the output: the Ubuntu
+    ISO is read once per run of uncloned jobs instead of once per host.
+    """
+
+    chained = []
+    previous: FullIsoJob | None = None
+    for job in jobs:
+        if not job.cloned and previous is not None and not previous.cloned:
+            job = replace(job, chained=True)
+        chained.append(job)
+        previous = job
+    return chained
+
+
+def quote(word: str) -> str:
+    """Quote a word for xorriso's dialog parser."""
+
+    if "'" in word or "\n" in word:
+        raise IsoBuildError(f"Unsupported character in path for xorriso: {word!r}")
+    return f"'{word}'"
+
+
+def command_lines(ubuntu_iso: Path, jobs: Sequence[FullIsoJob], epoch: int | None = None) -> list[str]:
+    """Return the dialog lines building each job, followed by its marker line.
+
+    The marker has a line of its own so that it is printed whether or not
+    ``-abort_on`` abandons the job line; the job's status comes from the
+    messages xorriso printed before it.
+    """
+
+    lines = []
+    for job in jobs:
+        # a reflinked partial already holds the Ubuntu tree: only append the host files
+        if job.cloned:
+            words = ["-dev", str(job.partial)]
+        elif job.chained:
+            words = ["-outdev", str(job.partial)]
+        else:
+            words = ["-indev", str(ubuntu_iso), "-outdev", str(job.partial)]
+        if not job.from_base:
+            # chained jobs map the same GRUB configs again: -map overwrites them
+            words += [
+                "-map",
+                str(job.workdir / "grub.cfg"),
+                "/boot/grub/grub.cfg",
+                "-map",
+                str(job.workdir / "loopback.cfg"),
+                "/boot/grub/loopback.cfg",
+            ]
+        words += [
+            "-map",
+            str(job.workdir / "nocloud"),
+            "/nocloud",
+            "-boot_image",
+            "any",
+            "replay",
+            *(reproducible.xorriso_arguments(epoch, INJECTED_PATHS) if epoch is not None else []),
+            "-commit",
+        ]
+        marker = ["-print", f"{DONE_MARKER} {job.host}"]
+        lines.append(
+            " ".join(quote(word) for word in words) + "\n" + " ".join(quote(word) for word in marker) + "\n"
+        )
+    return lines
+
+
+@dataclass(frozen=True)
+class JobResult:
+    """Marker of one job as read from xorriso."""
+
+    host: str
+    seconds: float
+    problems: tuple[str, ...]
+
+
+def drive(process: subprocess.Popen[str], jobs: Sequence[FullIsoJob], lines: Sequence[str], results: queue.Queue) -> None:
+    """Send the jobs one at a time and put a JobResult in ``results`` for each marker.
+
+    The next job is sent as soon as a marker arrives, before the caller
+    publishes and hashes the finished output, so xorriso never waits for us and
+    the pipes never fill up. No job is sent after a failed one. ``None`` is put
+    in ``results`` once xorriso's output ends.
+    """
+
+    assert process.stdin is not None and process.stdout is not None
+    pending = iter(zip(jobs, lines))
+    problems: list[str] = []
+    try:
+        job, line = next(pending)
+        process.stdin.write(line)
+        process.stdin.flush()
+        started = time.perf_counter()
+        # -pkt_output on: "R:1: text" for results, "I:1: text" for messages
+        for packet in process.stdout:
+            channel, _, text = packet.partition(": ")
+            text = text.rstrip("\n")
+            if channel.startswith("I:") and PROBLEM_MESSAGE.search(text):
+                problems.append(text)
+            if not (channel.startswith("R:") and text == f"{DONE_MARKER} {job.host}"):
+                continue
+            finished = time.perf_counter()
+            following = None if problems else next(pending, None)
+            process.stdin.write(following[1] if following else "-end\n")
+            process.stdin.flush()
+            results.put(JobResult(job.host, finished - started, tuple(problems)))
+            if following is None:
+                break
+            job, problems, started = following[0], [], finished
+    except (BrokenPipeError, ValueError):
+        # xorriso exited, or was killed by the caller
+        pass
+    finally:
+        results.put(None)
+
+
+def run_batch(
+    ubuntu_iso: Path,
+    jobs: Sequence[FullIsoJob],
+    epoch: int | None,
+    base: base_image.BaseImage,
+    timings: list[tuple[str, float]],
+) -> list[FullIsoJob]:
+    """Build ``jobs`` in one xorriso process; return the jobs whose boot check failed.
+
+    Only outputs written from an appended or chained image are boot-checked.
+    Raises IsoBuildError when xorriso reports a failure or exits early; the
+    failed job and the ones not built yet leave no output behind.
+    """
+
+    pending = {job.host: job for job in jobs}
+    rejected: list[FullIsoJob] = []
+    failed: list[str] = []
+    reports = (base.el_torito, base.system_area)
+    results: queue.Queue[JobResult | None] = queue.Queue()
+    process = subprocess.Popen(
+        ["xorriso", "-abort_on", "FAILURE", "-pkt_output", "on", "-dialog", "on"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    driver = threading.Thread(
+        target=drive, args=(process, jobs, command_lines(ubuntu_iso, jobs, epoch), results), daemon=True
+    )
+    driver.start()
+    try:
+        while (result := results.get()) is not None:
+            job = pending.pop(result.host)
+            if result.problems:
+                failed.append(job.host)
+                for message in result.problems:
+                    print(f"[!] {job.host}: {message}", file=sys.stderr)
+                job.partial.unlink(missing_ok=True)
+                continue
+            problem = None
+            if job.cloned or job.chained:
+                problem = base_image.boot_mismatch(job.partial, ubuntu_iso, reports)
+            if problem is not None:
+                print(f"[!] {job.host}: boot check failed ({problem}), writing a full copy", file=sys.stderr)
+                job.partial.unlink(missing_ok=True)
+                rejected.append(replace(job, cloned=False, from_base=False, chained=False))
+                continue
+            os.replace(job.partial, job.output)
+            # xorriso is already writing the next host while this one is hashed
+            sums = checksums.of_file(job.output)
+            checksums.record(job.output, sums)
+            timings.append((job.host, result.seconds))
+            print(
+                f"Created {os.path.relpath(job.output, REPO_ROOT)} ({result.seconds:.1f}s, sha256 {sums.sha256})",
+                flush=True,
+            )
+        returncode = process.wait()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        driver.join()
+        for job in pending.values():
+            job.partial.unlink(missing_ok=True)
+    if failed or pending or returncode != 0:
+        raise IsoBuildError(
+            f"xorriso exited with code {returncode}; failed: {', '.join(failed) or 'none'}; "
+            f"not built: {', '.join(pending) or 'none'}"
+        )
+    return rejected
+
+
+def build_full_isos(*, ubuntu_iso: Path, hosts: Sequence[str]) -> list[tuple[str, float]]:
+    """Build one full ISO per host and return ``(host, seconds)`` in build order."""
+
+    if not hosts:
+        raise IsoBuildError("At least one host must be provided")
+    if len(set(hosts)) != len(hosts):
+        raise IsoBuildError("Each host can only be listed once")
+    require_binary("xorriso")
+    epoch = source_date_epoch()
+    base = base_image.prepare(ubuntu_iso)
+    grub = base.grub_cfg.read_text(encoding="utf-8")
+    tmp_base = Path(os.environ.get("TMPDIR", DEFAULT_TMPDIR))
+    tmp_base.mkdir(parents=True, exist_ok=True)
+    os.chmod(tmp_base, 0o700)
+
+    timings: list[tuple[str, float]] = []
+    with tempfile.TemporaryDirectory(dir=tmp_base, prefix="autoinstall.") as tmp:
+        jobs = [stage_host(host, Path(tmp) / host, grub, epoch) for host in hosts]
+        for job in jobs:
+            job.partial.unlink(missing_ok=True)
+        if epoch is None:
+            jobs = chain_jobs([clone_job(job, ubuntu_iso, base) for job in jobs])
+        rejected = run_batch(ubuntu_iso, jobs, epoch, base, timings)
+        if rejected:
+            run_batch(ubuntu_iso, rejected, epoch, base, timings)
+    return timings
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build per-host full autoinstall ISOs in one xorriso session")
+    parser.add_argument("--ubuntu-iso", required=True, help="Path to the official Ubuntu live-server ISO")
+    parser.add_argument("--host", dest="hosts", action="append", required=True, help="Host to build (repeatable)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str]) -> int:
+    args = parse_args(argv)
+    ubuntu_iso = Path(args.ubuntu_iso).expanduser().resolve()
+    if not ubuntu_iso.is_file():
+        raise SystemExit(f"Ubuntu ISO not found: {ubuntu_iso}")
+    started = time.perf_counter()
+    try:
+        timings = build_full_isos(ubuntu_iso=ubuntu_iso, hosts=args.hosts)
+    except IsoBuildError as exc:
+        print(f"[!] {exc}", file=sys.stderr)
+        return 2
+    total = time.perf_counter() - started
+    print()
+    width = max(len("Host"), *(len(host) for host, _ in timings))
+    print(f"{'Host'.ljust(width)} | Time")
+    print(f"{'-' * width}-+-------")
+    for host, seconds in timings:
+        print(f"{host.ljust(width)} | {seconds:5.1f}s")
+    print(f"{len(timings)} ISO(s) in {total:.1f}s ({total / len(timings):.1f}s per ISO)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -2,29 +2,44 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import os
 import shutil
 import subprocess
 import sys
 import tempfile
-from datetime import datetime
+import time
 from pathlib import Path
 from typing import Sequence
 
+import base_image
+from base_image import DEFAULT_TMPDIR, IsoBuildError, clone_file, require_binary, source_fingerprint
+
 REPO_ROOT = Path(__file__).resolve().parents[2]
 GENERATED_ROOT = REPO_ROOT / "baremetal" / "autoinstall" / "generated"
 MULTI_ROOT = GENERATED_ROOT / "_multi"
-DEFAULT_TMPDIR = REPO_ROOT / ".cache" / "tmp"
+SCRIPTS_ROOT = REPO_ROOT / "scripts"
+if str(SCRIPTS_ROOT) not in sys.path:
+    sys.path.append(str(SCRIPTS_ROOT))
+
+from lib import checksums, reproducible
 
+MANIFEST_VERSION = 2
+# Every incremental session leaves the previous /nocloud tree as dead space;
+# past this many appended sessions the next build starts from scratch again.
+MAX_APPENDED_SESSIONS = 8
+# ISO paths written from the staging directory (owner reset in reproducible mode)
+INJECTED_PATHS = ("/boot/grub/grub.cfg", "/boot/grub/loopback.cfg", "/nocloud")
 
-class IsoBuildError(RuntimeError):
-    """Exception raised when the ISO build cannot proceed."""
 
+def source_date_epoch() -> int | None:
+    """``SOURCE_DATE_EPOCH`` when reproducible builds are requested, else None."""
 
-def require_binary(name: str) -> None:
-    if shutil.which(name) is None:
-        raise IsoBuildError(f"Missing required binary: {name}")
+    try:
+        return reproducible.source_date_epoch()
+    except ValueError as exc:
+        raise IsoBuildError(str(exc)) from None
 
 
 def ensure_generated_host(host: str) -> Path:
@@ -39,7 +54,15 @@ def ensure_generated_host(host: str) -> Path:
     return host_dir
 
 
-def render_grub_config(hosts: Sequence[str], timeout: int, default_host: str | None, workdir: Path) -> Path:
+def render_grub_config(
+    hosts: Sequence[str],
+    timeout: int,
+    default_host: str | None,
+    workdir: Path,
+    *,
+    kernel: str = base_image.DEFAULT_KERNEL,
+    initrd: str = base_image.DEFAULT_INITRD,
+) -> Path:
     if timeout < 0:
         raise IsoBuildError("Timeout must be positive")
     entries: list[str] = []
@@ -53,8 +76,8 @@ def render_grub_config(hosts: Sequence[str], timeout: int, default_host: str | N
                 (
                     f"menuentry 'Install: {host}' {{",
                     "    set gfxpayload=keep",
-                    f"    linux   /casper/vmlinuz {patch} ---",
-                    "    initrd  /casper/initrd",
+                    f"    linux   {kernel} {patch} ---",
+                    f"    initrd  {initrd}",
                     "}",
                 )
             )
@@ -74,6 +97,215 @@ def render_grub_config(hosts: Sequence[str], timeout: int, default_host: str | N
     return grub_cfg
 
 
+def stage_payload(
+    hosts: Sequence[str],
+    timeout: int,
+    default_host: str | None,
+    workdir: Path,
+    base: base_image.BaseImage | None = None,
+) -> Path:
+    """Lay out ``nocloud/``, ``grub.cfg`` and ``loopback.cfg`` under ``workdir``."""
+
+    nocloud_dir = workdir / "nocloud"
+    nocloud_dir.mkdir(parents=True, exist_ok=True)
+    for host in hosts:
+        host_dir = GENERATED_ROOT / host
+        target_dir = nocloud_dir / host
+        target_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(host_dir / "user-data", target_dir / "user-data")
+        shutil.copyfile(host_dir / "meta-data", target_dir / "meta-data")
+    boot_files = {"kernel": base.kernel, "initrd": base.initrd} if base is not None else {}
+    grub_cfg = render_grub_config(hosts, timeout, default_host, workdir, **boot_files)
+    loopback_cfg = workdir / "loopback.cfg"
+    loopback_cfg.write_text(grub_cfg.read_text(encoding="utf-8"), encoding="utf-8")
+    return nocloud_dir
+
+
+def payload_digests(workdir: Path) -> dict[str, str]:
+    """Return the SHA256 of every file mapped into the ISO, keyed by ISO path."""
+
+    digests: dict[str, str] = {}
+    for path in sorted(workdir.rglob("*")):
+        if not path.is_file():
+            continue
+        relative = path.relative_to(workdir).as_posix()
+        iso_path = f"/{relative}" if relative.startswith("nocloud/") else f"/boot/grub/{relative}"
+        digests[iso_path] = hashlib.sha256(path.read_bytes()).hexdigest()
+    return digests
+
+
+def mapping_arguments(workdir: Path) -> list[str]:
+    return [
+        "-map",
+        str(workdir / "grub.cfg"),
+        "/boot/grub/grub.cfg",
+        "-map",
+        str(workdir / "loopback.cfg"),
+        "/boot/grub/loopback.cfg",
+        "-map",
+        str(workdir / "nocloud"),
+        "/nocloud",
+    ]
+
+
+def load_manifest(output_dir: Path) -> dict[str, object] | None:
+    manifest_path = output_dir / "manifest.json"
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) else None
+
+
+def can_patch(
+    manifest: dict[str, object] | None,
+    iso_output: Path,
+    source: dict[str, object],
+    epoch: int | None = None,
+) -> str | None:
+    """Return why the previous artefact cannot be patched, or None when it can."""
+
+    if not iso_output.is_file():
+        return "no previous ISO"
+    if manifest is None or manifest.get("version") != MANIFEST_VERSION:
+        return "previous manifest missing or from an older format"
+    if manifest.get("source") != source:
+        return "Ubuntu source ISO changed"
+    if manifest.get("source_date_epoch") != epoch:
+        return "SOURCE_DATE_EPOCH changed"
+    if int(manifest.get("sessions", 1)) >= 1 + MAX_APPENDED_SESSIONS:
+        return f"{MAX_APPENDED_SESSIONS} appended sessions reached"
+    return None
+
+
+def append_session_command(iso: Path, workdir: Path, *, replace_nocloud: bool = False) -> list[str]:
+    """xorriso command adding the per-host files as a new session of ``iso``."""
+
+    return [
+        "xorriso",
+        "-dev",
+        str(iso),
+        *(["-rm_r", "/nocloud", "--"] if replace_nocloud else []),
+        *mapping_arguments(workdir),
+        "-boot_image",
+        "any",
+        "replay",
+        "-commit",
+    ]
+
+
+def build_full(
+    ubuntu_iso: Path,
+    workdir: Path,
+    iso_output: Path,
+    epoch: int | None = None,
+    base: base_image.BaseImage | None = None,
+) -> bool:
+    """Build from the pristine Ubuntu ISO into a temporary file, then swap it in.
+
+    With ``AUTOINSTALL_REFLINK=1`` on a filesystem that supports reflinks the
+    Ubuntu ISO is cloned and only the per-host files are written, as an
+    appended session. Returns True in that case. The result must keep the boot
+    equipment of the source (checked against the reports cached in ``base``),
+    otherwise it is written in full. Reproducible builds (``epoch`` set) are
+    always written in full, so the result does not depend on the filesystem.
+    """
+
+    partial = iso_output.with_name(iso_output.name + ".partial")
+    partial.unlink(missing_ok=True)
+    if epoch is None and base_image.reflink_enabled() and clone_file(ubuntu_iso, partial):
+        reports = (base.el_torito, base.system_area) if base is not None else None
+        try:
+            subprocess.run(append_session_command(partial, workdir), check=True)
+            problem = base_image.boot_mismatch(partial, ubuntu_iso, reports)
+        except subprocess.CalledProcessError:
+            problem = "xorriso failed"
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        if problem is None:
+            os.replace(partial, iso_output)
+            return True
+        print(f"[!] Appending to the reflinked Ubuntu ISO failed ({problem}), writing a full copy", file=sys.stderr)
+        partial.unlink(missing_ok=True)
+    command = [
+        "xorriso",
+        "-indev",
+        str(ubuntu_iso),
+        "-outdev",
+        str(partial),
+        *mapping_arguments(workdir),
+        "-boot_image",
+        "any",
+        "replay",
+        *(reproducible.xorriso_arguments(epoch, INJECTED_PATHS) if epoch is not None else []),
+    ]
+    try:
+        subprocess.run(command, check=True)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    os.replace(partial, iso_output)
+    return False
+
+
+def patch_in_place(workdir: Path, iso_output: Path, ubuntu_iso: Path, base: base_image.BaseImage) -> str | None:
+    """Append a session replacing /nocloud and the GRUB configs of ``iso_output``.
+
+    On a regular file xorriso rewrites the superblock so the appended session
+    becomes the visible tree; boot records are replayed from the loaded image.
+    The session is appended to a reflink of the published ISO, which is only
+    swapped in once xorriso succeeded and the boot equipment still matches the
+    Ubuntu ISO: readers never see a torn image. Returns why the ISO was not
+    patched (no reflink support, failed append) or None once it is replaced;
+    without reflinks a copy would cost as much as the full build.
+    """
+
+    partial = iso_output.with_name(iso_output.name + ".partial")
+    partial.unlink(missing_ok=True)
+    if not clone_file(iso_output, partial):
+        return "the output filesystem does not support reflinks"
+    try:
+        subprocess.run(append_session_command(partial, workdir, replace_nocloud=True), check=True)
+        problem = base_image.boot_mismatch(partial, ubuntu_iso, (base.el_torito, base.system_area))
+    except subprocess.CalledProcessError:
+        problem = "xorriso failed"
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    if problem is not None:
+        partial.unlink(missing_ok=True)
+        return problem
+    os.replace(partial, iso_output)
+    return None
+
+
+def output_checksums(
+    iso_output: Path, previous: dict[str, object] | None, *, blake2: bool | None = None
+) -> tuple[checksums.Checksums, dict[str, object]]:
+    """Size and digests of the built ISO, read once; reused when the file is untouched."""
+
+    stat = iso_output.stat()
+    known = previous.get("output") if previous else None
+    if (
+        isinstance(known, dict)
+        and known.get("size") == stat.st_size
+        and known.get("mtime_ns") == stat.st_mtime_ns
+        and (known.get("blake2b") or not (checksums.blake2_enabled() if blake2 is None else blake2))
+    ):
+        sums = checksums.Checksums(size=stat.st_size, sha256=str(known["sha256"]), blake2b=known.get("blake2b"))
+    else:
+        sums = checksums.of_file(iso_output, blake2=blake2)
+    checksums.record(iso_output, sums)
+    return sums, {"file": iso_output.name, "mtime_ns": stat.st_mtime_ns, **sums.as_dict()}
+
+
+def full_mode(cloned: bool) -> tuple[str, int]:
+    """Build mode and session count of a fresh build (a clone adds one session)."""
+
+    return ("clone", 2) if cloned else ("full", 1)
+
+
 def build_iso(
     *,
     ubuntu_iso: Path,
@@ -81,6 +313,8 @@ def build_iso(
     hosts: Sequence[str],
     timeout: int,
     default_host: str | None,
+    incremental: bool = False,
+    blake2: bool | None = None,
 ) -> Path:
     if not hosts:
         raise IsoBuildError("At least one host must be provided")
@@ -95,50 +329,53 @@ def build_iso(
     if default_host and default_host not in hosts:
         raise IsoBuildError(f"Default host '{default_host}' is not part of the ISO host list")
 
+    epoch = source_date_epoch()
+    started = time.perf_counter()
+    base = base_image.prepare(ubuntu_iso)
+    source = source_fingerprint(ubuntu_iso)
+    previous = load_manifest(output_dir)
+    iso_output = output_dir / f"ubuntu-autoinstall-{name}.iso"
     with tempfile.TemporaryDirectory(dir=tmp_base) as tmp:
         workdir = Path(tmp)
-        nocloud_dir = workdir / "nocloud"
-        nocloud_dir.mkdir(parents=True, exist_ok=True)
-        for host in hosts:
-            host_dir = GENERATED_ROOT / host
-            target_dir = nocloud_dir / host
-            target_dir.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(host_dir / "user-data", target_dir / "user-data")
-            shutil.copy2(host_dir / "meta-data", target_dir / "meta-data")
-        grub_cfg = render_grub_config(hosts, timeout, default_host, workdir)
-        loopback_cfg = workdir / "loopback.cfg"
-        loopback_cfg.write_text(grub_cfg.read_text(encoding="utf-8"), encoding="utf-8")
-
-        iso_output = output_dir / f"ubuntu-autoinstall-{name}.iso"
-        if iso_output.exists():
-            iso_output.unlink()
-        command = [
-            "xorriso",
-            "-indev",
-            str(ubuntu_iso),
-            "-outdev",
-            str(iso_output),
-            "-map",
-            str(grub_cfg),
-            "/boot/grub/grub.cfg",
-            "-map",
-            str(loopback_cfg),
-            "/boot/grub/loopback.cfg",
-            "-map",
-            str(nocloud_dir),
-            "/nocloud",
-            "-boot_image",
-            "any",
-            "replay",
-        ]
-        subprocess.run(command, check=True)
+        stage_payload(hosts, timeout, default_host, workdir, base)
+        if epoch is not None:
+            reproducible.normalize_tree(workdir, epoch)
+        payload = payload_digests(workdir)
+        reason = can_patch(previous, iso_output, source, epoch) if incremental else "incremental mode disabled"
+        if reason is None and previous is not None and previous.get("payload") == payload:
+            mode, sessions = "unchanged", int(previous.get("sessions", 1))
+            print(f"{iso_output.name}: payload unchanged, nothing to rewrite")
+        elif reason is None and epoch is not None:
+            # an appended session depends on the build history, not only on the inputs
+            print(f"Full rebuild of {iso_output.name}: reproducible builds are never patched")
+            mode, sessions = full_mode(build_full(ubuntu_iso, workdir, iso_output, epoch, base))
+        elif reason is None and previous is not None:
+            mode, sessions = "incremental", int(previous.get("sessions", 1)) + 1
+            problem = patch_in_place(workdir, iso_output, ubuntu_iso, base)
+            if problem is not None:
+                print(f"[!] Incremental update skipped ({problem}), rebuilding from the Ubuntu ISO", file=sys.stderr)
+                mode, sessions = full_mode(build_full(ubuntu_iso, workdir, iso_output, base=base))
+        else:
+            if incremental:
+                print(f"Full rebuild of {iso_output.name}: {reason}")
+            mode, sessions = full_mode(build_full(ubuntu_iso, workdir, iso_output, epoch, base))
+    sums, output = output_checksums(iso_output, previous, blake2=blake2)
+    print(f"{iso_output.name}: {mode} build in {time.perf_counter() - started:.1f}s (sha256 {sums.sha256})")
 
     manifest = {
+        "version": MANIFEST_VERSION,
         "name": name,
         "hosts": list(hosts),
         "default_host": default_host,
         "ubuntu_iso": str(ubuntu_iso.resolve()),
-        "created_at": datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
+        "created_at": reproducible.build_time(epoch),
+        "source_date_epoch": epoch,
+        "build_mode": mode,
+        "sessions": sessions,
+        "source": source,
+        "ubuntu_sha256": base.sha256,
+        "payload": payload,
+        "output": output,
     }
     (output_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
     summary = output_dir / "SUMMARY.txt"
@@ -150,6 +387,8 @@ def build_iso(
                 f"Default boot entry: {default_host or hosts[0]}",
                 f"Ubuntu ISO source: {ubuntu_iso}",
                 f"Generated at: {manifest['created_at']}",
+                f"ISO: {iso_output.name}",
+                *checksums.summary_lines(sums),
                 "",
                 "Flash the ISO with `dd` or `ventoy` and choisissez l'entrée GRUB correspondant à l'hôte cible.",
             ]
@@ -166,6 +405,16 @@ def parse_args(argv: Sequence[str]) -> argparse.Namespace:
     parser.add_argument("--host", dest="hosts", action="append", required=True, help="Host to include (repeatable)")
     parser.add_argument("--timeout", type=int, default=10, help="GRUB menu timeout in seconds")
     parser.add_argument("--default-host", help="Host selected by default in the GRUB menu")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Patch the previous ISO of the same name when only /nocloud or GRUB configs changed",
+    )
+    parser.add_argument(
+        "--blake2",
+        action="store_true",
+        help="Also record a BLAKE2b digest (same as AUTOINSTALL_BLAKE2=1)",
+    )
     return parser.parse_args(argv)
 
 
@@ -181,6 +430,8 @@ def main(argv: Sequence[str]) -> int:
             hosts=args.hosts,
             timeout=args.timeout,
             default_host=args.default_host,
+            incremental=args.incremental,
+            blake2=args.blake2 or None,
         )
     except IsoBuildError as exc:
         print(f"[!] {exc}", file=sys.stderr)
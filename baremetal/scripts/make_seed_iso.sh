@@ -12,6 +12,12 @@ OUTDIR="${AUTOINSTALL_DIR}/generated/${HOST}"
 USER_DATA="${OUTDIR}/user-data"
 META_DATA="${OUTDIR}/meta-data"
 ISO="${OUTDIR}/seed-${HOST}.iso"
-xorriso -as mkisofs -V CIDATA -o "${ISO}" -J -l "${USER_DATA}" "${META_DATA}"
+# SOURCE_DATE_EPOCH pins the volume dates/UUID and every file date (reproducible builds).
+declare -a REPRO=()
+if [ -n "${SOURCE_DATE_EPOCH:-}" ]; then
+  REPRO=(--modification-date="$(date -u -d "@${SOURCE_DATE_EPOCH}" +%Y%m%d%H%M%S00)" --set_all_file_dates "=${SOURCE_DATE_EPOCH}")
+fi
+xorriso -as mkisofs -V CIDATA -o "${ISO}" -J -l "${REPRO[@]}" "${USER_DATA}" "${META_DATA}"
 REL_ISO="$(realpath --relative-to="${BAREMETAL_ROOT}" "${ISO}" 2>/dev/null || echo "${ISO}")"
 echo "Created ${REL_ISO}"
+python3 "${BAREMETAL_ROOT}/../scripts/lib/checksums.py" "${ISO}"
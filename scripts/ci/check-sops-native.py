@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Check that lib.sops_age decrypts the SOPS fixture exactly like ``sops -d``.
+
+The fixture in ``scripts/ci/fixtures/sops`` is encrypted for a throwaway age
+identity (``age-test-key.txt``); ``secrets.decrypted.yaml`` is the expected
+``sops -d`` output. The native decryption is compared to it as parsed data,
+since it is re-serialised with ``yaml.safe_dump``. Tampered copies must be
+rejected and an unknown identity must leave the file to the ``sops`` binary.
+
+When ``sops`` is installed, its own output is compared to the expected file
+too. To rebuild the fixture, edit it with the test key and record the output:
+
+    SOPS_AGE_KEY_FILE=scripts/ci/fixtures/sops/age-test-key.txt \\
+      sops -d scripts/ci/fixtures/sops/secrets.sops.yaml \\
+      > scripts/ci/fixtures/sops/secrets.decrypted.yaml
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+FIXTURES_ROOT = REPO_ROOT / "scripts" / "ci" / "fixtures" / "sops"
+SCRIPTS_ROOT = REPO_ROOT / "scripts"
+if str(SCRIPTS_ROOT) not in sys.path:
+    sys.path.append(str(SCRIPTS_ROOT))
+
+from lib import sops_age, yamlio
+
+ENCRYPTED_NAME = "secrets.sops.yaml"
+EXPECTED_NAME = "secrets.decrypted.yaml"
+KEY_NAME = "age-test-key.txt"
+
+
+def check_native(fixtures: Path, expected: Any, errors: list[str]) -> None:
+    """Decrypt the fixture in-process and compare it to ``expected``."""
+
+    path = fixtures / ENCRYPTED_NAME
+    try:
+        decrypted = yamlio.load(sops_age.decrypt_file(path))
+    except (sops_age.SopsFormatError, sops_age.Unsupported) as exc:
+        errors.append(f"[{path}] native decryption failed: {exc}")
+        return
+    if decrypted != expected:
+        errors.append(f"[{path}] native decryption differs from {EXPECTED_NAME}")
+
+
+def check_rejected(fixtures: Path, errors: list[str]) -> None:
+    """Tampered ciphertexts and unknown identities must not yield plaintext."""
+
+    text = (fixtures / ENCRYPTED_NAME).read_text(encoding="utf-8")
+    identities = sops_age.parse_identities((fixtures / KEY_NAME).read_text(encoding="utf-8"))
+    start = text.index("data:", text.index("password_hash:")) + len("data:")
+    flipped = "B" if text[start] == "A" else "A"
+    cases = {
+        "tampered encrypted value": text[:start] + flipped + text[start + 1 :],
+        "tampered cleartext value": text.replace("port: 623", "port: 624", 1),
+    }
+    for label, tampered in cases.items():
+        try:
+            sops_age.decrypt_document(tampered, identities)
+        except sops_age.SopsFormatError:
+            continue
+        except sops_age.Unsupported as exc:
+            errors.append(f"{label}: expected a decryption error, got Unsupported ({exc})")
+        else:
+            errors.append(f"{label}: decrypted without error")
+    try:
+        sops_age.decrypt_document(text, [sops_age.X25519PrivateKey.generate()])
+    except sops_age.Unsupported:
+        pass
+    except sops_age.SopsFormatError as exc:
+        errors.append(f"unknown identity: expected Unsupported, got {exc}")
+    else:
+        errors.append("unknown identity: decrypted without error")
+
+
+def check_binary(sops: str, fixtures: Path, expected_text: str, errors: list[str]) -> None:
+    """Compare the output of the ``sops`` binary to the recorded one."""
+
+    env = dict(os.environ, SOPS_AGE_KEY_FILE=str(fixtures / KEY_NAME))
+    env.pop("SOPS_AGE_KEY", None)
+    result = subprocess.run(
+        [sops, "-d", str(fixtures / ENCRYPTED_NAME)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        errors.append(f"sops -d failed: {result.stderr.strip()}")
+        return
+    if result.stdout == expected_text:
+        return
+    if yamlio.load(result.stdout) != yamlio.load(expected_text):
+        errors.append(f"sops -d output differs from {EXPECTED_NAME}")
+    else:
+        print(f"note: sops -d output matches {EXPECTED_NAME} once parsed, but not byte for byte")
+
+
+def run_checks(fixtures: Path, sops: str | None) -> list[str]:
+    """Execute the fixture checks and return any errors."""
+
+    errors: list[str] = []
+    if not sops_age.HAVE_CRYPTOGRAPHY:
+        return ["the cryptography module is not installed"]
+    expected_text = (fixtures / EXPECTED_NAME).read_text(encoding="utf-8")
+    expected = yamlio.load(expected_text)
+    os.environ["SOPS_AGE_KEY_FILE"] = str(fixtures / KEY_NAME)
+    os.environ.pop("SOPS_AGE_KEY", None)
+    check_native(fixtures, expected, errors)
+    check_rejected(fixtures, errors)
+    if sops:
+        check_binary(sops, fixtures, expected_text, errors)
+    else:
+        print("note: sops not found, recorded output not compared to the binary")
+    return errors
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    """Parse CLI options."""
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--fixtures",
+        type=Path,
+        default=FIXTURES_ROOT,
+        help="Directory holding the encrypted fixture, its expected output and the test key",
+    )
+    parser.add_argument(
+        "--sops",
+        default=shutil.which("sops"),
+        help="sops binary to compare against (default: the one on PATH, if any)",
+    )
+    parser.add_argument("--no-sops", action="store_true", help="Only check the native decryption")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """CLI entry point."""
+
+    args = parse_args(argv or sys.argv[1:])
+    errors = run_checks(args.fixtures, None if args.no_sops else args.sops)
+    if errors:
+        for error in errors:
+            print(error, file=sys.stderr)
+        return 1
+    print("sops_age matches the recorded sops -d output")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,87 +5,40 @@ from __future__ import annotations
 
 import argparse
 import sys
-from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
 
-import yaml
-
 REPO_ROOT = Path(__file__).resolve().parents[2]
 DEFAULT_INVENTORY_ROOT = REPO_ROOT / "baremetal" / "inventory"
+SCRIPTS_ROOT = REPO_ROOT / "scripts"
+if str(SCRIPTS_ROOT) not in sys.path:
+    sys.path.append(str(SCRIPTS_ROOT))
 
-
-@dataclass
-class HardwareProfile:
-    """Structured view over a hardware profile entry."""
-
-    name: str
-    path: Path
-    data: dict[str, Any]
-
-
-@dataclass
-class HostInventory:
-    """Structured view over host variables."""
-
-    name: str
-    path: Path
-    data: dict[str, Any]
+from lib import model
 
 
-def load_yaml(path: Path) -> dict[str, Any]:
-    """Return YAML data from path, defaulting to an empty mapping."""
+def collect_hardware_profiles(root: Path) -> list[model.HardwareProfile]:
+    """Hardware profiles of ``root`` (``<inventory>/profiles/hardware``)."""
 
-    try:
-        with path.open(encoding="utf-8") as handle:
-            content = yaml.safe_load(handle)
-    except FileNotFoundError:
-        return {}
-    if content is None:
-        return {}
-    if not isinstance(content, dict):
-        raise ValueError(f"{path} must contain a YAML mapping")
-    return content
+    return model.profiles([root.parent.parent])
 
 
-def collect_hardware_profiles(root: Path) -> list[HardwareProfile]:
-    """Load hardware profiles from the expected directory."""
+def collect_host_vars(root: Path) -> list[model.Host]:
+    """Hosts of ``root`` (``<inventory>/host_vars``)."""
 
-    profiles: list[HardwareProfile] = []
-    for candidate in sorted(root.glob("*.yml")):
-        profiles.append(HardwareProfile(candidate.stem, candidate, load_yaml(candidate)))
-    for candidate in sorted(root.glob("*.yaml")):
-        if candidate.stem not in {profile.name for profile in profiles}:
-            profiles.append(HardwareProfile(candidate.stem, candidate, load_yaml(candidate)))
-    return profiles
-
-
-def collect_host_vars(root: Path) -> list[HostInventory]:
-    """Load host vars directories containing a main.yml file."""
-
-    hosts: list[HostInventory] = []
-    if not root.exists():
-        return hosts
-    for directory in sorted(root.iterdir(), key=lambda entry: entry.name):
-        if not directory.is_dir() or directory.name.startswith("."):
-            continue
-        main_file = directory / "main.yml"
-        if not main_file.is_file():
-            continue
-        hosts.append(HostInventory(directory.name, main_file, load_yaml(main_file)))
-    return hosts
+    return model.hosts([root.parent])
 
 
-def ensure_fields_present(profile: HardwareProfile, errors: list[str]) -> None:
+def ensure_fields_present(profile: model.HardwareProfile, errors: list[str]) -> None:
     """Validate required keys inside a hardware profile."""
 
     required_keys = ("hardware_model", "disk_device", "nic", "netmode")
     for key in required_keys:
-        value = profile.data.get(key)
+        value = profile.get(key)
         if not value:
             errors.append(f"[{profile.path}] missing required key: {key}")
 
-    specs = profile.data.get("hardware_specs")
+    specs = profile.get("hardware_specs")
     if not isinstance(specs, dict):
         errors.append(f"[{profile.path}] missing hardware_specs block")
         return
@@ -117,15 +70,14 @@ def resolve_effective_value(host_value: Any, profile_value: Any) -> Any:
 
 
 def validate_hosts(
-    hosts: list[HostInventory],
-    profiles: dict[str, HardwareProfile],
+    hosts: list[model.Host],
+    profiles: dict[str, model.HardwareProfile],
     errors: list[str],
 ) -> None:
     """Validate host variables consistency against hardware profiles."""
 
     for host in hosts:
-        data = host.data
-        hardware_profile_name = data.get("hardware_profile")
+        hardware_profile_name = host.get("hardware_profile")
         if not hardware_profile_name:
             errors.append(f"[{host.path}] missing hardware_profile reference")
             continue
@@ -136,11 +88,11 @@ def validate_hosts(
             )
             continue
 
-        host_netmode = data.get("netmode")
+        host_netmode = host.get("netmode")
         if not host_netmode:
             errors.append(f"[{host.path}] missing netmode value")
         else:
-            profile_netmode = profile.data.get("netmode")
+            profile_netmode = profile.get("netmode")
             if profile_netmode and host_netmode != profile_netmode:
                 errors.append(
                     "[{path}] netmode '{host}' mismatches hardware profile '{profile}'".format(
@@ -150,15 +102,15 @@ def validate_hosts(
                     )
                 )
 
-        effective_disk = resolve_effective_value(data.get("disk_device"), profile.data.get("disk_device"))
+        effective_disk = resolve_effective_value(host.get("disk_device"), profile.get("disk_device"))
         if not effective_disk:
             errors.append(f"[{host.path}] no disk_device defined in host or profile")
 
-        effective_nic = resolve_effective_value(data.get("nic"), profile.data.get("nic"))
+        effective_nic = resolve_effective_value(host.get("nic"), profile.get("nic"))
         if not effective_nic:
             errors.append(f"[{host.path}] no nic defined in host or profile")
 
-        specs = profile.data.get("hardware_specs")
+        specs = profile.get("hardware_specs")
         if not specs:
             errors.append(
                 f"[{profile.path}] referenced by {host.path} but missing hardware_specs block"
@@ -6,10 +6,16 @@ import argparse
 import json
 import os
 import subprocess
+import sys
 from pathlib import Path
 from typing import Iterable
 
 REPO_ROOT = Path(__file__).resolve().parents[2]
+SCRIPTS_ROOT = REPO_ROOT / "scripts"
+if str(SCRIPTS_ROOT) not in sys.path:
+    sys.path.append(str(SCRIPTS_ROOT))
+
+from lib import model
 
 
 def git_diff(base: str | None) -> list[str]:
@@ -30,22 +36,15 @@ def git_diff(base: str | None) -> list[str]:
 
 
 def list_hardware_targets(directory: Path) -> list[str]:
-    suffixes = ("*.yml", "*.yaml")
-    targets = {
-        profile.stem
-        for suffix in suffixes
-        for profile in directory.glob(suffix)
-        if profile.is_file()
-    }
-    return sorted(targets)
+    """Profiles of ``<root>/profiles/hardware``."""
+
+    return [profile.name for profile in model.profiles([directory.parent.parent])]
 
 
 def list_host_targets(directory: Path) -> list[str]:
-    hosts: list[str] = []
-    for candidate in directory.iterdir():
-        if candidate.is_dir() and (candidate / "main.yml").exists():
-            hosts.append(candidate.name)
-    return sorted(hosts)
+    """Hosts of ``<root>/host_vars``."""
+
+    return [host.name for host in model.hosts([directory.parent])]
 
 
 def write_output(name: str, value: str) -> None:
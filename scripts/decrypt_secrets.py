@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""Print a decrypted SOPS document, reusing the session secrets cache."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Sequence
+
+from lib import sops
+
+
+def main(argv: Sequence[str]) -> int:
+    if len(argv) != 1:
+        print("Usage: decrypt_secrets.py <secrets.sops.yaml>", file=sys.stderr)
+        return 2
+    try:
+        sys.stdout.write(sops.decrypt_file(Path(argv[0])))
+    except sops.SopsError as exc:
+        print(f"[!] {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
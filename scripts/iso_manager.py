@@ -2,22 +2,38 @@
 from __future__ import annotations
 
 import argparse
+import json
+import os
+import shlex
 import subprocess
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Iterable, Sequence
 
-from lib import inventory
+from lib import checksums, inventory, io_scheduler, iso9660, model, query, render_cache, reproducible, sops, trace, watch
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
+PLAYBOOK_DIR = REPO_ROOT / "baremetal" / "ansible" / "playbooks"
+BATCH_OUTPUT_ROOT = REPO_ROOT / ".cache" / "render-profiles"
+FULL_ISO_SCRIPT = REPO_ROOT / "baremetal" / "scripts" / "make_full_iso.sh"
+FULL_ISO_DEFAULT_JOBS = 2
+# Room for /nocloud and the patched GRUB configs on top of the Ubuntu ISO.
+FULL_ISO_OVERHEAD = 16 * 1024 * 1024
 
 
-def run_make(target: str, *, variables: dict[str, str] | None = None) -> None:
+def make_command(target: str, variables: dict[str, str] | None = None) -> list[str]:
     command = ["make", target]
     if variables:
         for key, value in variables.items():
             command.append(f"{key}={value}")
-    subprocess.run(command, check=True, cwd=REPO_ROOT)
+    return command
+
+
+def run_make(target: str, *, variables: dict[str, str] | None = None) -> None:
+    subprocess.run(make_command(target, variables), check=True, cwd=REPO_ROOT)
 
 
 def ensure_hosts_exist(hosts: Iterable[str]) -> None:
@@ -29,28 +45,422 @@ def ensure_hosts_exist(hosts: Iterable[str]) -> None:
         )
 
 
+@dataclass(frozen=True)
+class RenderOutcome:
+    """Result of a single host/profile render, with its captured log."""
+
+    target: str
+    ok: bool
+    duration: float
+    log: str
+    skipped: bool = False
+
+
+def ansible_render_command() -> list[str]:
+    return [*shlex.split(os.environ.get("ANSIBLE") or "ansible-playbook"), "generate_autoinstall.yml"]
+
+
+def render_job(
+    engine: str,
+    host: str,
+    profile: str = "",
+    *,
+    force: bool = False,
+    capture: bool = True,
+) -> RenderOutcome:
+    """Render one target, skipping it when its input digest is unchanged."""
+
+    with trace.span("render.job", host=host, profile=profile, engine=engine) as info:
+        outcome = _render_job(engine, host, profile, force=force, capture=capture)
+        info.update(ok=outcome.ok, skipped=outcome.skipped)
+    return outcome
+
+
+def _render_job(engine: str, host: str, profile: str, *, force: bool, capture: bool) -> RenderOutcome:
+    started = time.perf_counter()
+    with trace.span("render.digest") as info:
+        inputs = render_cache.collect_inputs(host, profile)
+        up_to_date = inputs is not None and not force and render_cache.is_up_to_date(inputs)
+        info["up_to_date"] = up_to_date
+    if inputs is not None:
+        if up_to_date:
+            log = f"Up to date {inputs.output_dir.relative_to(REPO_ROOT)}\n"
+            return RenderOutcome(host, True, time.perf_counter() - started, log, skipped=True)
+        render_cache.invalidate(inputs.config_name)
+    if engine == "native":
+        from lib import render
+
+        try:
+            result = render.render_target(host, profile=profile)
+        except Exception as exc:  # one failing host must not hide the others
+            ok, log = False, f"[!] {host}: {exc}\n"
+        else:
+            ok, log = True, f"Rendered {result.output_dir.relative_to(REPO_ROOT)}\n"
+    else:
+        with trace.span("ansible.playbook"):
+            proc = subprocess.run(
+                ansible_render_command(),
+                cwd=PLAYBOOK_DIR,
+                env={**os.environ, "HOST": host, "PROFILE": profile},
+                stdout=subprocess.PIPE if capture else None,
+                stderr=subprocess.STDOUT if capture else None,
+                text=True,
+            )
+        ok, log = proc.returncode == 0, proc.stdout or ""
+    if ok and inputs is not None:
+        render_cache.record(inputs)
+    return RenderOutcome(target=host, ok=ok, duration=time.perf_counter() - started, log=log)
+
+
+def default_jobs() -> int:
+    return os.cpu_count() or 1
+
+
+def print_outcome_table(outcomes: Sequence[RenderOutcome]) -> None:
+    rows = [
+        (
+            outcome.target,
+            "À JOUR" if outcome.skipped else "OK" if outcome.ok else "ÉCHEC",
+            f"{outcome.duration:.2f}s",
+        )
+        for outcome in outcomes
+    ]
+    headers = ("Cible", "Statut", "Durée")
+    widths = [max(len(header), *(len(row[index]) for row in rows)) for index, header in enumerate(headers)]
+    print(" | ".join(header.ljust(width) for header, width in zip(headers, widths)))
+    print("-+-".join("-" * width for width in widths))
+    for row in rows:
+        print(" | ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+def render_targets(
+    engine: str,
+    hosts: Sequence[str],
+    profiles: Sequence[str] = (),
+    *,
+    jobs: int | None = None,
+    force: bool = False,
+) -> None:
+    """Render targets through a bounded process pool, replaying logs in order."""
+
+    if engine == "native":
+        try:
+            from lib import render  # fail fast before spawning workers
+        except ImportError as exc:
+            raise SystemExit(f"Le moteur natif nécessite Jinja2 ({exc}). Utilisez --engine ansible.") from exc
+    targets = [(host, "") for host in hosts] + [(profile, profile) for profile in profiles]
+    workers = max(1, min(jobs or default_jobs(), len(targets)))
+    if len(targets) == 1:
+        host, profile = targets[0]
+        outcomes = [render_job(engine, host, profile, force=force, capture=False)]
+    elif workers == 1:
+        outcomes = [render_job(engine, host, profile, force=force) for host, profile in targets]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(render_job, engine, host, profile, force=force) for host, profile in targets
+            ]
+            outcomes = [future.result() for future in futures]
+
+    for outcome in outcomes:
+        if outcome.log:
+            sys.stdout.write(outcome.log if outcome.log.endswith("\n") else outcome.log + "\n")
+    failed = [outcome.target for outcome in outcomes if not outcome.ok]
+    if len(outcomes) > 1:
+        print()
+        print_outcome_table(outcomes)
+    sys.stdout.flush()
+    if failed:
+        raise SystemExit(f"Rendu en échec pour : {', '.join(failed)}")
+
+
+def batch_targets(scope: str, matrix: str | None = None) -> list[tuple[str, str]]:
+    """Return ``(scope, target)`` pairs from a CI matrix or the whole inventory."""
+
+    if matrix:
+        try:
+            entries = json.loads(matrix)
+            return [(str(entry["scope"]), str(entry["target"])) for entry in entries]
+        except (ValueError, TypeError, KeyError) as exc:
+            raise SystemExit(f"Matrice invalide : {exc}") from exc
+    targets: list[tuple[str, str]] = []
+    if scope in {"all", "hardware"}:
+        targets.extend(("hardware", profile) for profile in list_profiles())
+    if scope in {"all", "host"}:
+        targets.extend(("host", host) for host in list_hosts())
+    return targets
+
+
+def render_batch(targets: Sequence[tuple[str, str]], output_root: Path) -> list[dict[str, object]]:
+    """Render every target in this process with the native engine.
+
+    Hardware profiles and hosts without ``secrets.sops.yaml`` are rendered with
+    ``<secret:NAME>`` placeholders so that the whole profile set can be checked.
+    """
+
+    from lib import render
+
+    results: list[dict[str, object]] = []
+    for scope, name in targets:
+        started = time.perf_counter()
+        profile = name if scope == "hardware" else ""
+        entry: dict[str, object] = {"scope": scope, "target": name}
+        try:
+            with trace.span("render.job", host=name, scope=scope, engine="native"):
+                target = render.resolve_target(name, profile)
+                result = render.render_target(
+                    name, profile=profile, output_root=output_root, secrets_required=False
+                )
+        except Exception as exc:  # one failing target must not hide the others
+            entry.update(status="failed", error=str(exc))
+        else:
+            secrets_file = target.secrets_file
+            entry.update(
+                status="ok",
+                output_dir=str(result.output_dir),
+                files=[str(path) for path in result.files],
+                secrets=secrets_file is not None and secrets_file.is_file(),
+            )
+        entry["duration"] = round(time.perf_counter() - started, 4)
+        results.append(entry)
+    return results
+
+
+def cmd_render_profiles(args: argparse.Namespace) -> None:
+    try:
+        from lib import render  # fail fast with a readable message
+    except ImportError as exc:
+        raise SystemExit(f"Le rendu groupé nécessite Jinja2 ({exc}).") from exc
+    targets = batch_targets(args.scope, args.matrix)
+    if not targets:
+        raise SystemExit("Aucune cible à rendre")
+    output_root = Path(args.output_dir).resolve() if args.output_dir else BATCH_OUTPUT_ROOT
+    started = time.perf_counter()
+    results = render_batch(targets, output_root)
+    failed = [entry for entry in results if entry["status"] != "ok"]
+    summary = {
+        "engine": "native",
+        "output_root": str(output_root),
+        "total": len(results),
+        "failed": len(failed),
+        "duration": round(time.perf_counter() - started, 4),
+        "targets": results,
+    }
+    summary_path = Path(args.summary) if args.summary else output_root / "render-summary.json"
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    summary_path.write_text(json.dumps(summary, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+    for entry in failed:
+        print(f"[!] {entry['scope']}/{entry['target']}: {entry['error']}")
+    print_outcome_table(
+        [
+            RenderOutcome(
+                target=f"{entry['scope']}/{entry['target']}",
+                ok=entry["status"] == "ok",
+                duration=float(entry["duration"]),
+                log="",
+            )
+            for entry in results
+        ]
+    )
+    print(f"\nRésumé JSON : {summary_path}")
+    if failed:
+        raise SystemExit(f"{len(failed)} cible(s) sur {len(results)} en échec")
+
+
 def cmd_render(args: argparse.Namespace) -> None:
     ensure_hosts_exist(args.hosts)
-    for host in args.hosts:
-        run_make("baremetal/gen", variables={"HOST": host})
+    render_targets(args.engine, args.hosts, args.profiles, jobs=args.jobs, force=args.force)
+
+
+def watch_roots() -> list[Path]:
+    return [*inventory.iter_inventory_roots(), render_cache.TEMPLATES_ROOT]
+
+
+def dependency_index(hosts: Iterable[str]) -> dict[Path, set[str]]:
+    """Map every render input to the hosts that read it."""
+
+    index: dict[Path, set[str]] = {}
+    for host in hosts:
+        resolved = render_cache.input_files(host)
+        if resolved is None:
+            continue
+        for path in resolved[1]:
+            index.setdefault(path, set()).add(host)
+    return index
+
+
+def affected_hosts(changed: set[Path] | None, hosts: Sequence[str], index: dict[Path, set[str]]) -> list[str]:
+    """Return the hosts whose render depends on one of the ``changed`` paths."""
+
+    if changed is None:
+        return list(hosts)
+    affected: set[str] = set()
+    profiles: set[str] = set()
+    for path in changed:
+        if path in index:
+            affected |= index[path]
+            continue
+        if path.is_relative_to(render_cache.TEMPLATES_ROOT) or "group_vars" in path.parts:
+            return list(hosts)
+        if path.parent.parts[-2:] == ("profiles", "hardware") and path.suffix in inventory.PROFILE_SUFFIXES:
+            # a profile added, removed or shadowed in another root is not in the index
+            profiles.add(path.stem)
+            continue
+        if "host_vars" in path.parts:
+            position = path.parts.index("host_vars") + 1
+            if position < len(path.parts) and path.parts[position] in hosts:
+                affected.add(path.parts[position])
+    if profiles:
+        users = query.hosts(query.Comparison("hardware_profile", tuple(sorted(profiles))))
+        affected.update(host.name for host in users)
+    return [host for host in hosts if host in affected]
+
+
+def cmd_watch(args: argparse.Namespace) -> None:
+    roots = watch_roots()
+    watcher = watch.open_watcher(roots)
+    mode = "inotify" if isinstance(watcher, watch.InotifyWatcher) else "scrutation"
+    print(f"Surveillance ({mode}) de : " + ", ".join(str(root) for root in roots if root.is_dir()))
+    print("Ctrl+C pour quitter.")
+    sys.stdout.flush()
+    try:
+        while True:
+            hosts = args.hosts or list_hosts()
+            index = dependency_index(hosts)
+            changed = watch.wait_for_changes(watcher, args.debounce / 1000)
+            hosts = args.hosts or list_hosts()
+            targets = affected_hosts(changed, hosts, index)
+            if not targets:
+                continue
+            started = time.perf_counter()
+            print(f"\n[{time.strftime('%H:%M:%S')}] Modification détectée → {', '.join(targets)}")
+            for host in targets:
+                outcome = render_job(args.engine, host)
+                status = "À JOUR" if outcome.skipped else "OK" if outcome.ok else "ÉCHEC"
+                if not outcome.ok and outcome.log:
+                    sys.stdout.write(outcome.log if outcome.log.endswith("\n") else outcome.log + "\n")
+                print(f"  {host:<24} {status:<6} {outcome.duration * 1000:8.1f} ms")
+            print(f"  {len(targets)} hôte(s) rendu(s) en {(time.perf_counter() - started) * 1000:.1f} ms")
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        watcher.close()
 
 
 def cmd_seed(args: argparse.Namespace) -> None:
-    ensure_hosts_exist([args.host])
-    run_make("baremetal/seed", variables={"HOST": args.host})
+    hosts = list(dict.fromkeys(args.hosts))
+    if not args.no_render:
+        ensure_hosts_exist(hosts)
+        render_targets(args.engine, hosts, jobs=args.jobs, force=args.force)
+    images = []
+    for host in hosts:
+        host_dir = render_cache.GENERATED_ROOT / host
+        try:
+            files = iso9660.seed_files(host_dir)
+        except FileNotFoundError as exc:
+            raise SystemExit(f"{exc}. Lancez : make baremetal/gen HOST={host}") from exc
+        images.append(iso9660.SeedImage(output=host_dir / f"seed-{host}.iso", files=files))
+    try:
+        moment = reproducible.timestamp(reproducible.source_date_epoch())
+    except ValueError as exc:
+        raise SystemExit(str(exc)) from exc
+    started = time.perf_counter()
+    with trace.span("iso.seed", hosts=len(images)):
+        written = iso9660.write_seed_isos(images, timestamp=moment)
+    for path, sums in written:
+        print(f"Created {path.relative_to(REPO_ROOT / 'baremetal')} (sha256 {sums.sha256})")
+    if len(written) > 1:
+        print(f"{len(written)} ISO(s) seed en {time.perf_counter() - started:.2f}s")
+
+
+def full_iso_jobs(hosts: Sequence[str], ubuntu_iso: Path) -> list[io_scheduler.IoJob]:
+    """One ``make_full_iso.sh`` job per host, sized after the Ubuntu ISO."""
+
+    estimated = ubuntu_iso.stat().st_size + FULL_ISO_OVERHEAD
+    jobs = []
+    for host in hosts:
+        output = render_cache.GENERATED_ROOT / host / f"ubuntu-autoinstall-{host}.iso"
+        jobs.append(
+            io_scheduler.IoJob(
+                name=host,
+                command=["bash", str(FULL_ISO_SCRIPT), host, str(ubuntu_iso)],
+                output=output,
+                estimated_size=estimated,
+                cwd=REPO_ROOT,
+                # make_full_iso.sh writes <iso>.partial and renames it when done
+                progress_path=output.with_name(output.name + ".partial"),
+            )
+        )
+    return jobs
+
+
+def print_build_table(results: Sequence[io_scheduler.IoJobResult]) -> None:
+    rows = [
+        (
+            result.name,
+            "OK" if result.ok else "ÉCHEC",
+            f"{result.duration:.1f}s",
+            io_scheduler.format_size(result.size),
+            f"{io_scheduler.format_size(result.rate)}/s" if result.ok else result.error,
+        )
+        for result in results
+    ]
+    headers = ("Cible", "Statut", "Durée", "Taille", "Débit")
+    widths = [max(len(header), *(len(row[index]) for row in rows)) for index, header in enumerate(headers)]
+    print(" | ".join(header.ljust(width) for header, width in zip(headers, widths)))
+    print("-+-".join("-" * width for width in widths))
+    for row in rows:
+        print(" | ".join(cell.ljust(width) for cell, width in zip(row, widths)))
 
 
 def cmd_full(args: argparse.Namespace) -> None:
-    ensure_hosts_exist([args.host])
-    variables = {"HOST": args.host, "UBUNTU_ISO": args.ubuntu_iso}
-    run_make("baremetal/fulliso", variables=variables)
+    hosts = list(dict.fromkeys(args.hosts))
+    ensure_hosts_exist(hosts)
+    ubuntu_iso = Path(args.ubuntu_iso).expanduser().resolve()
+    if not ubuntu_iso.is_file():
+        raise SystemExit(f"ISO Ubuntu introuvable : {ubuntu_iso}")
+    if len(hosts) == 1 and not args.render:
+        run_make("baremetal/fulliso", variables={"HOST": hosts[0], "UBUNTU_ISO": str(ubuntu_iso)})
+        return
+    render_targets(args.engine, hosts, jobs=args.render_jobs, force=args.force)
+    scheduler = io_scheduler.IoScheduler(
+        max_jobs=args.jobs or FULL_ISO_DEFAULT_JOBS,
+        write_budget=args.write_budget * 1024 * 1024 if args.write_budget else None,
+    )
+    started = time.perf_counter()
+    with trace.span("iso.full", hosts=len(hosts), jobs=scheduler.max_jobs):
+        results = scheduler.run(full_iso_jobs(hosts, ubuntu_iso))
+    for result in results:
+        if not result.ok and result.log:
+            print(f"\n--- {result.name} ---")
+            sys.stdout.write(result.log if result.log.endswith("\n") else result.log + "\n")
+    print()
+    print_build_table(results)
+    total = time.perf_counter() - started
+    written = sum(result.size for result in results if result.ok)
+    print(f"{len(results)} ISO(s) en {total:.1f}s ({io_scheduler.format_size(written / total if total else 0)}/s agrégés)")
+    failed = [result.name for result in results if not result.ok]
+    if failed:
+        raise SystemExit(f"Construction en échec pour : {', '.join(failed)}")
+
+
+def cmd_checksum(args: argparse.Namespace) -> None:
+    for name in args.files:
+        path = Path(name)
+        if not path.is_file():
+            raise SystemExit(f"Fichier introuvable : {path}")
+        sums = checksums.of_file(path, blake2=args.blake2 or None)
+        checksums.record(path, sums)
+        for line in checksums.summary_lines(sums):
+            print(f"  {line}")
 
 
 def cmd_multi(args: argparse.Namespace) -> None:
     ensure_hosts_exist(args.hosts)
     if args.render:
-        for host in args.hosts:
-            run_make("baremetal/gen", variables={"HOST": host})
+        render_targets(args.engine, args.hosts, jobs=args.jobs, force=args.force)
     variables = {
         "HOSTS": " ".join(args.hosts),
         "UBUNTU_ISO": args.ubuntu_iso,
@@ -59,6 +469,8 @@ def cmd_multi(args: argparse.Namespace) -> None:
     }
     if args.default_host:
         variables["DEFAULT_HOST"] = args.default_host
+    if args.incremental:
+        variables["INCREMENTAL"] = "1"
     run_make("baremetal/multiiso", variables=variables)
 
 
@@ -68,34 +480,151 @@ def cmd_list_hosts(_: argparse.Namespace) -> None:
 
 
 def list_hosts() -> list[str]:
-    discovered: set[str] = set()
-    for root in inventory.iter_inventory_roots():
-        host_root = root / "host_vars"
-        if not host_root.exists():
-            continue
-        for entry in host_root.iterdir():
-            if not entry.is_dir() or entry.name.startswith("."):
-                continue
-            if any((entry / candidate).is_file() for candidate in ("main.yml", "main.yaml")):
-                discovered.add(entry.name)
-    return sorted(discovered)
+    return [host.name for host in model.hosts()]
+
+
+def list_profiles() -> list[str]:
+    return [profile.name for profile in model.profiles()]
 
 
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Automation CLI for Ubuntu autoinstall ISO workflows")
+    parser.add_argument(
+        "--trace",
+        metavar="FICHIER",
+        help="Écrire une trace JSON des durées par phase, hôte et template (équivaut à AUTOINSTALL_TRACE=FICHIER)",
+    )
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     render = subparsers.add_parser("render", help="Rendre user-data/meta-data pour un ou plusieurs hôtes")
-    render.add_argument("--host", dest="hosts", action="append", required=True, help="Nom d'hôte à rendre (option répétable)")
+    render.add_argument("--host", dest="hosts", action="append", default=[], help="Nom d'hôte à rendre (option répétable)")
+    render.add_argument(
+        "--profile",
+        dest="profiles",
+        action="append",
+        default=[],
+        help="Profil matériel (ou hôte) à rendre comme PROFILE=... (option répétable)",
+    )
+    render.add_argument(
+        "--engine",
+        choices=("ansible", "native"),
+        default="ansible",
+        help="Moteur de rendu : playbook Ansible (défaut) ou rendu Jinja2 natif en processus",
+    )
+    render.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Nombre de rendus parallèles (défaut : nombre de CPU)",
+    )
+    render.add_argument(
+        "--force",
+        action="store_true",
+        help="Ignorer le cache d'empreintes et rendre même si les entrées n'ont pas changé",
+    )
     render.set_defaults(func=cmd_render)
 
-    seed = subparsers.add_parser("seed", help="Construire une ISO seed (CIDATA) pour un hôte")
-    seed.add_argument("--host", required=True, help="Nom d'hôte")
+    batch = subparsers.add_parser(
+        "render-profiles",
+        help="Rendre tous les profils matériels et hôtes dans un seul processus (validation CI)",
+    )
+    batch.add_argument(
+        "--scope",
+        choices=("all", "hardware", "host"),
+        default="all",
+        help="Cibles à rendre lorsque --matrix n'est pas fourni (défaut : all)",
+    )
+    batch.add_argument(
+        "--matrix",
+        help="Matrice JSON produite par scripts/ci/select-baremetal-targets.py ([{\"scope\": ..., \"target\": ...}])",
+    )
+    batch.add_argument(
+        "--output-dir",
+        help="Répertoire racine des artefacts (défaut : .cache/render-profiles, jamais generated/)",
+    )
+    batch.add_argument("--summary", help="Fichier du résumé JSON (défaut : <output-dir>/render-summary.json)")
+    batch.set_defaults(func=cmd_render_profiles)
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help="Surveiller inventaire, overlay et templates et rerendre les hôtes concernés",
+    )
+    watch_parser.add_argument(
+        "--host",
+        dest="hosts",
+        action="append",
+        default=[],
+        help="Limiter la surveillance à cet hôte (option répétable, défaut : tous)",
+    )
+    watch_parser.add_argument(
+        "--engine",
+        choices=("ansible", "native"),
+        default="native",
+        help="Moteur de rendu (natif par défaut pour un retour immédiat)",
+    )
+    watch_parser.add_argument(
+        "--debounce",
+        type=int,
+        default=200,
+        help="Délai de regroupement des modifications en millisecondes (défaut : 200)",
+    )
+    watch_parser.set_defaults(func=cmd_watch)
+
+    seed = subparsers.add_parser("seed", help="Construire une ISO seed (CIDATA) par hôte, sans xorriso")
+    seed.add_argument("--host", dest="hosts", action="append", required=True, help="Nom d'hôte (option répétable)")
+    seed.add_argument(
+        "--no-render",
+        action="store_true",
+        help="Utiliser user-data/meta-data déjà présents dans generated/ sans relancer le rendu",
+    )
+    seed.add_argument(
+        "--engine",
+        choices=("ansible", "native"),
+        default="ansible",
+        help="Moteur de rendu (ansible par défaut)",
+    )
+    seed.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Nombre de rendus parallèles (défaut : nombre de CPU)",
+    )
+    seed.add_argument("--force", action="store_true", help="Ignorer le cache d'empreintes lors du rendu")
     seed.set_defaults(func=cmd_seed)
 
-    full = subparsers.add_parser("full", help="Construire une ISO complète pour un hôte")
-    full.add_argument("--host", required=True, help="Nom d'hôte")
+    full = subparsers.add_parser("full", help="Construire une ISO complète par hôte")
+    full.add_argument("--host", dest="hosts", action="append", required=True, help="Nom d'hôte (option répétable)")
     full.add_argument("--ubuntu-iso", required=True, help="Chemin vers l'ISO Ubuntu officielle")
+    full.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help=f"Nombre maximal d'ISO écrites en parallèle (défaut : {FULL_ISO_DEFAULT_JOBS})",
+    )
+    full.add_argument(
+        "--write-budget",
+        type=int,
+        default=0,
+        help="Débit d'écriture cumulé à ne pas dépasser, en Mo/s (défaut : 0, illimité)",
+    )
+    full.add_argument(
+        "--render",
+        action="store_true",
+        help="Rendre user-data/meta-data avant la construction (toujours fait pour plusieurs hôtes)",
+    )
+    full.add_argument(
+        "--engine",
+        choices=("ansible", "native"),
+        default="ansible",
+        help="Moteur de rendu (ansible par défaut)",
+    )
+    full.add_argument(
+        "--render-jobs",
+        type=int,
+        default=None,
+        help="Nombre de rendus parallèles (défaut : nombre de CPU)",
+    )
+    full.add_argument("--force", action="store_true", help="Ignorer le cache d'empreintes lors du rendu")
     full.set_defaults(func=cmd_full)
 
     multi = subparsers.add_parser("multi", help="Construire une ISO multi-hôtes avec menu GRUB")
@@ -105,8 +634,38 @@ def build_parser() -> argparse.ArgumentParser:
     multi.add_argument("--default-host", help="Entrée GRUB sélectionnée par défaut")
     multi.add_argument("--timeout", type=int, default=10, help="Timeout du menu GRUB (secondes)")
     multi.add_argument("--render", action="store_true", help="Rendre user-data/meta-data avant la construction")
+    multi.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Patcher l'ISO précédente (nouvelle session /nocloud + grub.cfg) au lieu de tout reconstruire",
+    )
+    multi.add_argument(
+        "--engine",
+        choices=("ansible", "native"),
+        default="ansible",
+        help="Moteur utilisé par --render (ansible par défaut)",
+    )
+    multi.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Nombre de rendus parallèles pour --render (défaut : nombre de CPU)",
+    )
+    multi.add_argument("--force", action="store_true", help="Ignorer le cache d'empreintes lors de --render")
     multi.set_defaults(func=cmd_multi)
 
+    checksum = subparsers.add_parser(
+        "checksum",
+        help="Calculer taille et empreintes d'artefacts en une lecture (.sha256, .b2, checksums.json)",
+    )
+    checksum.add_argument("files", nargs="+", help="Fichiers à empreinter")
+    checksum.add_argument(
+        "--blake2",
+        action="store_true",
+        help="Ajouter BLAKE2b (également activé par AUTOINSTALL_BLAKE2=1)",
+    )
+    checksum.set_defaults(func=cmd_checksum)
+
     subparsers.add_parser("list-hosts", help="Lister les hôtes disponibles").set_defaults(func=cmd_list_hosts)
 
     return parser
@@ -115,12 +674,15 @@ def build_parser() -> argparse.ArgumentParser:
 def main(argv: Sequence[str]) -> int:
     parser = build_parser()
     args = parser.parse_args(argv)
-    if args.command != "list-hosts" and "hosts" in args.__dict__:
+    if args.command not in {"list-hosts", "watch"} and "hosts" in args.__dict__:
         args.hosts = [host for host in args.hosts if host]
-        if not args.hosts:
+        args.profiles = [profile for profile in getattr(args, "profiles", []) if profile]
+        if not args.hosts and not args.profiles:
             raise SystemExit("Aucun hôte fourni")
     try:
-        args.func(args)
+        with trace.session(Path(args.trace) if args.trace else None), sops.cache_session():
+            with trace.span(f"iso_manager.{args.command}"):
+                args.func(args)
     except subprocess.CalledProcessError as exc:
         return exc.returncode or 1
     return 0
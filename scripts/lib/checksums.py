@@ -0,0 +1,138 @@
+"""Size and digests of built artefacts, computed in a single pass.
+
+Every ISO gets ``<name>.sha256`` (``sha256sum -c`` format), ``<name>.b2``
+(``b2sum -c``) when BLAKE2 is enabled, and an entry in the ``checksums.json``
+of its directory with the byte size, which is what checking a flashed device
+needs (``head -c <size> /dev/sdX | sha256sum``).
+
+Run as a script (``python3 scripts/lib/checksums.py FILE...``) it records the
+given files; the shell builders use it this way, without starting
+``iso_manager.py`` and its inventory and SOPS setup.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable, Sequence
+
+BLAKE2_ENV = "AUTOINSTALL_BLAKE2"
+INDEX_NAME = "checksums.json"
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class Checksums:
+    size: int
+    sha256: str
+    blake2b: str | None = None
+
+    def as_dict(self) -> dict[str, object]:
+        return {key: value for key, value in asdict(self).items() if value is not None}
+
+
+def blake2_enabled() -> bool:
+    return os.environ.get(BLAKE2_ENV, "").lower() in {"1", "yes", "true"}
+
+
+def _hashers(blake2: bool | None) -> list:
+    hashers = [hashlib.sha256()]
+    if blake2_enabled() if blake2 is None else blake2:
+        hashers.append(hashlib.blake2b())
+    return hashers
+
+
+def _result(size: int, hashers: list) -> Checksums:
+    return Checksums(
+        size=size,
+        sha256=hashers[0].hexdigest(),
+        blake2b=hashers[1].hexdigest() if len(hashers) > 1 else None,
+    )
+
+
+def of_chunks(chunks: Iterable[bytes], *, blake2: bool | None = None) -> Checksums:
+    """Digest ``chunks`` once, feeding every enabled algorithm from the same buffer."""
+
+    hashers = _hashers(blake2)
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        for hasher in hashers:
+            hasher.update(chunk)
+    return _result(size, hashers)
+
+
+def of_bytes(data: bytes, *, blake2: bool | None = None) -> Checksums:
+    return of_chunks([data], blake2=blake2)
+
+
+def of_file(path: Path, *, blake2: bool | None = None) -> Checksums:
+    """Digest ``path`` in one sequential read."""
+
+    with open(path, "rb", buffering=0) as handle:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(handle.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        buffer = bytearray(CHUNK_SIZE)
+        view = memoryview(buffer)
+
+        def chunks() -> Iterable[bytes]:
+            while True:
+                count = handle.readinto(buffer)
+                if not count:
+                    return
+                yield view[:count]
+
+        return of_chunks(chunks(), blake2=blake2)
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    partial = path.with_name(f".{path.name}.{os.getpid()}")
+    partial.write_text(content, encoding="utf-8")
+    os.replace(partial, path)
+
+
+def record(path: Path, checksums: Checksums) -> None:
+    """Write the sidecar files of ``path`` and its entry in ``checksums.json``."""
+
+    _write_atomic(path.with_name(path.name + ".sha256"), f"{checksums.sha256}  {path.name}\n")
+    blake2_file = path.with_name(path.name + ".b2")
+    if checksums.blake2b:
+        _write_atomic(blake2_file, f"{checksums.blake2b}  {path.name}\n")
+    else:
+        blake2_file.unlink(missing_ok=True)
+    index_path = path.with_name(INDEX_NAME)
+    try:
+        index = json.loads(index_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        index = {}
+    index[path.name] = checksums.as_dict()
+    _write_atomic(index_path, json.dumps(index, indent=2, sort_keys=True) + "\n")
+
+
+def summary_lines(checksums: Checksums) -> list[str]:
+    lines = [f"Size: {checksums.size} bytes", f"SHA256: {checksums.sha256}"]
+    if checksums.blake2b:
+        lines.append(f"BLAKE2b: {checksums.blake2b}")
+    return lines
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Record the size and digests of artefacts in one read")
+    parser.add_argument("files", nargs="+", type=Path, help="Files to digest")
+    parser.add_argument("--blake2", action="store_true", help=f"Also record BLAKE2b (same as {BLAKE2_ENV}=1)")
+    args = parser.parse_args(argv)
+    for path in args.files:
+        if not path.is_file():
+            raise SystemExit(f"File not found: {path}")
+        sums = of_file(path, blake2=args.blake2 or None)
+        record(path, sums)
+        for line in summary_lines(sums):
+            print(f"  {line}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import os
+import sqlite3
+import stat
+from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List
+from typing import Iterable, List, Mapping, Sequence
 
 REPO_ROOT = Path(__file__).resolve().parents[2]
 DEFAULT_OVERLAY = REPO_ROOT / "baremetal" / "inventory-local"
@@ -54,3 +57,379 @@ def first_existing(paths: Iterable[Path]) -> Path | None:
         if path.exists():
             return path
     return None
+
+
+def find_hardware_profile(name: str, include_overlay: bool = True) -> Path | None:
+    """Return the hardware profile file for ``name`` (overlay first, .yml before .yaml)."""
+
+    return first_existing(
+        root / f"{name}{suffix}"
+        for root in hardware_profiles_roots(include_overlay=include_overlay)
+        for suffix in (".yml", ".yaml")
+    )
+
+
+def find_host_vars_file(host: str, include_overlay: bool = True) -> Path | None:
+    """Return the ``main.yml``/``main.yaml`` file for ``host`` (overlay first)."""
+
+    return first_existing(
+        directory / filename
+        for directory in host_vars_candidates(host, include_overlay=include_overlay)
+        for filename in ("main.yml", "main.yaml")
+    )
+
+
+# Persistent inventory index
+# ---------------------------
+# host_vars/ and profiles/hardware/ of every root are mirrored in a SQLite
+# database under .cache/. A refresh only stats directories and files: a
+# directory whose mtime is unchanged is not listed again, and a file is parsed
+# again only when its size or mtime changed. Whole documents are loaded by
+# lib/model.py when a caller needs more than the summary fields. Every summary
+# column has a secondary index so that lib/query.py can answer comparisons
+# without scanning the table.
+
+INDEX_PATH = REPO_ROOT / ".cache" / "inventory-index.sqlite"
+INDEX_VERSION = 2
+HOST_VARS_FILES = ("main.yml", "main.yaml")
+PROFILE_SUFFIXES = (".yml", ".yaml")
+HOST_KIND = "host"
+PROFILE_KIND = "profile"
+# first-level scalars copied into their own columns
+SUMMARY_FIELDS = (
+    "hostname",
+    "hardware_profile",
+    "netmode",
+    "hardware_model",
+    "storage_profile",
+    "nic",
+    "disk_device",
+)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    kind TEXT NOT NULL,
+    root TEXT NOT NULL,
+    name TEXT NOT NULL,
+    dir_mtime_ns INTEGER,
+    path TEXT,
+    mtime_ns INTEGER,
+    size INTEGER,
+    {", ".join(f"{field} TEXT" for field in SUMMARY_FIELDS)},
+    error TEXT,
+    PRIMARY KEY (kind, root, name)
+);
+{"".join(f"CREATE INDEX IF NOT EXISTS entries_{field} ON entries (kind, root, {field});" for field in SUMMARY_FIELDS)}
+"""
+# bound parameters per "name IN (...)" lookup
+_NAME_CHUNK = 500
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    """One host (``host_vars/<name>/main.yml``) or hardware profile of the index."""
+
+    kind: str
+    name: str
+    root: Path
+    location: str
+    fields: Mapping[str, str | None]
+    error: str | None
+
+    @property
+    def path(self) -> Path:
+        return Path(self.location)
+
+    def get(self, key: str) -> str | None:
+        """First-level scalar ``key`` as text (``None`` when absent, empty or not a scalar)."""
+
+        return self.fields.get(key)
+
+
+def scalar_text(value: object) -> str | None:
+    """Text of a first-level scalar as the listings show it; None for empty or nested values."""
+
+    if value is None or value == "" or isinstance(value, (dict, list)):
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _parse(path: str) -> tuple[dict[str, str | None], str | None]:
+    """Return ``(summary fields, error)`` for ``path``."""
+
+    from . import yamlio
+
+    try:
+        content = yamlio.load_file(path)
+    except (OSError, yamlio.YAMLError) as exc:
+        return {}, f"{path}: {exc}"
+    if content is None:
+        content = {}
+    if not isinstance(content, dict):
+        return {}, f"{path} must contain a YAML mapping"
+    return {field: scalar_text(content.get(field)) for field in SUMMARY_FIELDS}, None
+
+
+def _absolute(roots: Sequence[Path] | None) -> list[Path]:
+    return [Path(root).absolute() for root in (iter_inventory_roots() if roots is None else roots)]
+
+
+def _stat(path: str) -> os.stat_result | None:
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _first_file(candidates: Iterable[str]) -> tuple[str, os.stat_result] | tuple[None, None]:
+    for candidate in candidates:
+        status = _stat(candidate)
+        if status is not None and stat.S_ISREG(status.st_mode):
+            return candidate, status
+    return None, None
+
+
+class InventoryIndex:
+    """SQLite mirror of the inventory roots, refreshed incrementally on each query."""
+
+    def __init__(self, path: Path = INDEX_PATH) -> None:
+        self.path = path
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = self._open(str(path))
+        except (OSError, sqlite3.Error):
+            # read-only checkout or unusable cache: keep an in-memory index
+            self.connection = self._open(":memory:")
+
+    @staticmethod
+    def _open(target: str) -> sqlite3.Connection:
+        connection = sqlite3.connect(target, timeout=30, isolation_level=None)
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            connection.executescript("DROP TABLE IF EXISTS directories; DROP TABLE IF EXISTS entries;")
+            connection.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def hosts(self, roots: Sequence[Path] | None = None) -> list[IndexEntry]:
+        """Hosts of ``roots`` (default: overlay then repository), first root winning, sorted by name."""
+
+        return self._entries(HOST_KIND, roots)
+
+    def profiles(self, roots: Sequence[Path] | None = None) -> list[IndexEntry]:
+        """Hardware profiles of ``roots``, first root winning, sorted by name."""
+
+        return self._entries(PROFILE_KIND, roots)
+
+    def refresh(self, roots: Sequence[Path] | None = None) -> None:
+        """Bring hosts and hardware profiles of ``roots`` up to date without returning them."""
+
+        for root in _absolute(roots):
+            self._refresh(HOST_KIND, root)
+            self._refresh(PROFILE_KIND, root)
+
+    def match(self, kind: str, condition: str, params: Sequence[object] = (), roots: Sequence[Path] | None = None) -> set[str]:
+        """Names of the ``kind`` entries of ``roots`` whose row satisfies the SQL ``condition``.
+
+        ``condition`` is evaluated on the ``entries`` columns and is meant to be
+        served by the secondary indexes. Only the entry of the first root
+        declaring a name is considered. The index is not refreshed: call
+        :meth:`refresh` first.
+        """
+
+        roots = _absolute(roots)
+        names: set[str] = set()
+        for rank, root in enumerate(roots):
+            earlier = [str(previous) for previous in roots[:rank]]
+            shadowed = ""
+            if earlier:
+                shadowed = (
+                    " AND NOT EXISTS (SELECT 1 FROM entries s WHERE s.kind = e.kind"
+                    f" AND s.root IN ({', '.join('?' * len(earlier))}) AND s.name = e.name AND s.path IS NOT NULL)"
+                )
+            rows = self.connection.execute(
+                f"SELECT e.name FROM entries e WHERE e.kind = ? AND e.root = ? AND e.path IS NOT NULL"
+                f" AND ({condition}){shadowed}",
+                (kind, str(root), *params, *earlier),
+            )
+            names.update(row[0] for row in rows)
+        return names
+
+    def fetch(self, kind: str, names: Iterable[str], roots: Sequence[Path] | None = None) -> list[IndexEntry]:
+        """Entries of ``kind`` called ``names`` (first root winning), sorted by name, without refreshing."""
+
+        return self._collect(kind, _absolute(roots), sorted(set(names)))
+
+    def _entries(self, kind: str, roots: Sequence[Path] | None) -> list[IndexEntry]:
+        roots = _absolute(roots)
+        for root in roots:
+            self._refresh(kind, root)
+        return self._collect(kind, roots)
+
+    def _collect(self, kind: str, roots: Sequence[Path], names: Sequence[str] | None = None) -> list[IndexEntry]:
+        query = (
+            f"SELECT name, path, {', '.join(SUMMARY_FIELDS)}, error"
+            " FROM entries WHERE kind = ? AND root = ? AND path IS NOT NULL"
+        )
+        merged: dict[str, IndexEntry] = {}
+        for root in roots:
+            if names is None:
+                batches = [self.connection.execute(query, (kind, str(root)))]
+            else:
+                batches = [
+                    self.connection.execute(
+                        f"{query} AND name IN ({', '.join('?' * len(chunk))})", (kind, str(root), *chunk)
+                    )
+                    for chunk in (names[start : start + _NAME_CHUNK] for start in range(0, len(names), _NAME_CHUNK))
+                ]
+            for rows in batches:
+                for name, location, *values in rows:
+                    if name in merged:
+                        continue
+                    *fields, error = values
+                    merged[name] = IndexEntry(kind, name, root, location, dict(zip(SUMMARY_FIELDS, fields)), error)
+        return [merged[name] for name in sorted(merged)]
+
+    def _refresh(self, kind: str, root: Path) -> None:
+        directory = os.path.join(root, "host_vars") if kind == HOST_KIND else os.path.join(root, "profiles", "hardware")
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            stored = {
+                row[0]: row[1:]
+                for row in connection.execute(
+                    "SELECT name, dir_mtime_ns, path, mtime_ns, size FROM entries WHERE kind = ? AND root = ?",
+                    (kind, str(root)),
+                )
+            }
+            status = _stat(directory)
+            if status is not None and not stat.S_ISDIR(status.st_mode):
+                status = None
+            known = connection.execute("SELECT mtime_ns FROM directories WHERE path = ?", (directory,)).fetchone()
+            if status is None:
+                names: list[str] = []
+            elif known is not None and known[0] == status.st_mtime_ns:
+                names = list(stored)
+            elif kind == HOST_KIND:
+                names = [
+                    entry.name for entry in os.scandir(directory) if entry.is_dir() and not entry.name.startswith(".")
+                ]
+            else:
+                names = sorted(
+                    {
+                        name[: -len(suffix)]
+                        for name in os.listdir(directory)
+                        for suffix in PROFILE_SUFFIXES
+                        if name.endswith(suffix) and not name.startswith(".")
+                    }
+                )
+            refresh = self._refresh_host if kind == HOST_KIND else self._refresh_profile
+            seen = {name for name in names if refresh(root, directory, name, stored.get(name))}
+            for name in set(stored) - seen:
+                connection.execute(
+                    "DELETE FROM entries WHERE kind = ? AND root = ? AND name = ?", (kind, str(root), name)
+                )
+            if status is None:
+                connection.execute("DELETE FROM directories WHERE path = ?", (directory,))
+            elif known is None or known[0] != status.st_mtime_ns:
+                connection.execute(
+                    "INSERT OR REPLACE INTO directories (path, mtime_ns) VALUES (?, ?)",
+                    (directory, status.st_mtime_ns),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _refresh_host(self, root: Path, directory: str, name: str, stored: tuple | None) -> bool:
+        host_dir = f"{directory}/{name}"
+        preferred = f"{host_dir}/{HOST_VARS_FILES[0]}"
+        if stored is not None and stored[1] == preferred:
+            # main.yml shadows any other candidate: its own stat is enough
+            status = _stat(preferred)
+            if status is not None and (stored[2], stored[3]) == (status.st_mtime_ns, status.st_size):
+                return True
+        host_status = _stat(host_dir)
+        if host_status is None or not stat.S_ISDIR(host_status.st_mode):
+            return False
+        if stored is not None and stored[0] == host_status.st_mtime_ns and stored[1] != preferred:
+            # same directory listing: only the known main file can have changed
+            path, status = _first_file([stored[1]] if stored[1] else [])
+        else:
+            path, status = _first_file(f"{host_dir}/{filename}" for filename in HOST_VARS_FILES)
+        self._store(HOST_KIND, root, name, path, status, host_status.st_mtime_ns, stored)
+        return True
+
+    def _refresh_profile(self, root: Path, directory: str, name: str, stored: tuple | None) -> bool:
+        path, status = _first_file(f"{directory}/{name}{suffix}" for suffix in PROFILE_SUFFIXES)
+        if path is None:
+            return False
+        self._store(PROFILE_KIND, root, name, path, status, None, stored)
+        return True
+
+    def _store(
+        self,
+        kind: str,
+        root: Path,
+        name: str,
+        path: str | None,
+        status: os.stat_result | None,
+        dir_mtime_ns: int | None,
+        stored: tuple | None,
+    ) -> None:
+        """Parse ``path`` into the index unless the stored row still matches its size and mtime."""
+
+        if (
+            stored is not None
+            and stored[1] == path
+            and (status is None or (stored[2], stored[3]) == (status.st_mtime_ns, status.st_size))
+        ):
+            if stored[0] != dir_mtime_ns:
+                self.connection.execute(
+                    "UPDATE entries SET dir_mtime_ns = ? WHERE kind = ? AND root = ? AND name = ?",
+                    (dir_mtime_ns, kind, str(root), name),
+                )
+            return
+        fields, error = _parse(path) if path is not None else ({}, None)
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO entries (kind, root, name, dir_mtime_ns, path, mtime_ns, size,"
+            f" {', '.join(SUMMARY_FIELDS)}, error) VALUES ({', '.join('?' * (8 + len(SUMMARY_FIELDS)))})",
+            (
+                kind,
+                str(root),
+                name,
+                dir_mtime_ns,
+                path,
+                status.st_mtime_ns if status else None,
+                status.st_size if status else None,
+                *(fields.get(field) for field in SUMMARY_FIELDS),
+                error,
+            ),
+        )
+
+
+@lru_cache(maxsize=None)
+def get_index() -> InventoryIndex:
+    """Return the process-wide inventory index."""
+
+    return InventoryIndex()
+
+
+def indexed_hosts(roots: Sequence[Path] | None = None) -> list[IndexEntry]:
+    """Hosts declared under ``host_vars/`` (overlay first), from the persistent index."""
+
+    return get_index().hosts(roots)
+
+
+def indexed_profiles(roots: Sequence[Path] | None = None) -> list[IndexEntry]:
+    """Hardware profiles under ``profiles/hardware/`` (overlay first), from the persistent index."""
+
+    return get_index().profiles(roots)
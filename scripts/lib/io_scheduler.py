@@ -0,0 +1,236 @@
+"""Run disk-heavy build jobs concurrently within disk space and bandwidth limits.
+
+Each job is a subprocess producing one large output file (a full ISO). A job
+is started only when
+
+* fewer than ``max_jobs`` are running,
+* the free space of the output filesystem covers its estimated size on top of
+  what running jobs still have to write, and
+* the aggregate write rate of running jobs leaves room for one more job under
+  the optional ``write_budget`` (bytes/s), using the average rate observed so far.
+
+Progress is reported from the growth of the file each job is writing (its
+``progress_path``, usually ``<output>.partial``), never from a previous build
+left at the final path: stale outputs are deleted before a job starts.
+"""
+from __future__ import annotations
+
+import shutil
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Callable, Sequence
+
+DEFAULT_POLL_INTERVAL = 0.5
+DEFAULT_PROGRESS_INTERVAL = 2.0
+# Free space kept untouched so the builds never fill the filesystem.
+DEFAULT_SPACE_MARGIN = 512 * 1024 * 1024
+
+
+@dataclass
+class IoJob:
+    """A subprocess writing ``output`` (about ``estimated_size`` bytes).
+
+    ``progress_path`` is the file growing while the job runs, when the output
+    is written elsewhere and renamed at the end.
+    """
+
+    name: str
+    command: Sequence[str]
+    output: Path
+    estimated_size: int
+    cwd: Path | None = None
+    env: dict[str, str] | None = None
+    progress_path: Path | None = None
+
+    @property
+    def written_path(self) -> Path:
+        return self.progress_path or self.output
+
+
+@dataclass
+class IoJobResult:
+    name: str
+    ok: bool
+    duration: float
+    size: int
+    log: str
+    error: str = ""
+
+    @property
+    def rate(self) -> float:
+        return self.size / self.duration if self.duration > 0 else 0.0
+
+
+@dataclass
+class _Running:
+    job: IoJob
+    process: subprocess.Popen
+    log_file: IO[str]
+    started: float
+    last_size: int = 0
+    last_sample: float = 0.0
+    rate: float = 0.0
+
+
+def format_size(value: float) -> str:
+    for unit in ("o", "Ko", "Mo", "Go"):
+        if abs(value) < 1024 or unit == "Go":
+            return f"{value:.1f} {unit}" if unit != "o" else f"{int(value)} o"
+        value /= 1024
+    return f"{value:.1f} Go"
+
+
+def _output_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def _free_space(path: Path) -> int:
+    probe = path
+    while not probe.exists() and probe != probe.parent:
+        probe = probe.parent
+    return shutil.disk_usage(probe).free
+
+
+class IoScheduler:
+    """Schedule :class:`IoJob` instances under disk space and bandwidth caps."""
+
+    def __init__(
+        self,
+        *,
+        max_jobs: int,
+        write_budget: float | None = None,
+        space_margin: int = DEFAULT_SPACE_MARGIN,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+        report: Callable[[str], None] = print,
+    ) -> None:
+        self.max_jobs = max(1, max_jobs)
+        self.write_budget = write_budget if write_budget and write_budget > 0 else None
+        self.space_margin = space_margin
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self.report = report
+        self._observed_rates: list[float] = []
+
+    def _pending_writes(self, running: Sequence[_Running]) -> int:
+        return sum(max(0, item.job.estimated_size - _output_size(item.job.written_path)) for item in running)
+
+    def _has_space(self, job: IoJob, running: Sequence[_Running]) -> bool:
+        free = _free_space(job.output.parent)
+        return free - self._pending_writes(running) - self.space_margin >= job.estimated_size
+
+    def _has_bandwidth(self, running: Sequence[_Running]) -> bool:
+        if self.write_budget is None or not running:
+            return True
+        rates = self._observed_rates or [item.rate for item in running if item.rate > 0]
+        if not rates:
+            # no measurement yet: wait for the running jobs to report a rate
+            return False
+        expected = sum(rates) / len(rates)
+        # jobs that have not written anything yet are assumed to run at the average rate
+        current = sum(item.rate or expected for item in running)
+        return current + expected <= self.write_budget
+
+    def _start(self, job: IoJob) -> _Running:
+        job.output.parent.mkdir(parents=True, exist_ok=True)
+        # a previous build at these paths would count as progress
+        job.output.unlink(missing_ok=True)
+        job.written_path.unlink(missing_ok=True)
+        log_file = tempfile.TemporaryFile("w+", encoding="utf-8")
+        process = subprocess.Popen(
+            list(job.command),
+            cwd=job.cwd,
+            env=job.env,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        now = time.perf_counter()
+        self.report(f"[{job.name}] démarrage")
+        return _Running(job=job, process=process, log_file=log_file, started=now, last_sample=now)
+
+    def _sample(self, item: _Running, now: float) -> None:
+        size = _output_size(item.job.written_path)
+        elapsed = now - item.last_sample
+        if elapsed > 0:
+            item.rate = max(0.0, (size - item.last_size) / elapsed)
+        item.last_size, item.last_sample = size, now
+
+    def _progress(self, item: _Running) -> str:
+        size = item.last_size
+        percent = min(100.0, 100.0 * size / item.job.estimated_size) if item.job.estimated_size else 0.0
+        return (
+            f"[{item.job.name}] {percent:5.1f}% {format_size(size)} / {format_size(item.job.estimated_size)}"
+            f" à {format_size(item.rate)}/s"
+        )
+
+    def _finish(self, item: _Running) -> IoJobResult:
+        duration = time.perf_counter() - item.started
+        item.log_file.seek(0)
+        log = item.log_file.read()
+        item.log_file.close()
+        ok = item.process.returncode == 0
+        size = _output_size(item.job.output if ok else item.job.written_path)
+        result = IoJobResult(
+            name=item.job.name,
+            ok=ok,
+            duration=duration,
+            size=size,
+            log=log,
+            error="" if ok else f"code de sortie {item.process.returncode}",
+        )
+        if ok and result.rate > 0:
+            self._observed_rates.append(result.rate)
+        status = "terminé" if ok else "ÉCHEC"
+        self.report(f"[{item.job.name}] {status} en {duration:.1f}s ({format_size(size)})")
+        return result
+
+    def run(self, jobs: Sequence[IoJob]) -> list[IoJobResult]:
+        """Run every job and return their results in submission order."""
+
+        queue = list(jobs)
+        running: list[_Running] = []
+        results: dict[str, IoJobResult] = {}
+        last_progress = time.perf_counter()
+        try:
+            while queue or running:
+                now = time.perf_counter()
+                for item in running:
+                    self._sample(item, now)
+                for item in [item for item in running if item.process.poll() is not None]:
+                    running.remove(item)
+                    results[item.job.name] = self._finish(item)
+                while queue and len(running) < self.max_jobs:
+                    job = queue[0]
+                    if not self._has_space(job, running):
+                        if running:
+                            break
+                        queue.pop(0)
+                        needed = format_size(job.estimated_size + self.space_margin)
+                        self.report(f"[{job.name}] espace disque insuffisant (besoin : {needed})")
+                        results[job.name] = IoJobResult(
+                            job.name, False, 0.0, 0, "", error="espace disque insuffisant"
+                        )
+                        continue
+                    if not self._has_bandwidth(running):
+                        break
+                    running.append(self._start(queue.pop(0)))
+                if running and now - last_progress >= self.progress_interval:
+                    for item in running:
+                        self.report(self._progress(item))
+                    last_progress = now
+                if queue or running:
+                    time.sleep(self.poll_interval)
+        finally:
+            for item in running:
+                if item.process.poll() is None:
+                    item.process.terminate()
+                    item.process.wait()
+                item.log_file.close()
+        return [results[job.name] for job in jobs]
@@ -0,0 +1,283 @@
+"""Minimal in-process ISO9660 + Joliet writer for NoCloud seed images.
+
+A CIDATA seed only holds a couple of small files in its root directory, so
+the image is laid out in a fixed sequence of 2 KiB sectors:
+
+* 0-15: system area (zeros)
+* 16: primary volume descriptor, 17: Joliet supplementary descriptor,
+  18: set terminator
+* 19-22: L and M path tables of both trees (root only)
+* 23, 24: primary and Joliet root directories
+* 25...: file contents, each starting on a sector boundary
+
+Primary names follow ``mkisofs -l`` (uppercase d-characters, ``;1``
+version); Joliet keeps the original names, which is what Linux and
+cloud-init read. The whole image is built in memory and written at once.
+"""
+from __future__ import annotations
+
+import os
+import re
+import struct
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Mapping
+
+from . import checksums
+
+SECTOR = 2048
+SYSTEM_AREA_SECTORS = 16
+SEED_VOLUME_ID = "CIDATA"
+SEED_FILES = ("user-data", "meta-data")
+JOLIET_ESCAPE = b"%/E"  # UCS-2 level 3
+MAX_DIRECTORY_SIZE = SECTOR
+
+_PRIMARY_DESCRIPTOR = 16
+_PATH_TABLES = 19
+_ROOT_PRIMARY = 23
+_ROOT_JOLIET = 24
+_FIRST_FILE = 25
+
+_D_CHARACTERS = re.compile(r"[^A-Z0-9_]")
+
+
+class IsoWriteError(ValueError):
+    """The requested image cannot be represented by this writer."""
+
+
+@dataclass(frozen=True)
+class SeedImage:
+    """One seed ISO to write: destination and ``name -> content`` files."""
+
+    output: Path
+    files: Mapping[str, bytes]
+
+
+def _both16(value: int) -> bytes:
+    return struct.pack("<H", value) + struct.pack(">H", value)
+
+
+def _both32(value: int) -> bytes:
+    return struct.pack("<I", value) + struct.pack(">I", value)
+
+
+def _sectors(size: int) -> int:
+    return (size + SECTOR - 1) // SECTOR
+
+
+def _text(value: str, length: int, *, joliet: bool) -> bytes:
+    if joliet:
+        data = value.encode("utf-16-be")
+        padding = " ".encode("utf-16-be") * length
+    else:
+        data = value.encode("ascii")
+        padding = b" " * length
+    if len(data) > length:
+        raise IsoWriteError(f"Identifier too long: {value!r}")
+    return (data + padding)[:length]
+
+
+def _volume_date(moment: datetime) -> bytes:
+    return moment.strftime("%Y%m%d%H%M%S").encode("ascii") + b"00" + b"\x00"
+
+
+def _record_date(moment: datetime) -> bytes:
+    return bytes(
+        (moment.year - 1900, moment.month, moment.day, moment.hour, moment.minute, moment.second, 0)
+    )
+
+
+def primary_name(name: str) -> str:
+    """Map ``name`` to a ``mkisofs -l`` style ISO9660 identifier."""
+
+    stem, dot, extension = name.upper().rpartition(".")
+    if not dot:
+        stem, extension = extension, ""
+    stem = _D_CHARACTERS.sub("_", stem)
+    extension = _D_CHARACTERS.sub("_", extension)
+    stem = stem[: 30 - len(extension)] if extension else stem[:30]
+    return f"{stem}.{extension};1"
+
+
+def _directory_record(identifier: bytes, extent: int, size: int, moment: bytes, *, directory: bool) -> bytes:
+    length = 33 + len(identifier) + (1 - len(identifier) % 2)
+    record = bytearray(length)
+    record[0] = length
+    record[2:10] = _both32(extent)
+    record[10:18] = _both32(size)
+    record[18:25] = moment
+    record[25] = 0x02 if directory else 0x00
+    record[28:32] = _both16(1)
+    record[32] = len(identifier)
+    record[33 : 33 + len(identifier)] = identifier
+    return bytes(record)
+
+
+def _directory(entries: list[tuple[bytes, int, int]], extent: int, moment: bytes) -> bytes:
+    records = [
+        _directory_record(b"\x00", extent, SECTOR, moment, directory=True),
+        _directory_record(b"\x01", extent, SECTOR, moment, directory=True),
+    ]
+    records += [
+        _directory_record(identifier, location, size, moment, directory=False)
+        for identifier, location, size in sorted(entries)
+    ]
+    data = b"".join(records)
+    if len(data) > MAX_DIRECTORY_SIZE:
+        raise IsoWriteError("Too many files for a single-sector root directory")
+    return data
+
+
+def _path_table(extent: int, *, big_endian: bool) -> bytes:
+    # root only: identifier length 1, root identifier 0x00, padded to even length
+    return bytes((1, 0)) + struct.pack(">I" if big_endian else "<I", extent) + struct.pack(
+        ">H" if big_endian else "<H", 1
+    ) + b"\x00\x00"
+
+
+def _volume_descriptor(
+    *,
+    joliet: bool,
+    volume_id: str,
+    total_sectors: int,
+    path_table_size: int,
+    l_table: int,
+    m_table: int,
+    root_record: bytes,
+    moment: datetime,
+) -> bytes:
+    descriptor = bytearray(SECTOR)
+    descriptor[0] = 2 if joliet else 1
+    descriptor[1:6] = b"CD001"
+    descriptor[6] = 1
+    descriptor[8:40] = _text("", 32, joliet=joliet)
+    descriptor[40:72] = _text(volume_id, 32, joliet=joliet)
+    descriptor[80:88] = _both32(total_sectors)
+    if joliet:
+        descriptor[88:91] = JOLIET_ESCAPE
+    descriptor[120:124] = _both16(1)
+    descriptor[124:128] = _both16(1)
+    descriptor[128:132] = _both16(SECTOR)
+    descriptor[132:140] = _both32(path_table_size)
+    descriptor[140:144] = struct.pack("<I", l_table)
+    descriptor[148:152] = struct.pack(">I", m_table)
+    descriptor[156:190] = root_record
+    for start, length in ((190, 128), (318, 128), (446, 128), (574, 128)):
+        descriptor[start : start + length] = _text("", length, joliet=joliet)
+    for start in (702, 739, 776):
+        descriptor[start : start + 37] = _text("", 37, joliet=False)
+    stamp = _volume_date(moment)
+    descriptor[813:830] = stamp
+    descriptor[830:847] = stamp
+    descriptor[847:864] = b"0" * 16 + b"\x00"
+    descriptor[864:881] = stamp
+    descriptor[881] = 1
+    return bytes(descriptor)
+
+
+def build_image(
+    files: Mapping[str, bytes],
+    *,
+    volume_id: str = SEED_VOLUME_ID,
+    timestamp: datetime | None = None,
+) -> bytes:
+    """Return the bytes of an ISO image holding ``files`` in its root directory."""
+
+    if _D_CHARACTERS.sub("", volume_id) != volume_id or len(volume_id) > 16:
+        raise IsoWriteError(f"Invalid volume identifier: {volume_id!r}")
+    moment = (timestamp or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    record_moment = _record_date(moment)
+
+    names = sorted(files)
+    primary = [primary_name(name) for name in names]
+    if len(set(primary)) != len(primary):
+        raise IsoWriteError(f"File names collide once mapped to ISO9660: {', '.join(names)}")
+    locations: list[int] = []
+    next_sector = _FIRST_FILE
+    for name in names:
+        locations.append(next_sector)
+        next_sector += max(1, _sectors(len(files[name])))
+    total_sectors = next_sector
+
+    primary_entries = [
+        (identifier.encode("ascii"), location, len(files[name]))
+        for identifier, location, name in zip(primary, locations, names)
+    ]
+    joliet_entries = []
+    for location, name in zip(locations, names):
+        identifier = name.encode("utf-16-be")
+        if len(identifier) > 128:
+            raise IsoWriteError(f"File name too long for Joliet: {name!r}")
+        joliet_entries.append((identifier, location, len(files[name])))
+
+    image = bytearray(total_sectors * SECTOR)
+
+    def put(sector: int, data: bytes) -> None:
+        image[sector * SECTOR : sector * SECTOR + len(data)] = data
+
+    path_table_size = len(_path_table(0, big_endian=False))
+    for joliet, root_sector, offset in ((False, _ROOT_PRIMARY, 0), (True, _ROOT_JOLIET, 1)):
+        root_record = _directory_record(b"\x00", root_sector, SECTOR, record_moment, directory=True)
+        l_table = _PATH_TABLES + 2 * offset
+        put(
+            _PRIMARY_DESCRIPTOR + offset,
+            _volume_descriptor(
+                joliet=joliet,
+                volume_id=volume_id,
+                total_sectors=total_sectors,
+                path_table_size=path_table_size,
+                l_table=l_table,
+                m_table=l_table + 1,
+                root_record=root_record,
+                moment=moment,
+            ),
+        )
+        put(l_table, _path_table(root_sector, big_endian=False))
+        put(l_table + 1, _path_table(root_sector, big_endian=True))
+        entries = joliet_entries if joliet else primary_entries
+        put(root_sector, _directory(entries, root_sector, record_moment))
+    put(_PRIMARY_DESCRIPTOR + 2, b"\xffCD001\x01")
+    for location, name in zip(locations, names):
+        put(location, files[name])
+    return bytes(image)
+
+
+def write_image(path: Path, image: bytes) -> None:
+    """Write ``image`` to ``path`` with a single write, replacing it atomically."""
+
+    partial = path.with_name(path.name + ".partial")
+    with open(partial, "wb", buffering=0) as handle:
+        view = memoryview(image)
+        while view:
+            view = view[handle.write(view) :]
+    os.replace(partial, path)
+
+
+def seed_files(directory: Path) -> dict[str, bytes]:
+    """Read the NoCloud pair rendered in ``directory``."""
+
+    missing = [name for name in SEED_FILES if not (directory / name).is_file()]
+    if missing:
+        raise FileNotFoundError(f"Missing {', '.join(missing)} in {directory}")
+    return {name: (directory / name).read_bytes() for name in SEED_FILES}
+
+
+def write_seed_isos(
+    images: Iterable[SeedImage], *, timestamp: datetime | None = None
+) -> list[tuple[Path, checksums.Checksums]]:
+    """Build and write every seed image in turn.
+
+    Digests are taken from the in-memory image, so the written files are never
+    read back. Returns ``(path, checksums)`` pairs.
+    """
+
+    moment = timestamp or datetime.now(timezone.utc)
+    written = []
+    for item in images:
+        image = build_image(item.files, timestamp=moment)
+        write_image(item.output, image)
+        sums = checksums.of_bytes(image)
+        checksums.record(item.output, sums)
+        written.append((item.output, sums))
+    return written
@@ -0,0 +1,151 @@
+"""Typed view of the inventory shared by every script.
+
+``Host`` and ``HardwareProfile`` are small ``__slots__`` records. Listing them
+goes through the persistent index (``inventory.indexed_hosts``), which already
+holds the first-level summary fields, so ``host.netmode`` or
+``profile.nic`` never parse YAML. The whole document is only parsed when a
+caller asks for another key, and each file is parsed at most once per process
+while its size and mtime are unchanged (``yamlio.load_file``).
+
+Lookups by name follow ``iter_inventory_roots``: the overlay shadows the
+repository, ``main.yml`` is preferred over ``main.yaml`` and ``.yml`` over
+``.yaml``.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, ClassVar, Mapping, Sequence
+
+from . import inventory, yamlio
+
+
+def load_document(path: Path) -> dict[str, Any]:
+    """Return the YAML mapping stored in ``path``, parsed once per process.
+
+    The returned mapping is shared between callers and must not be modified;
+    take a ``copy.deepcopy`` before editing it. Raises ValueError when the
+    file does not hold a mapping.
+    """
+
+    content = yamlio.load_file(path)
+    if content is None:
+        return {}
+    if not isinstance(content, dict):
+        raise ValueError(f"{path} must contain a YAML mapping")
+    return content
+
+
+class Record:
+    """An inventory file: its name, location and lazily parsed fields."""
+
+    __slots__ = ("name", "location", "_fields")
+    kind: ClassVar[str]
+
+    def __init__(self, name: str, location: str | Path, fields: Mapping[str, str | None] | None = None) -> None:
+        self.name = name
+        self.location = str(location)
+        # first-level summary fields known without parsing (from the index)
+        self._fields = fields
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.name!r}, {self.location!r})"
+
+    @property
+    def path(self) -> Path:
+        return Path(self.location)
+
+    @property
+    def data(self) -> dict[str, Any]:
+        """The parsed document (shared, read-only)."""
+
+        return load_document(self.path)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Raw value of the first-level ``key``."""
+
+        return self.data.get(key, default)
+
+    def text(self, key: str) -> str | None:
+        """``key`` as display text, read from the index when possible."""
+
+        if self._fields is not None and key in inventory.SUMMARY_FIELDS:
+            return self._fields.get(key)
+        return inventory.scalar_text(self.get(key))
+
+
+class HardwareProfile(Record):
+    __slots__ = ()
+    kind = inventory.PROFILE_KIND
+
+    @property
+    def hardware_model(self) -> str | None:
+        return self.text("hardware_model")
+
+    @property
+    def storage_profile(self) -> str | None:
+        return self.text("storage_profile")
+
+    @property
+    def netmode(self) -> str | None:
+        return self.text("netmode")
+
+    @property
+    def nic(self) -> str | None:
+        return self.text("nic")
+
+    @property
+    def disk_device(self) -> str | None:
+        return self.text("disk_device")
+
+
+class Host(Record):
+    __slots__ = ()
+    kind = inventory.HOST_KIND
+
+    @property
+    def hostname(self) -> str | None:
+        return self.text("hostname")
+
+    @property
+    def hardware_profile(self) -> str | None:
+        return self.text("hardware_profile")
+
+    @property
+    def netmode(self) -> str | None:
+        return self.text("netmode")
+
+    def profile(self) -> HardwareProfile | None:
+        """The hardware profile referenced by this host, if it exists."""
+
+        return load_profile(self.hardware_profile) if self.hardware_profile else None
+
+    def effective(self, key: str) -> Any:
+        """``key`` from the host, falling back to its hardware profile when empty."""
+
+        value = self.get(key)
+        if value not in (None, ""):
+            return value
+        profile = self.profile()
+        return profile.get(key) if profile is not None else value
+
+
+def hosts(roots: Sequence[Path] | None = None) -> list[Host]:
+    """Every host of ``roots`` (default: overlay then repository), sorted by name."""
+
+    return [Host(entry.name, entry.location, entry.fields) for entry in inventory.indexed_hosts(roots)]
+
+
+def profiles(roots: Sequence[Path] | None = None) -> list[HardwareProfile]:
+    """Every hardware profile of ``roots`` (default: overlay then repository), sorted by name."""
+
+    return [HardwareProfile(entry.name, entry.location, entry.fields) for entry in inventory.indexed_profiles(roots)]
+
+
+def load_host(name: str, include_overlay: bool = True) -> Host | None:
+    path = inventory.find_host_vars_file(name, include_overlay=include_overlay)
+    return Host(name, path) if path is not None else None
+
+
+def load_profile(name: str, include_overlay: bool = True) -> HardwareProfile | None:
+    path = inventory.find_hardware_profile(name, include_overlay=include_overlay)
+    return HardwareProfile(name, path) if path is not None else None
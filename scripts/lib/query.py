@@ -0,0 +1,319 @@
+"""Small query language over the inventory index.
+
+Examples::
+
+    hardware_profile = lenovo-m710q and netmode = dhcp
+    nic in (enp1s0, eno1) or not disk_device ~ "/dev/nvme*"
+
+Comparisons are ``=`` (or ``==``), ``!=``, ``in (...)``, ``not in (...)``,
+``~`` and ``!~`` (shell-style glob, case-sensitive). They combine with
+``and``, ``or``, ``not`` and parentheses, ``and`` binding tighter than
+``or``. Values are bare words or quoted strings; ``""`` matches an unset
+field. Fields are ``name`` (the host directory or profile file name) and the
+summary fields of the index (``inventory.SUMMARY_FIELDS``).
+
+On hosts, the fields a hardware profile provides (``INHERITED_FIELDS``) are
+compared on their effective value: the host's own value, or its profile's when
+the host leaves it unset, as the renderer sees them.
+
+Each comparison is one lookup on the secondary indexes of the SQLite inventory
+index, and the lookups are combined as sets of names, so no YAML is read and
+the cost follows the number of matches rather than the size of the fleet. Only
+a ``not`` that is not paired with a positive condition (``a and not b``) needs
+the list of every name.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import NoReturn, Sequence, Union
+
+from . import inventory, model
+
+FIELDS = ("name", *inventory.SUMMARY_FIELDS)
+INHERITED_FIELDS = ("netmode", "hardware_model", "storage_profile", "nic", "disk_device")
+KEYWORDS = {"and", "or", "not", "in"}
+# bound parameters per "hardware_profile IN (...)" lookup
+_CHUNK = 500
+
+_TOKEN = re.compile(
+    r"""(?:
+        (?P<operator>==|!=|!~|[=~(),])
+      | "(?P<double>(?:[^"\\]|\\.)*)"
+      | '(?P<single>[^']*)'
+      | (?P<word>[^\s=!~(),"']+)
+    )""",
+    re.VERBOSE,
+)
+_ESCAPE = re.compile(r"\\(.)")
+
+
+class QueryError(ValueError):
+    """The expression cannot be parsed."""
+
+
+@dataclass(frozen=True)
+class Comparison:
+    """``field`` equal to one of ``values`` (None: unset), or matching the glob ``values[0]``."""
+
+    field: str
+    values: tuple[str | None, ...]
+    glob: bool = False
+
+
+@dataclass(frozen=True)
+class Not:
+    operand: Node
+
+
+@dataclass(frozen=True)
+class And:
+    operands: tuple[Node, ...]
+
+
+@dataclass(frozen=True)
+class Or:
+    operands: tuple[Node, ...]
+
+
+Node = Union[Comparison, Not, And, Or]
+
+
+@dataclass(frozen=True)
+class _Token:
+    kind: str  # "operator", "keyword", "word" or "string"
+    text: str
+    position: int
+
+
+def _tokenize(expression: str) -> list[_Token]:
+    tokens = []
+    position = 0
+    while True:
+        while position < len(expression) and expression[position].isspace():
+            position += 1
+        if position == len(expression):
+            return tokens
+        found = _TOKEN.match(expression, position)
+        if found is None:
+            raise QueryError(f"Unexpected character at position {position}: {expression[position:]!r}")
+        start = found.start(found.lastgroup)
+        if found.group("operator") is not None:
+            tokens.append(_Token("operator", found.group("operator"), start))
+        elif found.group("double") is not None:
+            tokens.append(_Token("string", _ESCAPE.sub(r"\1", found.group("double")), start))
+        elif found.group("single") is not None:
+            tokens.append(_Token("string", found.group("single"), start))
+        else:
+            word = found.group("word")
+            kind = "keyword" if word.lower() in KEYWORDS else "word"
+            tokens.append(_Token(kind, word.lower() if kind == "keyword" else word, start))
+        position = found.end()
+
+
+class _Parser:
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.index = 0
+
+    def peek(self) -> _Token | None:
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def accept(self, kind: str, text: str | None = None) -> _Token | None:
+        token = self.peek()
+        if token is not None and token.kind == kind and (text is None or token.text == text):
+            self.index += 1
+            return token
+        return None
+
+    def expect(self, kind: str, text: str | None, description: str) -> _Token:
+        token = self.accept(kind, text)
+        if token is None:
+            self.fail(description)
+        return token
+
+    def fail(self, description: str) -> NoReturn:
+        token = self.peek()
+        where = f"at position {token.position} ({token.text!r})" if token else "at the end of the expression"
+        raise QueryError(f"Expected {description} {where}")
+
+    def parse(self) -> Node:
+        if not self.tokens:
+            raise QueryError("Empty query")
+        node = self.disjunction()
+        if self.peek() is not None:
+            self.fail("'and', 'or' or the end of the expression")
+        return node
+
+    def disjunction(self) -> Node:
+        operands = [self.conjunction()]
+        while self.accept("keyword", "or"):
+            operands.append(self.conjunction())
+        return operands[0] if len(operands) == 1 else Or(tuple(operands))
+
+    def conjunction(self) -> Node:
+        operands = [self.negation()]
+        while self.accept("keyword", "and"):
+            operands.append(self.negation())
+        return operands[0] if len(operands) == 1 else And(tuple(operands))
+
+    def negation(self) -> Node:
+        if self.accept("keyword", "not"):
+            return Not(self.negation())
+        if self.accept("operator", "("):
+            node = self.disjunction()
+            self.expect("operator", ")", "')'")
+            return node
+        return self.comparison()
+
+    def comparison(self) -> Node:
+        token = self.expect("word", None, "a field name")
+        field = "name" if token.text == "directory" else token.text
+        if field not in FIELDS:
+            raise QueryError(f"Unknown field {token.text!r} at position {token.position} (fields: {', '.join(FIELDS)})")
+        if self.accept("operator", "=") or self.accept("operator", "=="):
+            return Comparison(field, (self.value(),))
+        if self.accept("operator", "!="):
+            return Not(Comparison(field, (self.value(),)))
+        if self.accept("operator", "~"):
+            return Comparison(field, (self.pattern(),), glob=True)
+        if self.accept("operator", "!~"):
+            return Not(Comparison(field, (self.pattern(),), glob=True))
+        negated = self.accept("keyword", "not") is not None
+        if self.accept("keyword", "in") is None:
+            self.fail("'=', '!=', '~', '!~', 'in' or 'not in'")
+        self.expect("operator", "(", "'('")
+        values = [self.value()]
+        while self.accept("operator", ","):
+            values.append(self.value())
+        self.expect("operator", ")", "')'")
+        node = Comparison(field, tuple(dict.fromkeys(values)))
+        return Not(node) if negated else node
+
+    def value(self) -> str | None:
+        token = self.accept("string") or self.accept("word")
+        if token is None:
+            self.fail("a value")
+        return token.text or None
+
+    def pattern(self) -> str:
+        value = self.value()
+        if value is None:
+            self.fail("a non-empty pattern")
+        return value
+
+
+def parse(expression: str) -> Node:
+    """Parse ``expression`` into a tree of comparisons; raises QueryError."""
+
+    return _Parser(expression).parse()
+
+
+def _condition(comparison: Comparison, column: str) -> tuple[str, list[str]]:
+    """SQL test of ``column`` for ``comparison``; rows where it is NULL do not match."""
+
+    if comparison.glob:
+        return f"{column} GLOB ?", [comparison.values[0]]
+    values = [value for value in comparison.values if value is not None]
+    terms = []
+    if len(values) == 1:
+        terms.append(f"{column} = ?")
+    elif values:
+        terms.append(f"{column} IN ({', '.join('?' * len(values))})")
+    if None in comparison.values:
+        terms.append(f"{column} IS NULL")
+    return " OR ".join(terms), values
+
+
+class _Evaluator:
+    def __init__(self, index: inventory.InventoryIndex, kind: str, roots: Sequence[Path] | None) -> None:
+        self.index = index
+        self.kind = kind
+        self.roots = roots
+        self._everything: set[str] | None = None
+
+    def everything(self) -> set[str]:
+        if self._everything is None:
+            self._everything = self.index.match(self.kind, "1", roots=self.roots)
+        return self._everything
+
+    def evaluate(self, node: Node) -> set[str]:
+        if isinstance(node, Comparison):
+            return self.compare(node)
+        if isinstance(node, Not):
+            return self.everything() - self.evaluate(node.operand)
+        if isinstance(node, Or):
+            result: set[str] = set()
+            for operand in node.operands:
+                result |= self.evaluate(operand)
+            return result
+        # a and not b: subtract b from a instead of complementing it
+        positive = [operand for operand in node.operands if not isinstance(operand, Not)]
+        negative = [operand.operand for operand in node.operands if isinstance(operand, Not)]
+        sets = sorted((self.evaluate(operand) for operand in positive), key=len)
+        result = set(sets[0]) if sets else set(self.everything())
+        for other in sets[1:]:
+            result &= other
+        for operand in negative:
+            if not result:
+                break
+            result -= self.evaluate(operand)
+        return result
+
+    def compare(self, comparison: Comparison) -> set[str]:
+        field = comparison.field
+        condition, params = _condition(comparison, field)
+        if self.kind != inventory.HOST_KIND or field not in INHERITED_FIELDS:
+            return self.index.match(self.kind, condition, params, self.roots)
+
+        # effective value: the host's own, else the one of its hardware profile
+        match = self.index.match
+        own = f"{field} IS NOT NULL AND ({condition})"
+        result = match(inventory.HOST_KIND, own, params, self.roots)
+        profiles = match(inventory.PROFILE_KIND, own, params, self.roots)
+        result |= self._inheriting(field, profiles)
+        if None in comparison.values and not comparison.glob:
+            unset = match(inventory.HOST_KIND, f"{field} IS NULL", (), self.roots)
+            valued = match(inventory.PROFILE_KIND, f"{field} IS NOT NULL", (), self.roots)
+            result |= unset - self._inheriting(field, valued)
+        return result
+
+    def _inheriting(self, field: str, profiles: set[str]) -> set[str]:
+        """Hosts leaving ``field`` unset whose hardware profile is one of ``profiles``."""
+
+        result: set[str] = set()
+        names = sorted(profiles)
+        for start in range(0, len(names), _CHUNK):
+            chunk = names[start : start + _CHUNK]
+            # unary "+" keeps SQLite on the hardware_profile index: unset fields are the common case
+            result |= self.index.match(
+                inventory.HOST_KIND,
+                f"+{field} IS NULL AND hardware_profile IN ({', '.join('?' * len(chunk))})",
+                chunk,
+                self.roots,
+            )
+        return result
+
+
+def _select(expression: str | Node, kind: str, roots: Sequence[Path] | None) -> list[inventory.IndexEntry]:
+    node = parse(expression) if isinstance(expression, str) else expression
+    index = inventory.get_index()
+    index.refresh(roots)
+    return index.fetch(kind, _Evaluator(index, kind, roots).evaluate(node), roots)
+
+
+def hosts(expression: str | Node, roots: Sequence[Path] | None = None) -> list[model.Host]:
+    """Hosts matching ``expression``, sorted by name."""
+
+    return [model.Host(entry.name, entry.location, entry.fields) for entry in _select(expression, inventory.HOST_KIND, roots)]
+
+
+def profiles(expression: str | Node, roots: Sequence[Path] | None = None) -> list[model.HardwareProfile]:
+    """Hardware profiles matching ``expression``, sorted by name."""
+
+    return [
+        model.HardwareProfile(entry.name, entry.location, entry.fields)
+        for entry in _select(expression, inventory.PROFILE_KIND, roots)
+    ]
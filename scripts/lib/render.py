@@ -0,0 +1,471 @@
+"""Native renderer for NoCloud autoinstall artefacts.
+
+This module replays ``ansible/playbooks/common/generate_autoinstall.yml``
+in-process: it resolves the same HOST/PROFILE, overlay and hardware profile
+precedence, then renders ``user-data.j2``/``meta-data.j2`` with a Jinja2
+environment configured like the Ansible ``template`` module so that the
+output is byte-identical to ``make baremetal/gen``.
+"""
+from __future__ import annotations
+
+import base64
+import copy
+import hashlib
+import json
+import os
+import tempfile
+from collections.abc import Mapping
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterator
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, StrictUndefined, TemplateError, Undefined
+from jinja2 import __version__ as JINJA_VERSION
+from jinja2 import meta
+from jinja2.bccache import Bucket
+
+from . import inventory, model, sops, trace, yamlio
+
+AUTOINSTALL_DIR = inventory.REPO_ROOT / "baremetal" / "autoinstall"
+TEMPLATES_ROOT = AUTOINSTALL_DIR / "templates"
+GENERATED_ROOT = AUTOINSTALL_DIR / "generated"
+INVENTORY_HOSTNAME = "localhost"
+OUTPUT_TEMPLATES = (("user-data", "user-data.j2"), ("meta-data", "meta-data.j2"))
+MAX_TEMPLATE_DEPTH = 10
+BYTECODE_CACHE_DIR = inventory.REPO_ROOT / ".cache" / "jinja"
+
+
+class RenderError(RuntimeError):
+    """Raised when a target cannot be rendered."""
+
+
+@dataclass(frozen=True)
+class RenderTarget:
+    """Inventory files resolved for a HOST/PROFILE pair."""
+
+    config_name: str
+    profile_file: Path | None
+    host_vars_file: Path | None
+
+    @property
+    def secrets_file(self) -> Path | None:
+        """Return the ``secrets.sops.yaml`` path next to the host variables."""
+
+        if self.host_vars_file is None:
+            return None
+        return self.host_vars_file.parent / "secrets.sops.yaml"
+
+
+@dataclass(frozen=True)
+class RenderResult:
+    """Artefacts written for a rendered target."""
+
+    config_name: str
+    output_dir: Path
+    files: tuple[Path, ...]
+
+
+class PlaceholderSecrets(dict):
+    """``secrets`` stand-in for validation renders of targets without secrets.
+
+    Every lookup yields a visible ``<secret:NAME>`` marker so templates render
+    end to end without real key material.
+    """
+
+    def __missing__(self, key: str) -> str:
+        return f"<secret:{key}>"
+
+
+class _HostVars(Mapping):
+    """Minimal stand-in for Ansible ``hostvars`` on an implicit localhost play."""
+
+    def __init__(self, variables: dict[str, Any]) -> None:
+        self._variables = variables
+
+    def __getitem__(self, key: str) -> Any:
+        if key == INVENTORY_HOSTNAME:
+            return self._variables
+        return StrictUndefined(name=f"hostvars['{key}']")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter((INVENTORY_HOSTNAME,))
+
+    def __len__(self) -> int:
+        return 1
+
+
+def _finalize(value: Any) -> Any:
+    return "" if value is None else value
+
+
+def _mandatory(value: Any, msg: str | None = None) -> Any:
+    if isinstance(value, Undefined):
+        raise RenderError(msg or "Mandatory variable not defined.")
+    return value
+
+
+def _to_json(value: Any, **kwargs: Any) -> str:
+    return json.dumps(value, **kwargs)
+
+
+def _to_nice_json(value: Any, indent: int = 4, sort_keys: bool = True, **kwargs: Any) -> str:
+    return json.dumps(value, indent=indent, sort_keys=sort_keys, separators=(",", ": "), **kwargs)
+
+
+def _to_yaml(value: Any, **kwargs: Any) -> str:
+    return yamlio.dump(value, allow_unicode=True, **kwargs)
+
+
+def _to_nice_yaml(value: Any, indent: int = 4, **kwargs: Any) -> str:
+    return yamlio.dump(value, indent=indent, allow_unicode=True, default_flow_style=False, **kwargs)
+
+
+def _from_yaml(value: Any) -> Any:
+    if isinstance(value, str):
+        return yamlio.load(value)
+    return value
+
+
+def _b64encode(value: str, encoding: str = "utf-8") -> str:
+    return base64.b64encode(value.encode(encoding)).decode("ascii")
+
+
+def _b64decode(value: str, encoding: str = "utf-8") -> str:
+    return base64.b64decode(value).decode(encoding)
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """Compiled-template cache shared by every native render on this checkout.
+
+    Buckets are keyed by template path and by the environment settings that
+    change the generated code; an entry is reused only while both the source
+    hash and the template mtime match what was recorded when it was compiled.
+    """
+
+    def __init__(self, directory: Path, namespace: str) -> None:
+        super().__init__(str(directory), "autoinstall-%s.cache")
+        self._namespace = namespace
+
+    def get_cache_key(self, name: str, filename: str | None = None) -> str:
+        return super().get_cache_key(f"{self._namespace}|{name}", filename)
+
+    def get_bucket(self, environment: Environment, name: str, filename: str | None, source: str) -> Bucket:
+        checksum = self.get_source_checksum(source)
+        if filename:
+            try:
+                checksum += f"-{os.stat(filename).st_mtime_ns}"
+            except OSError:
+                pass
+        bucket = Bucket(environment, self.get_cache_key(name, filename), checksum)
+        self.load_bytecode(bucket)
+        return bucket
+
+
+def _bytecode_cache(settings: dict[str, Any]) -> TemplateBytecodeCache | None:
+    try:
+        BYTECODE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    if not os.access(BYTECODE_CACHE_DIR, os.W_OK):
+        return None
+    payload = json.dumps({**settings, "finalize": _finalize.__name__, "jinja2": JINJA_VERSION}, sort_keys=True)
+    fingerprint = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+    return TemplateBytecodeCache(BYTECODE_CACHE_DIR, fingerprint)
+
+
+@lru_cache(maxsize=None)
+def create_environment() -> Environment:
+    """Return the Jinja2 environment mirroring Ansible's templar settings."""
+
+    settings: dict[str, Any] = {
+        "trim_blocks": True,
+        "keep_trailing_newline": False,
+        "extensions": ["jinja2.ext.do", "jinja2.ext.loopcontrols"],
+    }
+    env = Environment(
+        loader=FileSystemLoader(str(TEMPLATES_ROOT)),
+        bytecode_cache=_bytecode_cache(settings),
+        undefined=StrictUndefined,
+        finalize=_finalize,
+        **settings,
+    )
+    env.filters.update(
+        {
+            "b64decode": _b64decode,
+            "b64encode": _b64encode,
+            "from_yaml": _from_yaml,
+            "mandatory": _mandatory,
+            "to_json": _to_json,
+            "to_nice_json": _to_nice_json,
+            "to_nice_yaml": _to_nice_yaml,
+            "to_yaml": _to_yaml,
+        }
+    )
+    return env
+
+
+def _count_newlines_from_end(text: str) -> int:
+    count = 0
+    for char in reversed(text):
+        if char != "\n":
+            break
+        count += 1
+    return count
+
+
+def render_template(name: str, variables: dict[str, Any]) -> str:
+    """Render ``name`` from the templates root like ``ansible.builtin.template``."""
+
+    env = create_environment()
+    try:
+        with trace.span("render.template", template=name):
+            source, _, _ = env.loader.get_source(env, name)
+            result = env.get_template(name).render(variables)
+    except TemplateError as exc:
+        raise RenderError(f"{name}: {exc}") from exc
+    missing = _count_newlines_from_end(source) - _count_newlines_from_end(result)
+    if missing > 0:
+        result += "\n" * missing
+    return result
+
+
+def load_vars_file(path: Path) -> dict[str, Any]:
+    """Load a YAML mapping the way ``include_vars`` does.
+
+    Parsed files are shared with the rest of the process through
+    ``model.load_document`` so that hosts sharing a hardware profile only
+    parse it once; callers receive a private copy.
+    """
+
+    try:
+        return copy.deepcopy(model.load_document(path))
+    except ValueError as exc:
+        raise RenderError(str(exc)) from exc
+
+
+def resolve_target(host: str, profile: str = "") -> RenderTarget:
+    """Resolve inventory files for ``HOST``/``PROFILE`` like the playbook."""
+
+    if profile:
+        profile_file = inventory.find_hardware_profile(profile)
+        if profile_file is not None:
+            return RenderTarget(config_name=profile, profile_file=profile_file, host_vars_file=None)
+        host_vars_file = inventory.find_host_vars_file(profile)
+        if host_vars_file is None:
+            raise RenderError(
+                f"PROFILE '{profile}' does not match any hardware profile under "
+                "inventory/profiles/hardware/ or host_vars entry."
+            )
+        return RenderTarget(config_name=host or profile, profile_file=None, host_vars_file=host_vars_file)
+    host_vars_file = inventory.find_host_vars_file(host)
+    if host_vars_file is None:
+        raise RenderError(f"No host_vars/{host}/main.yml found in the inventory overlay or repository")
+    return RenderTarget(config_name=host, profile_file=None, host_vars_file=host_vars_file)
+
+
+def decrypt_secrets(path: Path) -> str:
+    """Return the plaintext of a SOPS-encrypted file (cached per session)."""
+
+    try:
+        return sops.decrypt_file(path)
+    except sops.SopsError as exc:
+        raise RenderError(str(exc)) from exc
+
+
+def _template_value(value: Any, variables: dict[str, Any], depth: int = 0) -> Any:
+    """Resolve Jinja expressions embedded in inventory values, Ansible style."""
+
+    if isinstance(value, dict):
+        return {key: _template_value(item, variables, depth) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_template_value(item, variables, depth) for item in value]
+    if not isinstance(value, str) or ("{{" not in value and "{%" not in value):
+        return value
+    if depth >= MAX_TEMPLATE_DEPTH:
+        raise RenderError(f"Recursive loop detected while templating {value!r}")
+    env = create_environment()
+    stripped = value.strip()
+    try:
+        if stripped.startswith("{{") and stripped.endswith("}}") and stripped.count("{{") == 1:
+            result = env.compile_expression(stripped[2:-2], undefined_to_none=False)(variables)
+            if isinstance(result, Undefined):
+                return result
+        else:
+            result = env.from_string(value).render(variables)
+    except TemplateError as exc:
+        return StrictUndefined(hint=f"{value!r}: {exc}")
+    return _template_value(result, variables, depth + 1)
+
+
+_storage_layout_cache: dict[str, Any] = {}
+
+
+@lru_cache(maxsize=None)
+def _template_dependencies(source_digest: str, name: str) -> tuple[str, ...] | None:
+    """Return the free variables of ``name``, or None when it pulls other templates."""
+
+    env = create_environment()
+    source, _, _ = env.loader.get_source(env, name)
+    ast = env.parse(source)
+    if any(True for _ in meta.find_referenced_templates(ast)):
+        return None
+    return tuple(sorted(meta.find_undeclared_variables(ast)))
+
+
+def _storage_layout_data(layout: str, variables: dict[str, Any]) -> dict[str, Any]:
+    """Render and parse a storage layout, memoised per layout and input values.
+
+    The key covers the template source and the values of every variable the
+    template reads, so hosts sharing a layout and its inputs (disk device,
+    encryption settings...) reuse one template-and-YAML round-trip.
+    """
+
+    name = f"storage/{layout}.yml.j2"
+    env = create_environment()
+    try:
+        source, _, _ = env.loader.get_source(env, name)
+    except TemplateError as exc:
+        raise RenderError(f"{name}: {exc}") from exc
+    source_digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    dependencies = _template_dependencies(source_digest, name)
+    key = None
+    if dependencies is not None:
+        values = {dependency: variables[dependency] for dependency in dependencies if dependency in variables}
+        payload = json.dumps([name, source_digest, values], sort_keys=True, default=repr)
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        if key in _storage_layout_cache:
+            return copy.deepcopy(_storage_layout_cache[key])
+    data = yamlio.load(render_template(name, variables)) or {}
+    if key is not None:
+        _storage_layout_cache[key] = copy.deepcopy(data)
+    return data
+
+
+def _apply_storage_layout(variables: dict[str, Any]) -> None:
+    layout = variables.get("storage_layout")
+    if not layout:
+        return
+    with trace.span("render.storage_layout", layout=layout):
+        data = _storage_layout_data(layout, variables)
+    variables["_storage_layout_data"] = data
+    variables["storage_config_override"] = data["storage_config_override"]
+    variables["storage_swap_size"] = variables.get("storage_swap_size") or data.get("storage_swap_size", 0)
+    variables["storage_additional_late_commands"] = list(
+        variables.get("storage_additional_late_commands", [])
+    ) + list(data.get("additional_late_commands", []))
+
+
+def build_variables(target: RenderTarget, *, host: str = "", profile: str = "") -> dict[str, Any]:
+    """Return the variables visible to the templates for ``target``."""
+
+    variables: dict[str, Any] = {
+        "autoinstall_dir": str(AUTOINSTALL_DIR),
+        "templates_root": str(TEMPLATES_ROOT),
+        "inventory_hostname": INVENTORY_HOSTNAME,
+        "target": host or target.config_name,
+        "profile": profile if target.profile_file is not None else "",
+        "config_name": target.config_name,
+    }
+    if target.profile_file is not None:
+        variables["primary_vars_file"] = str(target.profile_file)
+        variables.update(load_vars_file(target.profile_file))
+    if target.host_vars_file is not None:
+        host_raw_vars = load_vars_file(target.host_vars_file)
+        hardware_profile = host_raw_vars.get("hardware_profile")
+        if hardware_profile:
+            profile_file = inventory.find_hardware_profile(hardware_profile)
+            if profile_file is None:
+                raise RenderError(
+                    f"[{target.host_vars_file}] references unknown hardware_profile: {hardware_profile}"
+                )
+            variables.update(load_vars_file(profile_file))
+        variables.update(host_raw_vars)
+        secrets_file = target.secrets_file
+        if secrets_file is not None and secrets_file.is_file():
+            variables.update(load_vars_file(secrets_file))
+        variables.update(
+            {
+                "primary_vars_file": str(target.host_vars_file),
+                "host_raw_vars": host_raw_vars,
+                "host_vars_dir": str(target.host_vars_file.parent),
+                "host_secrets_file": str(secrets_file),
+            }
+        )
+    variables["hostvars"] = _HostVars(variables)
+    for key, value in list(variables.items()):
+        variables[key] = _template_value(value, variables)
+    _apply_storage_layout(variables)
+    return variables
+
+
+def load_secrets(target: RenderTarget, *, required: bool = True) -> Any:
+    """Decrypt and parse the host secrets exposed as ``secrets`` to templates.
+
+    With ``required=False``, targets without a secrets file (hardware profiles,
+    hosts not provisioned yet) get :class:`PlaceholderSecrets` instead of an
+    error.
+    """
+
+    secrets_file = target.secrets_file
+    if not required and (secrets_file is None or not secrets_file.is_file()):
+        return PlaceholderSecrets()
+    if secrets_file is None:
+        raise RenderError(
+            f"'{target.config_name}' has no host secrets: hardware profiles cannot be rendered on their own"
+        )
+    return yamlio.load(decrypt_secrets(secrets_file))
+
+
+def _write_if_changed(path: Path, content: str, mode: int = 0o644) -> bool:
+    data = content.encode("utf-8")
+    if path.is_file() and path.read_bytes() == data:
+        os.chmod(path, mode)
+        return False
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return True
+
+
+def _ensure_directory(path: Path) -> None:
+    path.mkdir(parents=True, exist_ok=True)
+    os.chmod(path, 0o755)
+
+
+def render_target(
+    host: str,
+    *,
+    profile: str = "",
+    output_root: Path = GENERATED_ROOT,
+    secrets_required: bool = True,
+) -> RenderResult:
+    """Render ``user-data``/``meta-data`` for ``HOST``/``PROFILE``.
+
+    ``secrets_required=False`` renders targets lacking secrets with placeholder
+    values, which is what validating hardware profiles needs.
+    """
+
+    with trace.span("render.resolve"):
+        target = resolve_target(host, profile)
+    _ensure_directory(output_root)
+    with trace.span("render.variables"):
+        variables = build_variables(target, host=host, profile=profile)
+    output_dir = output_root / target.config_name
+    _ensure_directory(output_dir)
+    with trace.span("render.secrets"):
+        variables["secrets"] = load_secrets(target, required=secrets_required)
+    files: list[Path] = []
+    for output_name, template_name in OUTPUT_TEMPLATES:
+        content = render_template(template_name, variables)
+        destination = output_dir / output_name
+        with trace.span("render.write", file=output_name, bytes=len(content)) as info:
+            info["changed"] = _write_if_changed(destination, content)
+        files.append(destination)
+    return RenderResult(config_name=target.config_name, output_dir=output_dir, files=tuple(files))
@@ -0,0 +1,125 @@
+"""Content-addressed cache for rendered NoCloud artefacts.
+
+A digest of every render input (host variables, hardware profile,
+``group_vars/all``, secrets ciphertext, templates and the rendering engine
+itself) is stored next to ``user-data``/``meta-data``. When the digest of the
+current inputs matches, the render can be skipped.
+"""
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import inventory, model, yamlio
+
+AUTOINSTALL_DIR = inventory.REPO_ROOT / "baremetal" / "autoinstall"
+TEMPLATES_ROOT = AUTOINSTALL_DIR / "templates"
+GENERATED_ROOT = AUTOINSTALL_DIR / "generated"
+DIGEST_FILENAME = ".render-digest"
+DIGEST_VERSION = "1"
+OUTPUT_FILES = ("user-data", "meta-data")
+ENGINE_FILES = (
+    inventory.REPO_ROOT / "ansible" / "playbooks" / "common" / "generate_autoinstall.yml",
+    inventory.REPO_ROOT / "baremetal" / "ansible" / "playbooks" / "generate_autoinstall.yml",
+    inventory.REPO_ROOT / "scripts" / "lib" / "render.py",
+)
+
+
+@dataclass(frozen=True)
+class RenderInputs:
+    """Files feeding a render and the digest computed over them."""
+
+    config_name: str
+    files: tuple[Path, ...]
+    digest: str
+
+    @property
+    def output_dir(self) -> Path:
+        return GENERATED_ROOT / self.config_name
+
+
+def _referenced_profile(host_vars_file: Path) -> str | None:
+    try:
+        data = model.load_document(host_vars_file)
+    except (ValueError, yamlio.YAMLError):
+        return None
+    value = data.get("hardware_profile")
+    return str(value) if value else None
+
+
+def _tree_files(root: Path) -> list[Path]:
+    if not root.is_dir():
+        return []
+    return sorted(path for path in root.rglob("*") if path.is_file())
+
+
+def input_files(host: str, profile: str = "") -> tuple[str, list[Path]] | None:
+    """Return ``(config_name, files)`` read by a render, or ``None`` if unresolved."""
+
+    config_name = host
+    files: list[Path] = []
+    host_vars_file: Path | None = None
+    profile_file = inventory.find_hardware_profile(profile) if profile else None
+    if profile_file is not None:
+        config_name = profile
+        files.append(profile_file)
+    else:
+        host_vars_file = inventory.find_host_vars_file(profile or host)
+        config_name = host or profile
+        if host_vars_file is None:
+            return None
+        files.append(host_vars_file)
+        referenced = _referenced_profile(host_vars_file)
+        if referenced:
+            referenced_file = inventory.find_hardware_profile(referenced)
+            if referenced_file is None:
+                return None
+            files.append(referenced_file)
+        secrets_file = host_vars_file.parent / "secrets.sops.yaml"
+        if secrets_file.is_file():
+            files.append(secrets_file)
+    for root in inventory.iter_inventory_roots():
+        files.extend(_tree_files(root / "group_vars" / "all"))
+    files.extend(_tree_files(TEMPLATES_ROOT))
+    files.extend(path for path in ENGINE_FILES if path.is_file())
+    return config_name, files
+
+
+def collect_inputs(host: str, profile: str = "") -> RenderInputs | None:
+    """Resolve and hash the inputs of a render."""
+
+    resolved = input_files(host, profile)
+    if resolved is None:
+        return None
+    config_name, files = resolved
+    digest = hashlib.sha256()
+    digest.update(f"{DIGEST_VERSION}\0{host}\0{profile}\0{config_name}\0".encode("utf-8"))
+    for path in files:
+        digest.update(str(path).encode("utf-8") + b"\0")
+        digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return RenderInputs(config_name=config_name, files=tuple(files), digest=digest.hexdigest())
+
+
+def is_up_to_date(inputs: RenderInputs) -> bool:
+    """Return True when the recorded digest matches and every artefact exists."""
+
+    output_dir = inputs.output_dir
+    digest_file = output_dir / DIGEST_FILENAME
+    if not digest_file.is_file():
+        return False
+    if any(not (output_dir / name).is_file() for name in OUTPUT_FILES):
+        return False
+    return digest_file.read_text(encoding="utf-8").strip() == inputs.digest
+
+
+def record(inputs: RenderInputs) -> None:
+    """Store the digest next to freshly rendered artefacts."""
+
+    (inputs.output_dir / DIGEST_FILENAME).write_text(inputs.digest + "\n", encoding="utf-8")
+
+
+def invalidate(config_name: str) -> None:
+    """Forget the recorded digest so the next render always runs."""
+
+    (GENERATED_ROOT / config_name / DIGEST_FILENAME).unlink(missing_ok=True)
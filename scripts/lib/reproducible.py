@@ -0,0 +1,77 @@
+"""Reproducible ISO builds driven by ``SOURCE_DATE_EPOCH``.
+
+When the variable is set (see reproducible-builds.org), every time written
+into an artefact comes from it: staged files get fixed modes and mtimes,
+xorriso is given fixed volume dates, UUID, GPT disk GUID and "now", and
+ownership of the injected files is reset to root. Two builds of the same
+inputs then produce the same bytes.
+"""
+from __future__ import annotations
+
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Sequence
+
+ENV = "SOURCE_DATE_EPOCH"
+FILE_MODE = 0o644
+DIRECTORY_MODE = 0o755
+
+
+def source_date_epoch() -> int | None:
+    """Return ``SOURCE_DATE_EPOCH`` as an integer, or None when reproducible mode is off."""
+
+    value = os.environ.get(ENV, "").strip()
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValueError(f"{ENV} must be a number of seconds since 1970, got {value!r}")
+    return int(value)
+
+
+def timestamp(epoch: int | None) -> datetime | None:
+    return datetime.fromtimestamp(epoch, timezone.utc) if epoch is not None else None
+
+
+def build_time(epoch: int | None) -> str:
+    """UTC build time for manifests: the epoch when set, the current time otherwise."""
+
+    moment = timestamp(epoch) or datetime.now(timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def normalize_tree(root: Path, epoch: int) -> None:
+    """Give every file and directory under ``root`` a fixed mode and mtime.
+
+    Directories are stamped after their content, since writing a child
+    updates the parent's mtime.
+    """
+
+    for directory, dirnames, filenames in os.walk(root, topdown=False):
+        for name in sorted(filenames):
+            path = os.path.join(directory, name)
+            os.chmod(path, FILE_MODE)
+            os.utime(path, (epoch, epoch))
+        os.chmod(directory, DIRECTORY_MODE)
+        os.utime(directory, (epoch, epoch))
+
+
+def xorriso_arguments(epoch: int, paths: Sequence[str]) -> list[str]:
+    """xorriso commands pinning every time-derived field and the owner of ``paths``.
+
+    They go after ``-boot_image any replay`` so the GPT GUID setting is not
+    reset by the replayed boot parameters.
+    """
+
+    uuid = time.strftime("%Y%m%d%H%M%S00", time.gmtime(epoch))
+    return [
+        "-volume_date", "uuid", uuid,
+        "-volume_date", "c", f"={epoch}",
+        "-volume_date", "m", f"={epoch}",
+        "-volume_date", "all_file_dates", "set_to_mtime",
+        "-iso_nowtime", f"={epoch}",
+        "-chown_r", "0", *paths, "--",
+        "-chgrp_r", "0", *paths, "--",
+        "-boot_image", "any", "gpt_disk_guid=volume_date_uuid",
+    ]
@@ -0,0 +1,236 @@
+"""SOPS decryption helpers with a short-lived plaintext cache.
+
+Rendering the same host for seed, full and multi ISOs in one session used to
+spawn ``sops -d`` each time. Decrypted documents are now cached, keyed by the
+SHA256 of the ciphertext and a fingerprint of the age identity in use:
+
+* in memory for the lifetime of the current process;
+* optionally in a 0700 directory on tmpfs shared by the processes of a
+  session, see :func:`cache_session`. The directory is wiped when the session
+  ends; without a usable tmpfs, plaintext never leaves process memory.
+
+Entries expire after ``AUTOINSTALL_SECRETS_CACHE_TTL`` seconds (300 by
+default, ``0`` disables the cache); expired entries are deleted whenever the
+cache is read or written.
+
+Cache misses are decrypted in-process by :mod:`lib.sops_age` when the
+document only uses age recipients; the ``sops`` binary remains the fallback
+for everything else (and can be forced with ``AUTOINSTALL_SOPS_NATIVE=0``).
+"""
+from __future__ import annotations
+
+import atexit
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from . import sops_age, trace
+
+CACHE_DIR_ENV = "AUTOINSTALL_SECRETS_CACHE_DIR"
+CACHE_TTL_ENV = "AUTOINSTALL_SECRETS_CACHE_TTL"
+DEFAULT_TTL = 300.0
+DEFAULT_AGE_KEY_FILE = Path.home() / ".config" / "sops" / "age" / "keys.txt"
+TMPFS_CANDIDATES = (Path("/dev/shm"), Path(os.environ.get("XDG_RUNTIME_DIR", "/nonexistent")))
+
+_memory_cache: dict[str, tuple[float, str]] = {}
+
+
+class SopsError(RuntimeError):
+    """Raised when a SOPS document cannot be decrypted."""
+
+
+def cache_ttl() -> float:
+    """Return the configured cache TTL in seconds."""
+
+    raw = os.environ.get(CACHE_TTL_ENV)
+    if not raw:
+        return DEFAULT_TTL
+    try:
+        return max(0.0, float(raw))
+    except ValueError as exc:
+        raise SopsError(f"{CACHE_TTL_ENV} must be a number of seconds, got {raw!r}") from exc
+
+
+def age_key_fingerprint(env: dict[str, str] | None = None) -> str:
+    """Fingerprint the age identity sops would use, without exposing it."""
+
+    env = os.environ if env is None else env
+    digest = hashlib.sha256()
+    if env.get("SOPS_AGE_KEY"):
+        digest.update(b"inline\0" + env["SOPS_AGE_KEY"].encode("utf-8"))
+    else:
+        key_file = Path(env.get("SOPS_AGE_KEY_FILE") or DEFAULT_AGE_KEY_FILE).expanduser()
+        digest.update(b"file\0" + str(key_file).encode("utf-8") + b"\0")
+        if key_file.is_file():
+            digest.update(key_file.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def cache_key(ciphertext: bytes, fingerprint: str) -> str:
+    """Return the cache key of a ciphertext decrypted with ``fingerprint``."""
+
+    return hashlib.sha256(hashlib.sha256(ciphertext).digest() + fingerprint.encode("ascii")).hexdigest()
+
+
+def _cache_dir() -> Path | None:
+    raw = os.environ.get(CACHE_DIR_ENV)
+    if not raw:
+        return None
+    path = Path(raw)
+    if not path.is_dir() or path.stat().st_mode & 0o077:
+        return None
+    return path
+
+
+def _prune_memory(now: float) -> None:
+    for key in [key for key, (expires, _) in _memory_cache.items() if expires <= now]:
+        del _memory_cache[key]
+
+
+def _prune_shared(directory: Path, ttl: float) -> None:
+    """Unlink the entries of ``directory`` older than ``ttl`` seconds."""
+
+    limit = time.time() - ttl
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < limit:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def _read_shared(key: str, ttl: float) -> str | None:
+    directory = _cache_dir()
+    if directory is None:
+        return None
+    _prune_shared(directory, ttl)
+    try:
+        return (directory / key).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def _write_shared(key: str, plaintext: str, ttl: float) -> None:
+    directory = _cache_dir()
+    if directory is None:
+        return
+    _prune_shared(directory, ttl)
+    tmp_path = directory / f".{key}.{os.getpid()}"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as handle:
+        handle.write(plaintext)
+    os.replace(tmp_path, directory / key)
+
+
+def run_sops(path: Path) -> str:
+    """Decrypt ``path`` with the ``sops`` binary."""
+
+    try:
+        proc = subprocess.run(["sops", "-d", str(path)], capture_output=True, text=True)
+    except FileNotFoundError as exc:
+        raise SopsError("Missing required binary: sops") from exc
+    if proc.returncode != 0:
+        raise SopsError(f"sops -d {path} failed: {proc.stderr.strip()}")
+    return proc.stdout
+
+
+def decrypt_uncached(path: Path, ciphertext: bytes) -> str:
+    """Decrypt ``path`` natively when possible, with ``sops -d`` otherwise.
+
+    Any native failure, including a MAC mismatch, is handed over to the
+    binary so that its verdict and error message stay authoritative.
+    """
+
+    if sops_age.available():
+        try:
+            with trace.span("sops.native", path=str(path)):
+                return sops_age.decrypt_file(path, ciphertext)
+        except (sops_age.Unsupported, sops_age.SopsFormatError, UnicodeDecodeError):
+            pass
+    with trace.span("sops.binary", path=str(path)):
+        return run_sops(path)
+
+
+def decrypt_file(path: Path) -> str:
+    """Return the plaintext of ``path``, reusing a cached decryption when valid."""
+
+    with trace.span("sops.decrypt", path=str(path)) as info:
+        try:
+            ciphertext = path.read_bytes()
+        except OSError as exc:
+            raise SopsError(f"Cannot read {path}: {exc}") from exc
+        ttl = cache_ttl()
+        if ttl <= 0:
+            info["cache"] = "disabled"
+            return decrypt_uncached(path, ciphertext)
+        key = cache_key(ciphertext, age_key_fingerprint())
+        now = time.monotonic()
+        _prune_memory(now)
+        cached = _memory_cache.get(key)
+        if cached is not None and cached[0] > now:
+            info["cache"] = "memory"
+            return cached[1]
+        plaintext = _read_shared(key, ttl)
+        info["cache"] = "shared" if plaintext is not None else "miss"
+        if plaintext is None:
+            plaintext = decrypt_uncached(path, ciphertext)
+            _write_shared(key, plaintext, ttl)
+        _memory_cache[key] = (now + ttl, plaintext)
+        return plaintext
+
+
+def clear_cache() -> None:
+    """Drop every in-memory entry."""
+
+    _memory_cache.clear()
+
+
+def _tmpfs_base() -> Path | None:
+    for candidate in TMPFS_CANDIDATES:
+        if candidate.is_dir() and os.access(candidate, os.W_OK | os.X_OK):
+            return candidate
+    return None
+
+
+@contextmanager
+def cache_session() -> Iterator[Path | None]:
+    """Share decrypted secrets with child processes until the block exits.
+
+    Creates a 0700 directory on tmpfs (``/dev/shm`` or ``XDG_RUNTIME_DIR``),
+    exports it through ``AUTOINSTALL_SECRETS_CACHE_DIR`` and removes it on
+    exit, including on interpreter shutdown. Reuses an enclosing session when
+    one is active. Without a usable tmpfs nothing is shared and the block gets
+    None: decrypted secrets are never written to persistent storage.
+    """
+
+    if _cache_dir() is not None or cache_ttl() <= 0:
+        yield _cache_dir()
+        return
+    base = _tmpfs_base()
+    if base is None:
+        try:
+            yield None
+        finally:
+            clear_cache()
+        return
+    directory = Path(tempfile.mkdtemp(prefix="autoinstall-secrets-", dir=str(base)))
+
+    def wipe() -> None:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    atexit.register(wipe)
+    os.environ[CACHE_DIR_ENV] = str(directory)
+    try:
+        yield directory
+    finally:
+        os.environ.pop(CACHE_DIR_ENV, None)
+        wipe()
+        atexit.unregister(wipe)
+        clear_cache()
@@ -0,0 +1,418 @@
+"""In-process decryption of SOPS YAML documents protected by age recipients.
+
+Implements the subset of SOPS and age used by the inventory secrets: an age
+X25519 recipient wraps the SOPS data key, every leaf value is an
+``ENC[AES256_GCM,...]`` string and the document MAC is checked before any
+plaintext is returned. Anything outside that subset (encrypted comments, key
+groups, non-YAML documents, missing identities...) raises
+:class:`Unsupported` so that callers can fall back to the ``sops`` binary.
+
+Relies on ``cryptography``, which ``ansible-core`` already depends on.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import yaml
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+except ImportError:  # pragma: no cover - depends on the host
+    HAVE_CRYPTOGRAPHY = False
+else:
+    HAVE_CRYPTOGRAPHY = True
+
+NATIVE_ENV = "AUTOINSTALL_SOPS_NATIVE"
+DEFAULT_AGE_KEY_FILE = Path.home() / ".config" / "sops" / "age" / "keys.txt"
+DEFAULT_UNENCRYPTED_SUFFIX = "_unencrypted"
+YAML_SUFFIXES = (".yaml", ".yml")
+
+AGE_VERSION_LINE = b"age-encryption.org/v1"
+AGE_ARMOR_BEGIN = "-----BEGIN AGE ENCRYPTED FILE-----"
+AGE_ARMOR_END = "-----END AGE ENCRYPTED FILE-----"
+AGE_X25519_INFO = b"age-encryption.org/v1/X25519"
+AGE_CHUNK_SIZE = 64 * 1024
+AGE_TAG_SIZE = 16
+
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+AGE_SECRET_KEY_HRP = "age-secret-key-"
+
+ENC_VALUE = re.compile(r"^ENC\[AES256_GCM,data:(.*),iv:(.+),tag:(.+),type:(.+)\]\Z", re.DOTALL)
+
+
+class SopsFormatError(ValueError):
+    """Raised when a document is encrypted but cannot be decrypted or verified."""
+
+
+class Unsupported(Exception):
+    """Raised when the document needs a SOPS feature not implemented here."""
+
+
+def available() -> bool:
+    """Return True when native decryption is possible and not disabled."""
+
+    if os.environ.get(NATIVE_ENV, "1").strip().lower() in {"0", "no", "false", "off"}:
+        return False
+    return HAVE_CRYPTOGRAPHY
+
+
+class _Yaml12Loader(yaml.SafeLoader):
+    """SafeLoader resolving booleans and timestamps like the YAML 1.2 core schema used by sops."""
+
+
+_Yaml12Loader.yaml_implicit_resolvers = {
+    first: [(tag, regexp) for tag, regexp in resolvers if tag not in {
+        "tag:yaml.org,2002:bool", "tag:yaml.org,2002:timestamp"
+    }]
+    for first, resolvers in yaml.SafeLoader.yaml_implicit_resolvers.items()
+}
+_Yaml12Loader.add_implicit_resolver(
+    "tag:yaml.org,2002:bool",
+    re.compile(r"^(?:true|True|TRUE|false|False|FALSE)$"),
+    list("tTfF"),
+)
+
+
+# --- age ------------------------------------------------------------------
+
+
+def _bech32_polymod(values: Iterable[int]) -> int:
+    generator = (0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3)
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1FFFFFF) << 5 ^ value
+        for index in range(5):
+            checksum ^= generator[index] if (top >> index) & 1 else 0
+    return checksum
+
+
+def _bech32_decode(text: str) -> tuple[str, bytes]:
+    text = text.lower()
+    hrp, separator, data = text.rpartition("1")
+    if not separator or not hrp or len(data) < 6:
+        raise SopsFormatError("malformed bech32 string")
+    try:
+        values = [BECH32_CHARSET.index(char) for char in data]
+    except ValueError as exc:
+        raise SopsFormatError("invalid bech32 character") from exc
+    expanded = [ord(char) >> 5 for char in hrp] + [0] + [ord(char) & 31 for char in hrp]
+    if _bech32_polymod(expanded + values) != 1:
+        raise SopsFormatError("invalid bech32 checksum")
+    accumulator, bits, decoded = 0, 0, bytearray()
+    for value in values[:-6]:
+        accumulator = (accumulator << 5) | value
+        bits += 5
+        if bits >= 8:
+            bits -= 8
+            decoded.append((accumulator >> bits) & 0xFF)
+    if bits >= 5 or accumulator & ((1 << bits) - 1):
+        raise SopsFormatError("invalid bech32 padding")
+    return hrp, bytes(decoded)
+
+
+def parse_identities(text: str) -> list[X25519PrivateKey]:
+    """Parse ``AGE-SECRET-KEY-1...`` lines, ignoring comments and blank lines."""
+
+    identities = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        hrp, key = _bech32_decode(line)
+        if hrp != AGE_SECRET_KEY_HRP or len(key) != 32:
+            raise SopsFormatError("unsupported age identity (only X25519 keys are handled natively)")
+        identities.append(X25519PrivateKey.from_private_bytes(key))
+    return identities
+
+
+def load_identities(env: dict[str, str] | None = None) -> list[X25519PrivateKey]:
+    """Load the age identities sops would use from the environment."""
+
+    env = os.environ if env is None else env
+    identities = []
+    if env.get("SOPS_AGE_KEY"):
+        identities.extend(parse_identities(env["SOPS_AGE_KEY"]))
+    key_file = Path(env.get("SOPS_AGE_KEY_FILE") or DEFAULT_AGE_KEY_FILE).expanduser()
+    if key_file.is_file():
+        identities.extend(parse_identities(key_file.read_text(encoding="utf-8")))
+    return identities
+
+
+def _b64_raw(text: str | bytes) -> bytes:
+    if isinstance(text, bytes):
+        text = text.decode("ascii")
+    if "=" in text:
+        raise SopsFormatError("padded base64 in age header")
+    return base64.b64decode(text + "=" * (-len(text) % 4), validate=True)
+
+
+def _hkdf(key: bytes, salt: bytes, info: bytes) -> bytes:
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt or None, info=info).derive(key)
+
+
+def _dearmor(data: str) -> bytes:
+    stripped = data.strip()
+    if not stripped.startswith(AGE_ARMOR_BEGIN):
+        return data.encode("latin-1")
+    if not stripped.endswith(AGE_ARMOR_END):
+        raise SopsFormatError("truncated armored age file")
+    body = stripped[len(AGE_ARMOR_BEGIN) : -len(AGE_ARMOR_END)]
+    return base64.b64decode("".join(body.split()), validate=True)
+
+
+def _parse_header(data: bytes) -> tuple[list[tuple[list[str], bytes]], bytes, bytes, bytes]:
+    """Return ``(stanzas, header_for_mac, mac, payload)`` of a binary age file."""
+
+    lines = iter(data.split(b"\n"))
+    offset = 0
+
+    def next_line() -> bytes:
+        nonlocal offset
+        try:
+            line = next(lines)
+        except StopIteration as exc:
+            raise SopsFormatError("truncated age header") from exc
+        offset += len(line) + 1
+        return line
+
+    if next_line() != AGE_VERSION_LINE:
+        raise SopsFormatError("unsupported age version")
+    stanzas: list[tuple[list[str], bytes]] = []
+    line = next_line()
+    while line.startswith(b"-> "):
+        arguments = line[3:].decode("ascii").split(" ")
+        body = bytearray()
+        while True:
+            chunk = next_line()
+            body += _b64_raw(chunk)
+            if len(chunk) < 64:
+                break
+        stanzas.append((arguments, bytes(body)))
+        line = next_line()
+    if not line.startswith(b"--- "):
+        raise SopsFormatError("malformed age header")
+    header_end = offset - len(line) - 1 + 3
+    return stanzas, data[:header_end], _b64_raw(line[4:]), data[offset:]
+
+
+def _unwrap_x25519(arguments: list[str], body: bytes, identity: X25519PrivateKey) -> bytes | None:
+    if len(arguments) != 2 or arguments[0] != "X25519" or len(body) != 32:
+        return None
+    ephemeral = _b64_raw(arguments[1])
+    shared = identity.exchange(X25519PublicKey.from_public_bytes(ephemeral))
+    if shared == bytes(32):
+        return None
+    recipient = identity.public_key().public_bytes_raw()
+    wrap_key = _hkdf(shared, ephemeral + recipient, AGE_X25519_INFO)
+    try:
+        return ChaCha20Poly1305(wrap_key).decrypt(bytes(12), body, None)
+    except InvalidTag:
+        return None
+
+
+def _iter_payload(file_key: bytes, payload: bytes) -> Iterator[bytes]:
+    if len(payload) < 16:
+        raise SopsFormatError("truncated age payload")
+    payload_key = _hkdf(file_key, payload[:16], b"payload")
+    cipher = ChaCha20Poly1305(payload_key)
+    body = payload[16:]
+    step = AGE_CHUNK_SIZE + AGE_TAG_SIZE
+    chunks = [body[index : index + step] for index in range(0, len(body), step)] or [b""]
+    for counter, chunk in enumerate(chunks):
+        last = counter == len(chunks) - 1
+        nonce = counter.to_bytes(11, "big") + (b"\x01" if last else b"\x00")
+        try:
+            yield cipher.decrypt(nonce, chunk, None)
+        except InvalidTag as exc:
+            raise SopsFormatError("age payload authentication failed") from exc
+
+
+def age_decrypt(data: str, identities: Iterable[X25519PrivateKey]) -> bytes | None:
+    """Decrypt an (optionally armored) age file, or return None if no identity matches."""
+
+    stanzas, header, mac, payload = _parse_header(_dearmor(data))
+    for identity in identities:
+        for arguments, body in stanzas:
+            file_key = _unwrap_x25519(arguments, body, identity)
+            if file_key is None:
+                continue
+            expected = hmac.new(_hkdf(file_key, b"", b"header"), header, hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, mac):
+                raise SopsFormatError("age header MAC mismatch")
+            return b"".join(_iter_payload(file_key, payload))
+    return None
+
+
+# --- sops -----------------------------------------------------------------
+
+
+def _float_bytes(value: float) -> bytes:
+    if value.is_integer():
+        return str(int(value)).encode("ascii")
+    return format(Decimal(repr(value)), "f").encode("ascii")
+
+
+def _to_bytes(value: Any) -> bytes:
+    """Serialise a leaf the way sops feeds it to the MAC."""
+
+    if isinstance(value, bool):
+        return b"True" if value else b"False"
+    if isinstance(value, int):
+        return str(value).encode("ascii")
+    if isinstance(value, float):
+        return _float_bytes(value)
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    if value is None:
+        return b""
+    raise Unsupported(f"cannot hash leaf of type {type(value).__name__}")
+
+
+def _convert(plaintext: bytes, value_type: str) -> Any:
+    if value_type == "str":
+        return plaintext.decode("utf-8")
+    if value_type == "int":
+        return int(plaintext)
+    if value_type == "float":
+        return float(plaintext)
+    if value_type == "bool":
+        return plaintext.decode("ascii").lower() in {"1", "t", "true"}
+    if value_type == "bytes":
+        return plaintext
+    raise Unsupported(f"unsupported sops value type {value_type!r}")
+
+
+def decrypt_value(value: str, key: bytes, aad: str) -> Any:
+    """Decrypt one ``ENC[AES256_GCM,...]`` string."""
+
+    if value == "":
+        return ""
+    match = ENC_VALUE.match(value)
+    if match is None:
+        raise SopsFormatError("value is not encrypted with AES256_GCM")
+    data, iv, tag, value_type = (match.group(index) for index in range(1, 5))
+    if value_type == "comment":
+        raise Unsupported("encrypted comments are not handled natively")
+    try:
+        plaintext = AESGCM(key).decrypt(
+            base64.b64decode(iv),
+            base64.b64decode(data) + base64.b64decode(tag),
+            aad.encode("utf-8"),
+        )
+    except (InvalidTag, ValueError) as exc:
+        raise SopsFormatError(f"cannot decrypt value at {aad!r}") from exc
+    return _convert(plaintext, value_type)
+
+
+class _Rules:
+    def __init__(self, metadata: dict[str, Any]) -> None:
+        self.unencrypted_suffix = metadata.get("unencrypted_suffix")
+        self.encrypted_suffix = metadata.get("encrypted_suffix")
+        self.unencrypted_regex = metadata.get("unencrypted_regex")
+        self.encrypted_regex = metadata.get("encrypted_regex")
+        if not any((self.unencrypted_suffix, self.encrypted_suffix, self.unencrypted_regex, self.encrypted_regex)):
+            self.unencrypted_suffix = DEFAULT_UNENCRYPTED_SUFFIX
+        self.mac_only_encrypted = bool(metadata.get("mac_only_encrypted"))
+
+    def encrypted(self, path: list[str]) -> bool:
+        encrypted = True
+        if self.unencrypted_suffix and any(key.endswith(self.unencrypted_suffix) for key in path):
+            encrypted = False
+        if self.encrypted_suffix:
+            encrypted = any(key.endswith(self.encrypted_suffix) for key in path)
+        if self.unencrypted_regex and any(re.search(self.unencrypted_regex, key) for key in path):
+            encrypted = False
+        if self.encrypted_regex:
+            encrypted = any(re.search(self.encrypted_regex, key) for key in path)
+        return encrypted
+
+
+def _walk(node: Any, path: list[str], key: bytes, rules: _Rules, digest: Any) -> Any:
+    if isinstance(node, dict):
+        result = {}
+        for name, value in node.items():
+            if not isinstance(name, str):
+                raise Unsupported("non-string mapping keys are not handled natively")
+            result[name] = _walk(value, path + [name], key, rules, digest)
+        return result
+    if isinstance(node, list):
+        return [_walk(item, path, key, rules, digest) for item in node]
+    encrypted = rules.encrypted(path)
+    if encrypted:
+        if not isinstance(node, str):
+            raise SopsFormatError(f"unencrypted value at {':'.join(path)!r}")
+        node = decrypt_value(node, key, ":".join(path) + ":")
+    if encrypted or not rules.mac_only_encrypted:
+        digest.update(_to_bytes(node))
+    return node
+
+
+def _data_key(metadata: dict[str, Any], identities: list[X25519PrivateKey]) -> bytes:
+    if metadata.get("key_groups") or metadata.get("shamir_threshold"):
+        raise Unsupported("key groups are not handled natively")
+    recipients = metadata.get("age") or []
+    if not recipients:
+        raise Unsupported("no age recipient in the document")
+    if not identities:
+        raise Unsupported("no age identity available")
+    for recipient in recipients:
+        data_key = age_decrypt(str(recipient.get("enc", "")), identities)
+        if data_key is not None:
+            if len(data_key) != 32:
+                raise SopsFormatError("invalid sops data key length")
+            return data_key
+    raise Unsupported("none of the age identities matches a recipient")
+
+
+def decrypt_document(text: str, identities: list[X25519PrivateKey]) -> dict[str, Any]:
+    """Decrypt a SOPS YAML document and verify its MAC."""
+
+    if "type:comment]" in text:
+        raise Unsupported("encrypted comments are not handled natively")
+    try:
+        documents = list(yaml.load_all(text, Loader=_Yaml12Loader))
+    except yaml.YAMLError as exc:
+        raise Unsupported(f"YAML not understood natively: {exc}") from exc
+    if len(documents) != 1 or not isinstance(documents[0], dict):
+        raise Unsupported("only single-document YAML mappings are handled natively")
+    tree = documents[0]
+    metadata = tree.pop("sops", None)
+    if not isinstance(metadata, dict) or "mac" not in metadata:
+        raise SopsFormatError("missing sops metadata")
+    if metadata.get("unencrypted_comment_regex") or metadata.get("encrypted_comment_regex"):
+        raise Unsupported("comment rules are not handled natively")
+    key = _data_key(metadata, identities)
+    digest = hashlib.sha512()
+    plaintext = _walk(tree, [], key, _Rules(metadata), digest)
+    lastmodified = metadata.get("lastmodified")
+    if not isinstance(lastmodified, str):
+        lastmodified = str(lastmodified)
+    expected = decrypt_value(str(metadata["mac"]), key, lastmodified)
+    if not hmac.compare_digest(str(expected), digest.hexdigest().upper()):
+        raise SopsFormatError("MAC mismatch")
+    return plaintext
+
+
+def decrypt_file(path: Path, ciphertext: bytes | None = None) -> str:
+    """Return the decrypted YAML of ``path``, serialised with ``yaml.safe_dump``."""
+
+    if path.suffix not in YAML_SUFFIXES:
+        raise Unsupported("only YAML documents are handled natively")
+    if ciphertext is None:
+        ciphertext = path.read_bytes()
+    data = decrypt_document(ciphertext.decode("utf-8"), load_identities())
+    return yaml.safe_dump(data, sort_keys=False, allow_unicode=True, default_flow_style=False)
@@ -0,0 +1,157 @@
+"""Opt-in per-phase timing trace for the render pipeline.
+
+Tracing is enabled by ``AUTOINSTALL_TRACE=FILE`` (or ``iso_manager.py --trace
+FILE``). Every process of the session, including pool workers and the
+``decrypt_secrets.py`` helper spawned by Ansible, appends its spans to
+``FILE.events``; the process that opened the :func:`session` merges them into
+``FILE`` as a Chrome trace (``chrome://tracing``, Perfetto) with per-phase,
+per-host and per-template totals under ``summary``.
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+TRACE_ENV = "AUTOINSTALL_TRACE"
+OWNER_ENV = "AUTOINSTALL_TRACE_OWNER"
+EVENTS_SUFFIX = ".events"
+CATEGORY = "autoinstall"
+
+_inherited: contextvars.ContextVar[dict[str, Any]] = contextvars.ContextVar("trace_inherited", default={})
+
+
+def trace_file() -> Path | None:
+    """Return the trace destination, or None when tracing is off."""
+
+    raw = os.environ.get(TRACE_ENV)
+    return Path(raw) if raw else None
+
+
+def enabled() -> bool:
+    return trace_file() is not None
+
+
+def _events_file(output: Path) -> Path:
+    return output.with_name(output.name + EVENTS_SUFFIX)
+
+
+def _append(output: Path, event: dict[str, Any]) -> None:
+    line = (json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+    fd = os.open(_events_file(output), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[dict[str, Any]]:
+    """Time the enclosed block as phase ``name``.
+
+    ``host`` is inherited by nested spans. The yielded dict can be updated to
+    attach details known only at the end (cache hit, byte count...).
+    """
+
+    output = trace_file()
+    if output is None:
+        yield args
+        return
+    inherited = _inherited.get()
+    args = {**inherited, **args}
+    token = _inherited.set({**inherited, **({"host": args["host"]} if "host" in args else {})})
+    start = time.time_ns()
+    try:
+        yield args
+    except BaseException as exc:
+        args["error"] = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        _inherited.reset(token)
+        _append(
+            output,
+            {
+                "name": name,
+                "cat": CATEGORY,
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": (time.time_ns() - start) / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_native_id(),
+                "args": args,
+            },
+        )
+
+
+def _totals(events: list[dict[str, Any]], key: str | None) -> dict[str, dict[str, float]]:
+    totals: dict[str, dict[str, float]] = {}
+    for event in events:
+        label = event["name"] if key is None else event["args"].get(key)
+        if label is None:
+            continue
+        if key == "host" and event["name"] != "render.job":
+            continue
+        entry = totals.setdefault(str(label), {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        duration = event["dur"] / 1000
+        entry["count"] += 1
+        entry["total_ms"] = round(entry["total_ms"] + duration, 3)
+        entry["max_ms"] = round(max(entry["max_ms"], duration), 3)
+    return dict(sorted(totals.items(), key=lambda item: item[1]["total_ms"], reverse=True))
+
+
+def write_trace(output: Path) -> None:
+    """Merge the collected events into ``output``."""
+
+    events_file = _events_file(output)
+    events: list[dict[str, Any]] = []
+    if events_file.is_file():
+        for line in events_file.read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                events.append(json.loads(line))
+    events.sort(key=lambda event: event["ts"])
+    document = {
+        "traceEvents": events,
+        "displayTimeUnit": "ms",
+        "summary": {
+            "phases": _totals(events, None),
+            "hosts": _totals(events, "host"),
+            "templates": _totals(events, "template"),
+        },
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(document, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    events_file.unlink(missing_ok=True)
+
+
+@contextmanager
+def session(output: Path | None = None) -> Iterator[Path | None]:
+    """Collect a trace until the block exits, then write it.
+
+    ``output`` defaults to ``AUTOINSTALL_TRACE``. Nested sessions (child
+    processes of a traced command) only contribute events.
+    """
+
+    output = output or trace_file()
+    if output is None or os.environ.get(OWNER_ENV):
+        yield output
+        return
+    output = output.resolve()
+    saved = {name: os.environ.get(name) for name in (TRACE_ENV, OWNER_ENV)}
+    os.environ[TRACE_ENV] = str(output)
+    os.environ[OWNER_ENV] = str(os.getpid())
+    output.parent.mkdir(parents=True, exist_ok=True)
+    _events_file(output).unlink(missing_ok=True)
+    try:
+        yield output
+    finally:
+        write_trace(output)
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
@@ -0,0 +1,195 @@
+"""File change notification for the inventory and template trees.
+
+Uses Linux inotify through ``ctypes`` (no third-party dependency) and falls
+back to periodic mtime scans where inotify is unavailable. Both watchers
+report changed paths; ``None`` means "something changed, rescan everything"
+(inotify queue overflow). A root that does not exist yet (such as the local
+inventory overlay) is picked up when it is created: the inotify watcher keeps
+an eye on its nearest existing parent until then.
+"""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from typing import Iterable
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (
+    IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+DEFAULT_POLL_INTERVAL = 0.5
+
+
+def _iter_directories(root: Path) -> Iterable[Path]:
+    yield root
+    for current, dirnames, _ in os.walk(root):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        for name in dirnames:
+            yield Path(current) / name
+
+
+class InotifyWatcher:
+    """Recursive inotify watch over a set of directory trees."""
+
+    def __init__(self, roots: Iterable[Path]) -> None:
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories: dict[int, Path] = {}
+        # watches on the nearest existing parent of each missing root
+        self._parents: dict[int, Path] = {}
+        self._roots = list(roots)
+        self._missing = [root for root in self._roots if not root.is_dir()]
+        for root in self._roots:
+            if root.is_dir():
+                self._add_tree(root)
+        self._watch_missing()
+
+    def _add_tree(self, root: Path) -> None:
+        for directory in _iter_directories(root):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+            if wd >= 0:
+                self._directories[wd] = directory
+
+    def _watch_missing(self) -> set[Path]:
+        """Watch the missing roots that appeared; return the files they already hold."""
+
+        appeared: set[Path] = set()
+        for root in list(self._missing):
+            if root.is_dir():
+                self._missing.remove(root)
+                self._add_tree(root)
+                appeared.update(entry for entry in root.rglob("*") if entry.is_file())
+                continue
+            parent = root.parent
+            while not parent.is_dir() and parent != parent.parent:
+                parent = parent.parent
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(parent), WATCH_MASK)
+            if wd >= 0:
+                self._parents[wd] = parent
+        return appeared
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def poll(self, timeout: float | None) -> set[Path] | None:
+        """Wait up to ``timeout`` seconds and return the paths that changed."""
+
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed: set[Path] = set()
+        recheck = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd in self._parents:
+                recheck = True
+                if mask & IN_IGNORED:
+                    self._parents.pop(wd)
+            directory = self._directories.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                self._directories.pop(wd, None)
+                if directory in self._roots and not directory.is_dir():
+                    # removed root: wait for it to come back
+                    self._missing.append(directory)
+                    recheck = True
+                continue
+            path = directory / os.fsdecode(name) if name else directory
+            changed.add(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(path)
+                changed.update(entry for entry in path.rglob("*") if entry.is_file())
+        if recheck and self._missing:
+            changed |= self._watch_missing()
+        return changed
+
+
+class PollingWatcher:
+    """Portable fallback comparing file mtimes at a fixed interval."""
+
+    def __init__(self, roots: Iterable[Path], interval: float = DEFAULT_POLL_INTERVAL) -> None:
+        self._roots = list(roots)
+        self._interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict[Path, int]:
+        snapshot: dict[Path, int] = {}
+        for root in self._roots:
+            if not root.is_dir():
+                continue
+            for path in root.rglob("*"):
+                try:
+                    if path.is_file():
+                        snapshot[path] = path.stat().st_mtime_ns
+                except OSError:
+                    continue
+        return snapshot
+
+    def close(self) -> None:
+        return None
+
+    def poll(self, timeout: float | None) -> set[Path] | None:
+        time.sleep(self._interval if timeout is None else min(timeout, self._interval))
+        current = self._scan()
+        changed = {path for path in current.keys() | self._snapshot.keys() if current.get(path) != self._snapshot.get(path)}
+        self._snapshot = current
+        return changed
+
+
+def open_watcher(roots: Iterable[Path]) -> InotifyWatcher | PollingWatcher:
+    """Return an inotify watcher, or a polling one when inotify is unavailable."""
+
+    roots = list(roots)
+    try:
+        return InotifyWatcher(roots)
+    except (OSError, AttributeError):
+        return PollingWatcher(roots)
+
+
+def wait_for_changes(watcher: InotifyWatcher | PollingWatcher, debounce: float) -> set[Path] | None:
+    """Block until something changes, then until ``debounce`` seconds pass quietly."""
+
+    changed: set[Path] | None = set()
+    while not changed and changed is not None:
+        changed = watcher.poll(None)
+    while True:
+        more = watcher.poll(debounce)
+        if more is None:
+            changed = None
+        elif not more:
+            return changed
+        elif changed is not None:
+            changed |= more
@@ -0,0 +1,55 @@
+"""YAML loading and dumping shared by every script.
+
+Uses the LibYAML bindings (``CSafeLoader``/``CSafeDumper``) when PyYAML was
+built with them, which parses several times faster than the pure-Python
+classes; otherwise the pure-Python ones are used with the same results.
+
+``load_file`` keeps the parsed content of each file in memory, keyed by path,
+size and mtime, so a file read by several modules in one process is parsed
+once.
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import IO, Any
+
+import yaml
+
+SafeLoader: type = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SafeDumper: type = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+LIBYAML = SafeLoader is not yaml.SafeLoader
+YAMLError = yaml.YAMLError
+
+_files: dict[str, tuple[tuple[int, int], Any]] = {}
+
+
+def load(source: str | bytes | IO[Any]) -> Any:
+    """Parse a single YAML document like ``yaml.safe_load``."""
+
+    return yaml.load(source, Loader=SafeLoader)
+
+
+def dump(data: Any, stream: IO[str] | None = None, **kwargs: Any) -> str | None:
+    """Serialise ``data`` like ``yaml.safe_dump``."""
+
+    return yaml.dump(data, stream, Dumper=SafeDumper, **kwargs)
+
+
+def load_file(path: str | Path) -> Any:
+    """Return the parsed content of ``path``, parsing it again only when it changed.
+
+    The result is shared between callers and must not be modified; take a
+    ``copy.deepcopy`` before editing it. Raises OSError or YAMLError (which
+    also covers undecodable bytes).
+    """
+
+    key = os.fspath(path)
+    status = os.stat(key)
+    signature = (status.st_size, status.st_mtime_ns)
+    cached = _files.get(key)
+    if cached is None or cached[0] != signature:
+        with open(key, "rb") as handle:
+            content = load(handle)
+        cached = _files[key] = (signature, content)
+    return cached[1]
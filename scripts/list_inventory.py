@@ -1,16 +1,43 @@
 #!/usr/bin/env python3
-"""Summarise Git-tracked bare-metal inventory for technicians."""
+"""Summarise Git-tracked bare-metal inventory for technicians.
+
+``--format ndjson`` and ``--stream`` write each record as soon as it is read,
+so large inventories can be piped into other tools without waiting for the
+whole listing; ``--filter``, ``--limit`` and ``--offset`` are applied while
+iterating. ``query EXPRESSION`` selects hosts (or profiles with ``--kind
+profiles``) through the secondary indexes of the inventory index, see
+``lib/query.py`` for the expression language.
+"""
 
 from __future__ import annotations
 
 import argparse
 import json
+import os
 import sys
-from dataclasses import asdict, dataclass
-from pathlib import Path
-from typing import Iterable, Sequence
-
-from lib import inventory
+from dataclasses import asdict, dataclass, fields
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Sequence, TypeVar
+
+from lib import model, query
+
+HOST_COLUMNS = (("Répertoire", 24), ("Hostname", 24), ("Profil matériel", 24), ("Netmode", 8))
+EFFECTIVE_HOST_COLUMNS = (
+    ("Répertoire", 24),
+    ("Hostname", 24),
+    ("Profil matériel", 24),
+    ("Netmode", 8),
+    ("NIC", 10),
+    ("Disque principal", 16),
+)
+HARDWARE_COLUMNS = (
+    ("Profil", 24),
+    ("Modèle", 28),
+    ("Stockage", 14),
+    ("Netmode", 8),
+    ("NIC", 10),
+    ("Disque principal", 16),
+)
 
 
 @dataclass(frozen=True)
@@ -35,85 +62,109 @@ class HardwareSummary:
     disk_device: str | None
 
 
-def parse_simple_keys(path: Path, keys: Iterable[str]) -> dict[str, str]:
-    """Extract first-level scalar keys from a YAML file without external deps."""
+@dataclass(frozen=True)
+class EffectiveHostSummary:
+    """Host metadata completed with the values inherited from its hardware profile."""
 
-    values: dict[str, str] = {}
-    if not path.is_file():
-        return values
-    for raw_line in path.read_text(encoding="utf-8").splitlines():
-        stripped = raw_line.strip()
-        if not stripped or stripped.startswith("#") or stripped.startswith("---"):
-            continue
-        if ":" not in stripped:
-            continue
-        key, remainder = stripped.split(":", 1)
-        key = key.strip()
-        if key not in keys or key in values:
-            continue
-        value = remainder.split("#", 1)[0].strip()
-        if not value:
-            continue
-        if len(value) >= 2 and value[0] in {"'", '"'} and value[-1] == value[0]:
-            value = value[1:-1]
-        values[key] = value
-    return values
-
-
-def collect_host_summaries() -> list[HostSummary]:
-    """Return sorted host summaries discovered under host_vars/."""
-
-    summaries: dict[str, HostSummary] = {}
-    for root in inventory.iter_inventory_roots():
-        host_root = root / "host_vars"
-        if not host_root.exists():
-            continue
-        for entry in sorted(host_root.iterdir(), key=lambda candidate: candidate.name):
-            if not entry.is_dir() or entry.name.startswith("."):
-                continue
-            main_file = entry / "main.yml"
-            if not main_file.is_file():
-                continue
-            data = parse_simple_keys(main_file, ("hostname", "hardware_profile", "netmode"))
-            summaries.setdefault(
-                entry.name,
-                HostSummary(
-                    directory=entry.name,
-                    hostname=data.get("hostname"),
-                    hardware_profile=data.get("hardware_profile"),
-                    netmode=data.get("netmode"),
-                ),
-            )
-    return [summaries[name] for name in sorted(summaries)]
-
-
-def collect_hardware_summaries() -> list[HardwareSummary]:
-    """Return sorted hardware summaries discovered under profiles/hardware/."""
-
-    files: dict[str, Path] = {}
-    for root in inventory.hardware_profiles_roots():
-        if not root.exists():
-            continue
-        for candidate in root.iterdir():
-            if candidate.is_file() and candidate.suffix in {".yml", ".yaml"}:
-                files.setdefault(candidate.stem, candidate)
-    summaries: list[HardwareSummary] = []
-    for name in sorted(files):
-        data = parse_simple_keys(
-            files[name],
-            ("hardware_model", "storage_profile", "netmode", "nic", "disk_device"),
+    directory: str
+    hostname: str | None
+    hardware_profile: str | None
+    netmode: str | None
+    hardware_model: str | None
+    storage_profile: str | None
+    nic: str | None
+    disk_device: str | None
+
+
+Summary = TypeVar("Summary", HostSummary, HardwareSummary, EffectiveHostSummary)
+
+
+def iter_host_summaries() -> Iterator[HostSummary]:
+    """Yield host summaries discovered under host_vars/, sorted by directory."""
+
+    for host in model.hosts():
+        yield HostSummary(
+            directory=host.name,
+            hostname=host.hostname,
+            hardware_profile=host.hardware_profile,
+            netmode=host.netmode,
         )
-        summaries.append(
-            HardwareSummary(
-                name=name,
-                hardware_model=data.get("hardware_model"),
-                storage_profile=data.get("storage_profile"),
-                netmode=data.get("netmode"),
-                nic=data.get("nic"),
-                disk_device=data.get("disk_device"),
-            )
+
+
+def iter_hardware_summaries(profiles: Iterable[model.HardwareProfile] | None = None) -> Iterator[HardwareSummary]:
+    """Yield hardware summaries of ``profiles`` (default: every profile under profiles/hardware/)."""
+
+    for profile in model.profiles() if profiles is None else profiles:
+        yield HardwareSummary(
+            name=profile.name,
+            hardware_model=profile.hardware_model,
+            storage_profile=profile.storage_profile,
+            netmode=profile.netmode,
+            nic=profile.nic,
+            disk_device=profile.disk_device,
+        )
+
+
+def iter_effective_host_summaries(expression: query.Node) -> Iterator[EffectiveHostSummary]:
+    """Yield the hosts matching ``expression`` with their effective values, sorted by directory."""
+
+    profiles = {profile.name: profile for profile in model.profiles()}
+    for host in query.hosts(expression):
+        profile = profiles.get(host.hardware_profile or "")
+        inherited = {}
+        for key in query.INHERITED_FIELDS:
+            value = host.text(key)
+            if value is None and profile is not None:
+                value = profile.text(key)
+            inherited[key] = value
+        yield EffectiveHostSummary(
+            directory=host.name,
+            hostname=host.hostname,
+            hardware_profile=host.hardware_profile,
+            **inherited,
         )
-    return summaries
+
+
+def parse_filters(values: Sequence[str]) -> dict[str, str]:
+    """Turn ``key=value`` arguments into a mapping, rejecting unknown keys."""
+
+    known = {
+        field.name for summary in (HostSummary, HardwareSummary, EffectiveHostSummary) for field in fields(summary)
+    }
+    filters: dict[str, str] = {}
+    for value in values:
+        key, separator, expected = value.partition("=")
+        key = key.strip()
+        if not separator or not key:
+            raise ValueError(f"Filtre invalide {value!r} : format attendu clé=valeur.")
+        if key not in known:
+            raise ValueError(f"Clé de filtre inconnue {key!r} (clés : {', '.join(sorted(known))}).")
+        filters[key] = expected.strip()
+    return filters
+
+
+def select(
+    summaries: Iterable[Summary],
+    filters: dict[str, str],
+    offset: int = 0,
+    limit: int | None = None,
+) -> Iterator[Summary]:
+    """Keep the summaries matching every filter, then apply offset and limit.
+
+    A filter on a field the summary does not have never matches, and an empty
+    value matches an unset field.
+    """
+
+    def matches(summary: Summary) -> bool:
+        for key, expected in filters.items():
+            if not hasattr(summary, key):
+                return False
+            if (getattr(summary, key) or "") != expected:
+                return False
+        return True
+
+    selected = filter(matches, summaries) if filters else iter(summaries)
+    return islice(selected, offset, None if limit is None else offset + limit)
 
 
 def render_table(headers: Sequence[str], rows: Sequence[Sequence[str]]) -> str:
@@ -134,58 +185,136 @@ def display(value: str | None) -> str:
     return value if value else "-"
 
 
-def print_hardware_section(profiles: Sequence[HardwareSummary]) -> None:
-    """Print the hardware profile section."""
+def fit(value: str, width: int) -> str:
+    """Pad or truncate ``value`` to exactly ``width`` characters."""
+
+    if len(value) > width:
+        return value[: width - 1] + "…"
+    return value.ljust(width)
+
+
+def stream_table(columns: Sequence[tuple[str, int]], rows: Iterable[Sequence[str]]) -> int:
+    """Print a fixed-width table row by row and return the number of rows."""
+
+    print(" | ".join(fit(header, width) for header, width in columns))
+    print("-+-".join("-" * width for _, width in columns))
+    count = 0
+    for row in rows:
+        print(" | ".join(fit(cell, width) for cell, (_, width) in zip(row, columns)))
+        count += 1
+    return count
+
+
+def hardware_row(profile: HardwareSummary) -> tuple[str, ...]:
+    return (
+        profile.name,
+        display(profile.hardware_model),
+        display(profile.storage_profile),
+        display(profile.netmode),
+        display(profile.nic),
+        display(profile.disk_device),
+    )
 
-    print("Profils matériels disponibles")
-    print("-----------------------------")
-    if not profiles:
-        print("Aucun profil matériel détecté dans baremetal/inventory/profiles/hardware/.")
+
+def host_row(host: HostSummary) -> tuple[str, ...]:
+    return (
+        host.directory,
+        display(host.hostname),
+        display(host.hardware_profile),
+        display(host.netmode),
+    )
+
+
+def effective_host_row(host: EffectiveHostSummary) -> tuple[str, ...]:
+    return (
+        host.directory,
+        display(host.hostname),
+        display(host.hardware_profile),
+        display(host.netmode),
+        display(host.nic),
+        display(host.disk_device),
+    )
+
+
+def print_section(
+    title: str,
+    empty_message: str,
+    columns: Sequence[tuple[str, int]],
+    rows: Iterable[Sequence[str]],
+    stream: bool,
+) -> None:
+    """Print one titled table, buffered (widths fitted to the content) or streamed."""
+
+    print(title)
+    print("-" * len(title))
+    if stream:
+        if not stream_table(columns, rows):
+            print(empty_message)
         return
-    rows = [
-        (
-            profile.name,
-            display(profile.hardware_model),
-            display(profile.storage_profile),
-            display(profile.netmode),
-            display(profile.nic),
-            display(profile.disk_device),
-        )
-        for profile in profiles
-    ]
-    print(
-        render_table(
-            ("Profil", "Modèle", "Stockage", "Netmode", "NIC", "Disque principal"),
-            rows,
-        )
+    rows = list(rows)
+    if not rows:
+        print(empty_message)
+        return
+    print(render_table([header for header, _ in columns], rows))
+
+
+def print_hardware_section(profiles: Iterable[HardwareSummary], stream: bool = False) -> None:
+    """Print the hardware profile section."""
+
+    print_section(
+        "Profils matériels disponibles",
+        "Aucun profil matériel détecté dans baremetal/inventory/profiles/hardware/.",
+        HARDWARE_COLUMNS,
+        map(hardware_row, profiles),
+        stream,
     )
 
 
-def print_hosts_section(hosts: Sequence[HostSummary]) -> None:
+def print_hosts_section(hosts: Iterable[HostSummary], stream: bool = False) -> None:
     """Print the host section."""
 
-    print("Hôtes déclarés")
-    print("--------------")
-    if not hosts:
-        print("Aucun hôte déclaré. Utilisez `make baremetal/host-init` puis recommencez.")
-        return
-    rows = [
-        (
-            host.directory,
-            display(host.hostname),
-            display(host.hardware_profile),
-            display(host.netmode),
-        )
-        for host in hosts
-    ]
-    print(
-        render_table(
-            ("Répertoire", "Hostname", "Profil matériel", "Netmode"),
-            rows,
-        )
+    print_section(
+        "Hôtes déclarés",
+        "Aucun hôte déclaré. Utilisez `make baremetal/host-init` puis recommencez.",
+        HOST_COLUMNS,
+        map(host_row, hosts),
+        stream,
+    )
+
+
+def print_matching_hosts_section(hosts: Iterable[EffectiveHostSummary], stream: bool = False) -> None:
+    """Print the hosts selected by a query, with their inherited values."""
+
+    print_section(
+        "Hôtes correspondant à la requête",
+        "Aucun hôte ne correspond à la requête.",
+        EFFECTIVE_HOST_COLUMNS,
+        map(effective_host_row, hosts),
+        stream,
+    )
+
+
+def print_matching_profiles_section(profiles: Iterable[HardwareSummary], stream: bool = False) -> None:
+    """Print the hardware profiles selected by a query."""
+
+    print_section(
+        "Profils matériels correspondant à la requête",
+        "Aucun profil matériel ne correspond à la requête.",
+        HARDWARE_COLUMNS,
+        map(hardware_row, profiles),
+        stream,
     )
 
 
+def write_ndjson(kind: str, summaries: Iterable[HostSummary | HardwareSummary | EffectiveHostSummary]) -> None:
+    """Write one JSON object per line, tagged with its ``kind``."""
+
+    write = sys.stdout.write
+    for summary in summaries:
+        write(json.dumps({"kind": kind, **asdict(summary)}, ensure_ascii=False))
+        write("\n")
+
+
 def parse_args() -> argparse.Namespace:
     """Parse CLI arguments."""
 
@@ -194,51 +323,132 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument(
         "--format",
-        choices=("table", "json"),
+        choices=("table", "json", "ndjson"),
         default="table",
-        help="Format de sortie (table par défaut).",
+        help="Format de sortie (table par défaut ; ndjson : un objet JSON par ligne, écrit au fil de l'eau).",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Tableau à largeur fixe affiché ligne par ligne (valeurs longues tronquées).",
+    )
+    parser.add_argument(
+        "--filter",
+        dest="filters",
+        action="append",
+        default=[],
+        metavar="CLÉ=VALEUR",
+        help="Ne garder que les entrées dont le champ vaut VALEUR (option répétable ; VALEUR vide : champ absent).",
+    )
+    parser.add_argument(
+        "--offset",
+        type=int,
+        default=0,
+        help="Nombre d'entrées à sauter dans chaque section (0 par défaut).",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Nombre maximal d'entrées par section (toutes par défaut).",
+    )
+    parser.add_argument(
+        "--kind",
+        choices=("hosts", "profiles"),
+        default="hosts",
+        help="Entrées interrogées par le mode query (hosts par défaut).",
     )
     parser.add_argument(
         "mode",
-        choices=("summary", "hosts", "profiles"),
+        choices=("summary", "hosts", "profiles", "query"),
         nargs="?",
         default="summary",
         help="Vue à afficher (summary par défaut).",
     )
-    return parser.parse_args()
-
-
-def main() -> None:
-    """Entrypoint."""
-
-    args = parse_args()
+    parser.add_argument(
+        "expression",
+        nargs="?",
+        help=(
+            "Requête du mode query, par ex. 'hardware_profile = lenovo-m710q and netmode = dhcp'"
+            " (opérateurs = != in ~ !~, and/or/not, parenthèses)."
+        ),
+    )
+    args = parser.parse_args()
+    if args.mode == "query":
+        if not args.expression:
+            parser.error("le mode query attend une expression")
+        try:
+            args.query = query.parse(args.expression)
+        except query.QueryError as exc:
+            parser.error(f"requête invalide : {exc}")
+    elif args.expression is not None:
+        parser.error("une expression n'est acceptée qu'avec le mode query")
+    if args.offset < 0:
+        parser.error("--offset doit être positif ou nul")
+    if args.limit is not None and args.limit < 0:
+        parser.error("--limit doit être positif ou nul")
+    try:
+        args.filters = parse_filters(args.filters)
+    except ValueError as exc:
+        parser.error(str(exc))
+    return args
+
+
+def run(args: argparse.Namespace) -> None:
+    """Write the requested view to stdout."""
+
+    def selected(source: Callable[[], Iterator[Summary]]) -> Iterator[Summary]:
+        return select(source(), args.filters, args.offset, args.limit)
+
+    # (ndjson kind, json key, table printer, summaries)
+    sections: list[tuple[str, str, Callable[..., None], Callable[[], Iterator[Summary]]]] = []
+    if args.mode == "query" and args.kind == "profiles":
+        sections.append(
+            (
+                "hardware_profile",
+                "hardware_profiles",
+                print_matching_profiles_section,
+                lambda: iter_hardware_summaries(query.profiles(args.query)),
+            )
+        )
+    elif args.mode == "query":
+        sections.append(
+            ("host", "hosts", print_matching_hosts_section, lambda: iter_effective_host_summaries(args.query))
+        )
     if args.mode in {"summary", "profiles"}:
-        profiles = collect_hardware_summaries()
-    else:
-        profiles = []
+        sections.append(("hardware_profile", "hardware_profiles", print_hardware_section, iter_hardware_summaries))
     if args.mode in {"summary", "hosts"}:
-        hosts = collect_host_summaries()
-    else:
-        hosts = []
+        sections.append(("host", "hosts", print_hosts_section, iter_host_summaries))
+
+    if args.format == "ndjson":
+        for kind, _, _, source in sections:
+            write_ndjson(kind, selected(source))
+        return
 
     if args.format == "json":
-        payload: dict[str, list[dict[str, str | None]]] = {}
-        if args.mode in {"summary", "profiles"}:
-            payload["hardware_profiles"] = [asdict(profile) for profile in profiles]
-        if args.mode in {"summary", "hosts"}:
-            payload["hosts"] = [asdict(host) for host in hosts]
+        payload = {key: [asdict(summary) for summary in selected(source)] for _, key, _, source in sections}
         json.dump(payload, sys.stdout, ensure_ascii=False, indent=2)
         print()
         return
 
-    if args.mode == "summary":
-        print_hardware_section(profiles)
-        print()
-        print_hosts_section(hosts)
-    elif args.mode == "hosts":
-        print_hosts_section(hosts)
-    else:
-        print_hardware_section(profiles)
+    for position, (_, _, printer, source) in enumerate(sections):
+        if position:
+            print()
+        printer(selected(source), args.stream)
+
+
+def main() -> None:
+    """Entrypoint."""
+
+    args = parse_args()
+    try:
+        run(args)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # the reader (head, grep -m...) went away: stop quietly
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(0)
 
 
 if __name__ == "__main__":
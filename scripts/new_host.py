@@ -2,24 +2,23 @@
 from __future__ import annotations
 
 import argparse
+import copy
 import os
 import sys
 from pathlib import Path
 
-import yaml
-
-from lib import inventory
+from lib import inventory, model, yamlio
 
 ROOT = Path(__file__).resolve().parents[1]
 
 def load_yaml(path: Path) -> dict:
     if not path.exists():
         return {}
-    return yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+    return copy.deepcopy(model.load_document(path))
 
 def dump_yaml(path: Path, data: dict) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(yaml.safe_dump(data, sort_keys=False), encoding="utf-8")
+    path.write_text(yamlio.dump(data, sort_keys=False), encoding="utf-8")
 
 def main():
     ap = argparse.ArgumentParser(description="Create baremetal host skeleton")